@@ -3,12 +3,14 @@ Plot portfolio performance vs. S&P 500 with a configurable starting equity.
 
 - Normalizes BOTH series (portfolio and S&P) to the same starting equity.
 - Aligns S&P data to the portfolio dates with forward-fill.
+- Optionally (--rolling) plots rolling 20/60/120-day volatility, Sharpe, beta and drawdown.
 - Backwards-compatible function names for existing imports.
 """
 
 from __future__ import annotations
 
 import argparse
+import sys
 from pathlib import Path
 from typing import Optional, cast
 
@@ -16,6 +18,11 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import yfinance as yf
 
+# Storage backends live in the repo root next to trading_script.py
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from rolling_metrics import DEFAULT_WINDOWS, rolling_metrics  # noqa: E402
+from storage import open_storage  # noqa: E402
+
 DATA_DIR = Path(__file__).resolve().parent
 PORTFOLIO_CSV = DATA_DIR / "chatgpt_portfolio_update.csv"
 
@@ -72,11 +79,11 @@ def load_portfolio_details(
     portfolio_csv: Path = PORTFOLIO_CSV,
 ) -> pd.DataFrame:
     """Return TOTAL rows (Date, Total Equity) filtered to [start_date, end_date]."""
-    if not portfolio_csv.exists():
+    storage = open_storage(None, portfolio_csv)  # PORTFOLIO_STORAGE or auto-detect
+    if not storage.history_exists():
         raise SystemExit(f"Portfolio file '{portfolio_csv}' not found.")
 
-    df = pd.read_csv(portfolio_csv)
-    totals = df[df["Ticker"] == "TOTAL"].copy()
+    totals = storage.read_history(columns=["Date", "Ticker", "Total Equity"], tickers=["TOTAL"])
     if totals.empty:
         raise SystemExit("Portfolio CSV contains no TOTAL rows.")
 
@@ -178,12 +185,39 @@ def plot_comparison(
     plt.tight_layout()
 
 
+def plot_rolling(portfolio: pd.DataFrame, spx: pd.DataFrame, windows=DEFAULT_WINDOWS) -> None:
+    """
+    Rolling volatility, Sharpe, beta vs. the S&P 500 and drawdown from the window high.
+    Expects the same frames as plot_comparison.
+    """
+    equity = pd.Series(portfolio["Total Equity"].to_numpy(dtype=float), index=pd.DatetimeIndex(portfolio["Date"]))
+    market = None
+    if not spx.empty:
+        market = pd.Series(spx["SPX Value"].to_numpy(dtype=float), index=pd.DatetimeIndex(spx["Date"])).pct_change()
+    frame = rolling_metrics(equity, market, windows)
+
+    panels = [("volatility", "Volatility (annualized)"), ("sharpe", "Sharpe Ratio (annualized)"),
+              ("beta", "Beta vs. S&P 500"), ("drawdown", "Drawdown from Window High")]
+    fig, axes = plt.subplots(len(panels), 1, figsize=(10, 10), sharex=True)
+    for ax, (metric, title) in zip(axes, panels):
+        for w in windows:
+            column = f"{metric}_{w}d"
+            if column in frame:
+                ax.plot(frame.index, frame[column], label=f"{w}d")
+        ax.set_title(title)
+        ax.grid(True)
+    axes[0].legend()
+    fig.autofmt_xdate()
+    plt.tight_layout()
+
+
 def main(
     start_date: Optional[pd.Timestamp],
     end_date: Optional[pd.Timestamp],
     starting_equity: float,
     output: Optional[Path],
     portfolio_csv: Path = PORTFOLIO_CSV,
+    rolling: bool = False,
 ) -> None:
     # Load portfolio totals in the date range
     totals = load_portfolio_details(start_date, end_date, portfolio_csv=portfolio_csv)
@@ -202,9 +236,16 @@ def main(
     if output:
         output = output if output.is_absolute() else DATA_DIR / output
         plt.savefig(output, bbox_inches="tight")
-    else:
+    elif not rolling:
         plt.show()
-    plt.close()
+
+    if rolling:
+        plot_rolling(totals, spx)
+        if output:
+            plt.savefig(output.with_name(f"{output.stem}_rolling{output.suffix}"), bbox_inches="tight")
+        else:
+            plt.show()
+    plt.close("all")
 
 
 if __name__ == "__main__":
@@ -214,6 +255,7 @@ if __name__ == "__main__":
     parser.add_argument("--start-equity", type=float, default=100.0, help="Baseline to index both series (default 100)")
     parser.add_argument("--baseline-file", type=str, help="Path to a text file containing a single number for baseline")
     parser.add_argument("--output", type=str, help="Optional path to save the chart (.png/.jpg/.pdf)")
+    parser.add_argument("--rolling", action="store_true", help="Also plot rolling 20/60/120-day risk metrics")
 
     args = parser.parse_args()
     start = parse_date(args.start_date, "start date") if args.start_date else None
@@ -230,4 +272,4 @@ if __name__ == "__main__":
             raise SystemExit(f"Could not parse baseline from {p}") from exc
 
     out_path = Path(args.output) if args.output else None
-    main(start, end, baseline, out_path)
\ No newline at end of file
+    main(start, end, baseline, out_path, rolling=args.rolling)
\ No newline at end of file
@@ -8,6 +8,8 @@ import sys
 from pathlib import Path
 import json
 import logging
+import atexit
+import asyncio
 
 # Add the parent directory to path to import the trading script
 sys.path.append(str(Path(__file__).resolve().parents[1]))
@@ -15,15 +17,25 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 # Import functions from the main trading script
 from trading_script import (
     download_price_data, 
+    fetch_prices,
     process_portfolio, 
     daily_results, 
     load_latest_portfolio_state,
+    commit_portfolio_day,
     set_data_dir,
     PORTFOLIO_CSV,
     TRADE_LOG_CSV,
     last_trading_date,
-    check_weekend
+    check_weekend,
+    close_http_sessions,
+    get_storage,
+    get_ledger,
+    record_ledger_events,
+    LedgerMismatchError
 )
+from ledger import LedgerEvent
+from portfolio import Portfolio
+from rolling_metrics import rolling_metrics, latest_summary
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -68,6 +80,9 @@ class PortfolioSnapshot(db.Model):
 DATA_DIR = Path(__file__).resolve().parent
 set_data_dir(DATA_DIR)
 
+# Release the shared Yahoo/Stooq connection pools when the server process exits
+atexit.register(close_http_sessions)
+
 def get_current_price(ticker):
     """Get current price for a ticker using the trading script's data fetching"""
     try:
@@ -89,11 +104,32 @@ def get_current_price(ticker):
         logger.error(f"Error fetching price for {ticker}: {e}")
         return None
 
-def load_portfolio_from_csv():
+def get_current_prices(tickers):
+    """Get current prices for many tickers at once, fetched concurrently"""
+    tickers = [str(t).upper() for t in tickers]
+    if not tickers:
+        return {}
+    today = last_trading_date()
+    start_date = today - timedelta(days=1)
+    end_date = today + timedelta(days=1)
+
+    async def collect():
+        prices = {}
+        async for ticker, fetch_result in fetch_prices(tickers, start=start_date, end=end_date, progress=False):
+            prices[ticker] = float(fetch_result.df['Close'].iloc[-1]) if not fetch_result.df.empty else None
+        return prices
+
+    try:
+        return asyncio.run(collect())
+    except Exception as e:
+        logger.error(f"Error fetching prices for {tickers}: {e}")
+        return {}
+
+def load_portfolio_from_csv(rebase_ledger=False):
     """Load portfolio from CSV file"""
     try:
-        if PORTFOLIO_CSV.exists():
-            portfolio, cash = load_latest_portfolio_state(str(PORTFOLIO_CSV))
+        if get_storage(PORTFOLIO_CSV, TRADE_LOG_CSV).history_exists():
+            portfolio, cash = load_latest_portfolio_state(str(PORTFOLIO_CSV), rebase_ledger)
             # Convert list to DataFrame if necessary
             if isinstance(portfolio, list):
                 if portfolio:
@@ -105,6 +141,8 @@ def load_portfolio_from_csv():
             return portfolio, cash
         else:
             return pd.DataFrame(columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"]), 10000.0  # Default starting cash
+    except LedgerMismatchError:
+        raise  # never fall back to the default portfolio; see ledger_mismatch()
     except Exception as e:
         logger.error(f"Error loading portfolio: {e}")
         return pd.DataFrame(columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"]), 10000.0
@@ -132,6 +170,7 @@ def save_portfolio_to_csv(portfolio_df, cash):
             results.append(total_row)
         else:
             # Process portfolio positions
+            prices = get_current_prices(portfolio_df["ticker"])
             for _, stock in portfolio_df.iterrows():
                 ticker = str(stock["ticker"]).upper()
                 shares = float(stock["shares"]) if not pd.isna(stock["shares"]) else 0
@@ -139,7 +178,7 @@ def save_portfolio_to_csv(portfolio_df, cash):
                 cost_basis = float(stock["cost_basis"]) if not pd.isna(stock["cost_basis"]) else cost * shares
                 stop = float(stock["stop_loss"]) if not pd.isna(stock["stop_loss"]) else 0.0
                 
-                current_price = get_current_price(ticker)
+                current_price = prices.get(ticker)
                 if current_price:
                     price = round(current_price, 2)
                     value = round(price * shares, 2)
@@ -173,13 +212,8 @@ def save_portfolio_to_csv(portfolio_df, cash):
         
         df_out = pd.DataFrame(results)
         
-        # Append to existing CSV or create new
-        if PORTFOLIO_CSV.exists():
-            existing = pd.read_csv(PORTFOLIO_CSV)
-            existing = existing[existing["Date"] != str(today)]
-            df_out = pd.concat([existing, df_out], ignore_index=True)
-        
-        df_out.to_csv(PORTFOLIO_CSV, index=False)
+        # Replace today's rows in place (creates the history if needed) and refresh the checkpoint
+        commit_portfolio_day(today, df_out, get_storage(PORTFOLIO_CSV, TRADE_LOG_CSV))
         return True
     except Exception as e:
         logger.error(f"Error saving portfolio: {e}")
@@ -187,7 +221,20 @@ def save_portfolio_to_csv(portfolio_df, cash):
 
 def is_first_time_setup():
     """Check if this is the first time setup (no portfolio file exists)"""
-    return not PORTFOLIO_CSV.exists()
+    return not get_storage(PORTFOLIO_CSV, TRADE_LOG_CSV).history_exists()
+
+@app.errorhandler(LedgerMismatchError)
+def ledger_mismatch(error):
+    """Ask whether to re-base the ledger on the portfolio CSV"""
+    logger.error(f"Ledger mismatch: {error}")
+    return render_template('ledger_mismatch.html', message=str(error)), 409
+
+@app.route('/rebase_ledger', methods=['POST'])
+def rebase_ledger():
+    """Record the portfolio CSV's holdings in the ledger"""
+    load_portfolio_from_csv(rebase_ledger=True)
+    flash('Ledger re-based on the portfolio CSV', 'success')
+    return redirect(url_for('dashboard'))
 
 @app.route('/')
 def index():
@@ -218,7 +265,8 @@ def setup():
             }
             
             df_out = pd.DataFrame([initial_row])
-            df_out.to_csv(PORTFOLIO_CSV, index=False)
+            get_storage(PORTFOLIO_CSV, TRADE_LOG_CSV).write_history(df_out)
+            get_ledger(PORTFOLIO_CSV).append(LedgerEvent("OPEN", today, cash=initial_cash))
             
             flash(f'Portfolio initialized with ${initial_cash:,.2f}', 'success')
             return redirect(url_for('dashboard'))
@@ -248,13 +296,8 @@ def reset_portfolio():
             }
             
             # Append reset row to existing portfolio history
-            if PORTFOLIO_CSV.exists():
-                existing = pd.read_csv(PORTFOLIO_CSV)
-                df_out = pd.concat([existing, pd.DataFrame([reset_row])], ignore_index=True)
-            else:
-                df_out = pd.DataFrame([reset_row])
-            
-            df_out.to_csv(PORTFOLIO_CSV, index=False)
+            get_storage(PORTFOLIO_CSV, TRADE_LOG_CSV).append_history(pd.DataFrame([reset_row]))
+            record_ledger_events(LedgerEvent("RESET", today), portfolio_df, cash, PORTFOLIO_CSV)
             
             flash('Portfolio reset successfully. All positions cleared, logs preserved.', 'success')
             return redirect(url_for('dashboard'))
@@ -286,6 +329,7 @@ def dashboard():
     
     # Only process if portfolio_df is not empty
     if not portfolio_df.empty:
+        prices = get_current_prices(portfolio_df["ticker"])
         for _, stock in portfolio_df.iterrows():
             ticker = str(stock["ticker"]).upper()
             shares = float(stock["shares"]) if not pd.isna(stock["shares"]) else 0
@@ -293,7 +337,7 @@ def dashboard():
             cost_basis = float(stock["cost_basis"]) if not pd.isna(stock["cost_basis"]) else cost * shares
             stop = float(stock["stop_loss"]) if not pd.isna(stock["stop_loss"]) else 0.0
             
-            current_price = get_current_price(ticker)
+            current_price = prices.get(ticker)
             if current_price:
                 current_value = current_price * shares
                 current_pnl = (current_price - cost) * shares
@@ -333,6 +377,9 @@ def trade():
         stop_loss = float(request.form.get('stop_loss', 0))
         
         portfolio_df, cash = load_portfolio_from_csv()
+        book = Portfolio.from_frame(portfolio_df)
+        pre_trade = (book.copy(), cash)
+        today = check_weekend()
         
         if action == 'BUY':
             # Check if we have enough cash
@@ -341,73 +388,37 @@ def trade():
                 flash(f'Insufficient cash. Need ${cost:.2f}, have ${cash:.2f}', 'error')
                 return redirect(url_for('trade'))
             
-            # Add to portfolio
-            if isinstance(portfolio_df, list) or portfolio_df.empty:
-                portfolio_df = pd.DataFrame(columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"])
-            
-            existing_rows = portfolio_df[portfolio_df["ticker"].astype(str).str.upper() == ticker.upper()]
-            
-            if existing_rows.empty:
-                new_position = {
-                    "ticker": ticker,
-                    "shares": shares,
-                    "stop_loss": stop_loss,
-                    "buy_price": price,
-                    "cost_basis": cost
-                }
-                portfolio_df = pd.concat([portfolio_df, pd.DataFrame([new_position])], ignore_index=True)
-            else:
-                # Update existing position
-                idx = existing_rows.index[0]
-                cur_shares = float(portfolio_df.at[idx, "shares"])
-                cur_cost = float(portfolio_df.at[idx, "cost_basis"])
-                new_shares = cur_shares + shares
-                new_cost = cur_cost + cost
-                avg_price = new_cost / new_shares
-                
-                portfolio_df.at[idx, "shares"] = new_shares
-                portfolio_df.at[idx, "cost_basis"] = new_cost
-                portfolio_df.at[idx, "buy_price"] = avg_price
-                portfolio_df.at[idx, "stop_loss"] = max(portfolio_df.at[idx, "stop_loss"], stop_loss)
-            
+            # Add to portfolio (an existing position keeps the higher of its old and new stop)
+            if ticker in book:
+                stop_loss = max(book.value(ticker, "stop_loss"), stop_loss)
+            event = LedgerEvent("BUY", today, ticker, shares, price, stop_loss=stop_loss, amount=cost, reason="WEB BUY")
+            book.buy(ticker, shares, price, stop_loss, cost=cost)
             cash -= cost
             flash(f'Bought {shares} shares of {ticker} at ${price:.2f}', 'success')
             
         elif action == 'SELL':
-            # Handle case where portfolio_df might be a list
-            if isinstance(portfolio_df, list):
-                portfolio_df = pd.DataFrame(columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"])
-            
-            existing_rows = portfolio_df[portfolio_df["ticker"].astype(str).str.upper() == ticker.upper()]
-            
-            if existing_rows.empty:
+            if ticker not in book:
                 flash(f'No position in {ticker}', 'error')
                 return redirect(url_for('trade'))
             
-            current_shares = float(existing_rows.iloc[0]["shares"])
+            current_shares = book.value(ticker, "shares")
             if shares > current_shares:
                 flash(f'Insufficient shares. Have {current_shares}, trying to sell {shares}', 'error')
                 return redirect(url_for('trade'))
             
             # Calculate P&L
-            buy_price = float(existing_rows.iloc[0]["buy_price"])
+            buy_price = book.value(ticker, "buy_price")
             pnl = (price - buy_price) * shares
             
-            # Update position
-            idx = existing_rows.index[0]
-            if shares == current_shares:
-                # Sell entire position
-                portfolio_df = portfolio_df[portfolio_df["ticker"] != ticker]
-            else:
-                # Partial sell
-                portfolio_df.at[idx, "shares"] = current_shares - shares
-                portfolio_df.at[idx, "cost_basis"] = portfolio_df.at[idx, "shares"] * buy_price
-            
+            # Update position (sells the entire position when no shares are left)
+            event = LedgerEvent("SELL", today, ticker, shares, price, amount=shares * price, reason="WEB SELL")
+            book.sell(ticker, shares)
             cash += shares * price
             flash(f'Sold {shares} shares of {ticker} at ${price:.2f}. P&L: ${pnl:.2f}', 'success')
         
-        # Save updated portfolio
-        save_portfolio_to_csv(portfolio_df, cash)
+        # Record the trade in the ledger, then save the updated portfolio
+        record_ledger_events(event, *pre_trade, PORTFOLIO_CSV)
+        save_portfolio_to_csv(book.to_frame(), cash)
         return redirect(url_for('dashboard'))
     
     # Load current portfolio for display
@@ -426,6 +437,7 @@ def trade():
     
     # Only process if portfolio_df is not empty
     if not portfolio_df.empty:
+        prices = get_current_prices(portfolio_df["ticker"])
         for _, stock in portfolio_df.iterrows():
             ticker = str(stock["ticker"]).upper()
             shares = float(stock["shares"]) if not pd.isna(stock["shares"]) else 0
@@ -433,7 +445,7 @@ def trade():
             cost_basis = float(stock["cost_basis"]) if not pd.isna(stock["cost_basis"]) else cost * shares
             stop = float(stock["stop_loss"]) if not pd.isna(stock["stop_loss"]) else 0.0
             
-            current_price = get_current_price(ticker)
+            current_price = prices.get(ticker)
             if current_price:
                 current_value = current_price * shares
                 current_pnl = (current_price - cost) * shares
@@ -526,13 +538,63 @@ def ticker_info_api(ticker):
             'day_low': 0
         })
 
+# ^GSPC returns for the last equity history shown, keyed by its span
+_market_returns_cache = {}
+
+def market_returns_for(equity_series):
+    """^GSPC daily returns covering the equity history, downloaded once per history update"""
+    # The last equity value is part of the key: re-running a day replaces its row
+    key = (equity_series.index.min(), equity_series.index.max(), float(equity_series.iloc[-1]))
+    returns = _market_returns_cache.get(key)
+    if returns is None:
+        spx = download_price_data(
+            "^GSPC",
+            start=key[0] - pd.Timedelta(days=10),
+            end=key[1] + pd.Timedelta(days=1),
+            progress=False,
+        ).df
+        if spx.empty:
+            return None  # not cached, so the next request tries again
+        close = spx["Close"].astype(float)
+        returns = close.set_axis(pd.DatetimeIndex(close.index).normalize()).pct_change()
+        _market_returns_cache.clear()
+        _market_returns_cache[key] = returns
+    return returns
+
+def rolling_analytics(equity_series):
+    """Latest 20/60/120-day rolling metrics and their series, for the analytics page"""
+    frame = rolling_metrics(equity_series, market_returns_for(equity_series))
+    summary = latest_summary(frame)
+
+    def clean(values):
+        return [None if pd.isna(v) else float(v) for v in values]
+
+    labels = {
+        'volatility': ('Volatility (annualized)', True),
+        'sharpe': ('Sharpe Ratio (annualized)', False),
+        'sortino': ('Sortino Ratio (annualized)', False),
+        'beta': ('Beta vs S&P 500', False),
+        'alpha': ('Alpha (annualized)', True),
+        'drawdown': ('Drawdown from Window High', True),
+    }
+    return {
+        'windows': list(summary.columns),
+        'rows': [
+            {'label': labels[metric][0], 'percent': labels[metric][1], 'latest': clean(values)}
+            for metric, values in summary.iterrows()
+        ],
+        'dates': [d.strftime('%Y-%m-%d') for d in frame.index],
+        'sharpe': {w: clean(frame[f"sharpe_{w}"]) for w in summary.columns},
+        'volatility': {w: clean(frame[f"volatility_{w}"]) for w in summary.columns},
+    }
+
 @app.route('/analytics')
 def analytics():
     """Performance analytics page"""
     try:
-        if PORTFOLIO_CSV.exists():
-            df = pd.read_csv(PORTFOLIO_CSV)
-            totals = df[df["Ticker"] == "TOTAL"].copy()
+        storage = get_storage(PORTFOLIO_CSV, TRADE_LOG_CSV)
+        if storage.history_exists():
+            totals = storage.read_history(columns=["Date", "Ticker", "Total Equity"], tickers=["TOTAL"])
             
             if not totals.empty:
                 totals["Date"] = pd.to_datetime(totals["Date"])
@@ -562,7 +624,8 @@ def analytics():
                         'sharpe_ratio': sharpe_ratio,
                         'max_drawdown': max_drawdown,
                         'final_equity': final_equity,
-                        'initial_equity': initial_equity
+                        'initial_equity': initial_equity,
+                        'rolling': rolling_analytics(equity_series)
                     }
                 else:
                     metrics = {'message': 'Insufficient data for analytics'}
@@ -614,9 +677,12 @@ def run_daily_update():
 def portfolio_history():
     """Show portfolio history"""
     try:
-        if PORTFOLIO_CSV.exists():
-            df = pd.read_csv(PORTFOLIO_CSV)
-            totals = df[df["Ticker"] == "TOTAL"].copy()
+        storage = get_storage(PORTFOLIO_CSV, TRADE_LOG_CSV)
+        if storage.history_exists():
+            totals = storage.read_history(
+                columns=["Date", "Ticker", "Total Value", "Cash Balance", "Total Equity", "PnL"],
+                tickers=["TOTAL"],
+            )
             
             if not totals.empty:
                 totals["Date"] = pd.to_datetime(totals["Date"])
@@ -0,0 +1,259 @@
+"""Local stand-in for the Yahoo chart and Stooq CSV endpoints used by trading_script.py.
+
+Serves deterministic synthetic daily OHLCV so the data layer (download_price_data,
+download_price_data_many, fetch_prices) can be load-tested without touching the real
+providers. Latency, error rate and empty answers are configurable per run.
+
+Endpoints:
+- Stooq:  GET /q/d/l/?s=<sym>&i=d                         -> full-history CSV (or "No data")
+- Yahoo:  GET /v8/finance/chart/<sym>?period1=&period2=   -> v8 chart JSON
+
+Usage:
+    python fake_market_server.py --port 8765 --latency 0.05 --error-rate 0.02 --empty-rate 0.05
+    STOOQ_BASE_URL=http://127.0.0.1:8765 YAHOO_BASE_URL=http://127.0.0.1:8765 python trading_script.py ...
+
+Or in-process:
+    server = start_server(FakeMarketConfig(latency=0.2, error_rate=0.1))
+    set_provider_base_urls(yahoo=server.base_url, stooq=server.base_url)
+    ...
+    server.shutdown()
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+import pandas as pd
+
+HISTORY_START = pd.Timestamp("2015-01-02")
+NY_GMT_OFFSET = -4 * 3600  # fixed EDT offset is close enough for synthetic bars
+
+
+@dataclass
+class FakeMarketConfig:
+    latency: float = 0.0               # base seconds added to every response
+    latency_jitter: float = 0.0        # extra uniform [0, jitter) seconds
+    slow_rate: float = 0.0             # fraction of requests that take `slow_latency` instead
+    slow_latency: float = 5.0          # tail latency for slow requests
+    error_rate: float = 0.0            # fraction answered with HTTP 500
+    rate_limit_rate: float = 0.0       # fraction answered with HTTP 429 "Too Many Requests"
+    empty_rate: float = 0.0            # fraction answered with "no data" for a valid symbol
+    unknown_symbols: set[str] = field(default_factory=set)  # always "no data"
+    seed: int | None = None
+
+
+def _symbol_seed(symbol: str) -> int:
+    return zlib.crc32(symbol.upper().encode("utf-8"))
+
+
+def synthetic_bars(symbol: str, start: pd.Timestamp | None = None, end: pd.Timestamp | None = None) -> pd.DataFrame:
+    """Deterministic business-day OHLCV for `symbol` over [start, end).
+
+    Each day's prices depend only on (symbol, date), so any window of the series is
+    consistent with any other window, as with a real provider.
+    """
+    start = pd.Timestamp(start) if start is not None else HISTORY_START
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+    days = pd.bdate_range(max(start.normalize(), HISTORY_START), end - pd.Timedelta(days=1), name="Date")
+    if days.empty:
+        return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"], index=days)
+
+    seed = _symbol_seed(symbol)
+    base = 5.0 + (seed % 500)
+    phase = (seed % 1000) / 1000.0 * 2 * np.pi
+    ordinal = (days - HISTORY_START).days.to_numpy(dtype=float)
+    # Hash-style noise keyed on (symbol, day) keeps each bar independent of the window asked for
+    noise = np.sin(ordinal * 12.9898 + seed * 78.233) * 43758.5453
+    noise = noise - np.floor(noise)
+    close = base * np.exp(0.25 * np.sin(ordinal / 60.0 + phase) + 0.04 * (noise - 0.5))
+    open_ = close * (1 + 0.01 * (noise - 0.5))
+    high = np.maximum(open_, close) * (1 + 0.01 * noise)
+    low = np.minimum(open_, close) * (1 - 0.01 * (1 - noise))
+    volume = np.floor(1e5 + 9e5 * noise)
+    return pd.DataFrame(
+        {"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume},
+        index=days,
+    ).round({"Open": 4, "High": 4, "Low": 4, "Close": 4})
+
+
+def _stooq_symbol_to_ticker(sym: str) -> str:
+    sym = sym.upper()
+    return sym[:-3] if sym.endswith(".US") else sym
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeMarketServer"
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002 - stdlib signature
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: str, content_type: str) -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:  # noqa: N802 - stdlib naming
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        outcome = self.server.draw_outcome()
+        self.server.count(url.path, outcome)
+
+        if outcome == "error":
+            self._send(500, "Internal Server Error", "text/plain")
+            return
+        if outcome == "rate-limit":
+            self._send(429, "Too Many Requests", "text/plain")
+            return
+
+        if url.path.rstrip("/") == "/q/d/l":
+            ticker = _stooq_symbol_to_ticker(query.get("s", [""])[0])
+            self._stooq(ticker, empty=outcome == "empty")
+        elif url.path.startswith("/v8/finance/chart/"):
+            ticker = unquote(url.path[len("/v8/finance/chart/"):]).upper()
+            self._yahoo(ticker, query, empty=outcome == "empty")
+        else:
+            self._send(404, "Not Found", "text/plain")
+
+    def _stooq(self, ticker: str, empty: bool) -> None:
+        if empty or not ticker or ticker in self.server.config.unknown_symbols:
+            self._send(200, "No data", "text/plain")
+            return
+        df = synthetic_bars(ticker)
+        self._send(200, df.to_csv(index_label="Date", date_format="%Y-%m-%d"), "text/csv")
+
+    def _yahoo(self, ticker: str, query: dict[str, list[str]], empty: bool) -> None:
+        if ticker in self.server.config.unknown_symbols:
+            payload = {"chart": {"result": None, "error": {
+                "code": "Not Found", "description": "No data found, symbol may be delisted"}}}
+            self._send(404, json.dumps(payload), "application/json")
+            return
+        try:
+            start = pd.Timestamp(int(query["period1"][0]), unit="s")
+            end = pd.Timestamp(int(query["period2"][0]), unit="s")
+        except (KeyError, ValueError):
+            self._send(400, json.dumps({"chart": {"result": None, "error": {
+                "code": "Bad Request", "description": "period1/period2 required"}}}), "application/json")
+            return
+        df = synthetic_bars(ticker, start, end) if not empty else synthetic_bars(ticker, end, end)
+        stamps = ((df.index + pd.Timedelta(hours=13, minutes=30)).asi8 // 10**9).tolist()
+        payload = {"chart": {"result": [{
+            "meta": {
+                "currency": "USD", "symbol": ticker, "exchangeTimezoneName": "America/New_York",
+                "gmtoffset": NY_GMT_OFFSET, "priceHint": 2, "dataGranularity": "1d",
+            },
+            "timestamp": stamps,
+            "indicators": {
+                "quote": [{
+                    "open": df["Open"].tolist(), "high": df["High"].tolist(),
+                    "low": df["Low"].tolist(), "close": df["Close"].tolist(),
+                    "volume": df["Volume"].astype(int).tolist(),
+                }],
+                "adjclose": [{"adjclose": df["Close"].tolist()}],
+            },
+        }], "error": None}}
+        self._send(200, json.dumps(payload), "application/json")
+
+
+class FakeMarketServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: FakeMarketConfig, verbose: bool = False) -> None:
+        super().__init__(address, _Handler)
+        self.config = config
+        self.verbose = verbose
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.stats: dict[str, dict[str, int]] = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw_outcome(self) -> str:
+        """Sleep for the configured latency, then pick ok / error / rate-limit / empty."""
+        cfg = self.config
+        with self._lock:
+            slow = self._rng.random() < cfg.slow_rate
+            jitter = self._rng.random() * cfg.latency_jitter
+            roll = self._rng.random()
+        delay = cfg.slow_latency if slow else cfg.latency + jitter
+        if delay > 0:
+            time.sleep(delay)
+        if roll < cfg.error_rate:
+            return "error"
+        roll -= cfg.error_rate
+        if roll < cfg.rate_limit_rate:
+            return "rate-limit"
+        roll -= cfg.rate_limit_rate
+        if roll < cfg.empty_rate:
+            return "empty"
+        return "ok"
+
+    def count(self, path: str, outcome: str) -> None:
+        kind = "stooq" if path.startswith("/q/d/l") else "yahoo" if path.startswith("/v8/") else "other"
+        with self._lock:
+            bucket = self.stats.setdefault(kind, {})
+            bucket[outcome] = bucket.get(outcome, 0) + 1
+
+
+def start_server(
+    config: FakeMarketConfig | None = None,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    verbose: bool = False,
+) -> FakeMarketServer:
+    """Start the stand-in on a background thread (port 0 picks a free port)."""
+    server = FakeMarketServer((host, port), config or FakeMarketConfig(), verbose=verbose)
+    threading.Thread(target=server.serve_forever, name="fake-market-server", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic Yahoo/Stooq market data locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random delay in seconds")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests that are slow")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Delay for slow requests in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of HTTP 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of HTTP 429 responses")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="Fraction of 'no data' responses")
+    parser.add_argument("--unknown", default="", help="Comma-separated symbols that never have data")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the failure/latency draws")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    cfg = FakeMarketConfig(
+        latency=args.latency,
+        latency_jitter=args.jitter,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        empty_rate=args.empty_rate,
+        unknown_symbols={s.strip().upper() for s in args.unknown.split(",") if s.strip()},
+        seed=args.seed,
+    )
+    srv = FakeMarketServer((args.host, args.port), cfg, verbose=args.verbose)
+    print(f"Fake market data server on {srv.base_url}  (Ctrl+C to stop)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
@@ -0,0 +1,422 @@
+"""Event-sourced position ledger.
+
+Every buy, sell and stop-out is appended as an immutable event to chatgpt_ledger.jsonl next
+to the portfolio CSV; holdings and cash for any date are rebuilt by folding those events.
+Every LEDGER_SNAPSHOT_EVERY events the folded state is written to
+chatgpt_ledger.snapshots.jsonl together with the byte offset of the next event, so a
+rebuild starts from the nearest snapshot and reads only the events after it. Appends hold
+an exclusive lock on chatgpt_ledger.jsonl.lock, so the CLI and the Flask app can write to
+the same ledger.
+
+Event kinds:
+- OPEN:  replace the whole state with `positions` and `cash` (first event, or a new setup)
+- BUY:   add `shares` at `price`; the position's stop becomes `stop_loss`
+- SELL:  remove `shares` (the position closes when none are left)
+- STOP:  close the position (stop-loss fill)
+- RESET: clear every position, keep cash
+
+`amount` is the cash that actually moved (BUY debits it, SELL/STOP credit it); it defaults
+to shares * price. Positions hold whole shares and cash is kept in cents, as the daily CSV
+stores them.
+
+The daily CSV stays the record a person edits. trading_script.load_latest_portfolio_state
+(and the Flask app through it) checks it against Ledger.latest() and refuses to go on when
+they disagree, until the ledger is re-based on the CSV (Ledger.rebase, --rebase-ledger).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import pandas as pd
+
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+    _HAS_FCNTL = False
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILE = "chatgpt_ledger.jsonl"
+SNAPSHOT_SUFFIX = ".snapshots.jsonl"
+LOCK_SUFFIX = ".lock"
+LEDGER_SNAPSHOT_EVERY = int(os.environ.get("LEDGER_SNAPSHOT_EVERY", "50"))
+
+EVENT_KINDS = ("OPEN", "BUY", "SELL", "STOP", "RESET")
+POSITION_COLUMNS = ["ticker", "shares", "stop_loss", "buy_price", "cost_basis"]
+
+
+@dataclass(frozen=True)
+class LedgerEvent:
+    kind: str
+    date: str
+    ticker: str = ""
+    shares: float = 0.0
+    price: float = 0.0
+    stop_loss: float | None = None
+    amount: float | None = None
+    cash: float | None = None                               # OPEN only
+    positions: tuple[dict[str, Any], ...] = field(default=())  # OPEN only
+    reason: str = ""
+    seq: int = 0                                            # assigned by Ledger.append
+
+    def __post_init__(self) -> None:
+        if self.kind not in EVENT_KINDS:
+            raise ValueError(f"Unknown ledger event kind {self.kind!r}; expected one of {', '.join(EVENT_KINDS)}")
+
+    @property
+    def cash_amount(self) -> float:
+        return float(self.amount) if self.amount is not None else float(self.shares) * float(self.price)
+
+    def to_json(self) -> str:
+        payload = {k: v for k, v in asdict(self).items() if v not in (None, "", ())}
+        payload["positions"] = list(self.positions) if self.positions else None
+        return json.dumps({k: v for k, v in payload.items() if v is not None})
+
+    @classmethod
+    def from_json(cls, line: str) -> "LedgerEvent":
+        raw = json.loads(line)
+        raw["positions"] = tuple(raw.get("positions") or ())
+        return cls(**raw)
+
+
+def _whole(shares: Any) -> float:
+    """Shares as the daily CSV keeps them (truncated to whole shares)."""
+    return float(math.trunc(float(shares)))
+
+
+@dataclass
+class Position:
+    shares: float
+    buy_price: float
+    cost_basis: float
+    stop_loss: float
+
+
+@dataclass
+class LedgerState:
+    """Holdings and cash after folding events up to `seq`."""
+    cash: float = 0.0
+    positions: dict[str, Position] = field(default_factory=dict)
+    as_of: str | None = None
+    seq: int = 0
+
+    def copy(self) -> "LedgerState":
+        return LedgerState(self.cash, {t: replace(p) for t, p in self.positions.items()}, self.as_of, self.seq)
+
+    def apply(self, event: LedgerEvent) -> None:
+        ticker = event.ticker.upper()
+        if event.kind == "OPEN":
+            self.cash = float(event.cash or 0.0)
+            self.positions = {
+                str(p["ticker"]).upper(): Position(
+                    _whole(p["shares"]), float(p["buy_price"]), float(p["cost_basis"]), float(p.get("stop_loss") or 0.0)
+                )
+                for p in event.positions
+            }
+        elif event.kind == "RESET":
+            self.positions = {}
+        elif event.kind == "BUY":
+            pos = self.positions.get(ticker)
+            if pos is None:
+                self.positions[ticker] = Position(
+                    _whole(event.shares), float(event.price), event.cash_amount, float(event.stop_loss or 0.0)
+                )
+            else:
+                shares = pos.shares + float(event.shares)
+                pos.cost_basis += event.cash_amount
+                pos.buy_price = pos.cost_basis / shares if shares else 0.0
+                pos.shares = _whole(shares)
+                if event.stop_loss is not None:
+                    pos.stop_loss = float(event.stop_loss)
+            self.cash = round(self.cash - event.cash_amount, 2)
+        else:  # SELL / STOP
+            pos = self.positions.get(ticker)
+            if pos is None and event.kind == "STOP":
+                pass  # a duplicate holding row already closed this position; the fill still pays out
+            elif pos is None:
+                raise ValueError(f"Ledger event {event.seq} ({event.kind} {ticker}) sells a position that is not held")
+            elif event.kind == "STOP" or pos.shares - float(event.shares) <= 0:
+                del self.positions[ticker]
+            else:
+                pos.shares = _whole(pos.shares - float(event.shares))
+                pos.cost_basis = pos.shares * pos.buy_price
+            self.cash = round(self.cash + event.cash_amount, 2)
+        self.seq = event.seq
+        self.as_of = event.date if self.as_of is None else max(self.as_of, event.date)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Holdings in the portfolio DataFrame layout used by trading_script."""
+        rows = [
+            {"ticker": t, "shares": p.shares, "stop_loss": p.stop_loss, "buy_price": p.buy_price, "cost_basis": p.cost_basis}
+            for t, p in self.positions.items()
+        ]
+        return pd.DataFrame(rows, columns=POSITION_COLUMNS)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "cash": self.cash,
+            "as_of": self.as_of,
+            "seq": self.seq,
+            "positions": {t: asdict(p) for t, p in self.positions.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, raw: dict[str, Any]) -> "LedgerState":
+        positions = {t: Position(**p) for t, p in raw.get("positions", {}).items()}
+        return cls(float(raw["cash"]), positions, raw.get("as_of"), int(raw["seq"]))
+
+
+def portfolio_positions(portfolio: Any) -> tuple[dict[str, Any], ...]:
+    """
+    Position payload for an OPEN event from a portfolio DataFrame, Portfolio or list of records.
+    Rows repeating a ticker are merged into one position.
+    """
+    if portfolio is None:
+        return ()
+    if isinstance(portfolio, pd.DataFrame):
+        rows = portfolio.to_dict(orient="records")
+    elif hasattr(portfolio, "records"):  # portfolio.Portfolio
+        rows = portfolio.records()
+    else:
+        rows = list(portfolio)
+    out: dict[str, dict[str, Any]] = {}
+    for row in rows:
+        shares = float(row.get("shares")) if pd.notna(row.get("shares")) else 0.0
+        buy_price = float(row.get("buy_price")) if pd.notna(row.get("buy_price")) else 0.0
+        cost_basis = float(row.get("cost_basis")) if pd.notna(row.get("cost_basis")) else shares * buy_price
+        stop_loss = float(row.get("stop_loss")) if pd.notna(row.get("stop_loss")) else 0.0
+        ticker = str(row["ticker"]).upper()
+        pos = out.get(ticker)
+        if pos is None:
+            out[ticker] = {"ticker": ticker, "shares": shares, "buy_price": buy_price,
+                           "cost_basis": cost_basis, "stop_loss": stop_loss}
+        else:
+            pos["shares"] += shares
+            pos["cost_basis"] += cost_basis
+            pos["buy_price"] = pos["cost_basis"] / pos["shares"] if pos["shares"] else 0.0
+            pos["stop_loss"] = stop_loss
+    return tuple(out.values())
+
+
+class Ledger:
+    """Append-only event file plus periodic snapshots for one data directory."""
+
+    def __init__(self, path: Path | str, snapshot_every: int = LEDGER_SNAPSHOT_EVERY) -> None:
+        self.path = Path(path)
+        self.snapshot_path = self.path.with_name(self.path.stem + SNAPSHOT_SUFFIX)
+        self.lock_path = self.path.with_name(self.path.name + LOCK_SUFFIX)
+        self.snapshot_every = max(1, int(snapshot_every))
+        self._lock = threading.RLock()
+        self._snapshots: list[dict[str, Any]] | None = None  # [{"offset", "max_date", "state"}]
+        self._head: LedgerState | None = None
+        self._head_offset = 0
+
+    # ----- reads -----
+
+    def _load_snapshots(self) -> list[dict[str, Any]]:
+        if self._snapshots is None:
+            snaps: list[dict[str, Any]] = []
+            if self.snapshot_path.exists():
+                with open(self.snapshot_path, encoding="utf-8") as fh:
+                    for line in fh:
+                        try:
+                            snaps.append(json.loads(line))
+                        except ValueError:
+                            continue  # torn line from an interrupted write; snapshots are only a shortcut
+            self._snapshots = snaps
+        return self._snapshots
+
+    def _events_from(self, offset: int) -> Iterable[tuple[LedgerEvent, int]]:
+        """Events starting at byte `offset`, each with the offset just past it."""
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as fh:
+            fh.seek(offset)
+            for line in iter(fh.readline, b""):
+                if not line.endswith(b"\n"):
+                    break  # torn final line from an interrupted write
+                offset += len(line)
+                if line.strip():
+                    yield LedgerEvent.from_json(line.decode("utf-8")), offset
+
+    def _start_for(self, date: str | None) -> tuple[LedgerState, int]:
+        """Latest snapshot usable for `date` (None = any), and the offset to resume from."""
+        for snap in reversed(self._load_snapshots()):
+            if date is None or snap["max_date"] <= date:
+                return LedgerState.from_dict(snap["state"]), int(snap["offset"])
+        return LedgerState(), 0
+
+    def _sync_head(self) -> LedgerState:
+        if self._head is not None and self.path.exists() and self.path.stat().st_size < self._head_offset:
+            self._head, self._snapshots = None, None  # file replaced or cut short by someone else
+        if self._head is None:
+            self._head, self._head_offset = self._start_for(None)
+        for event, end in self._events_from(self._head_offset):
+            self._head.apply(event)
+            self._head_offset = end
+        return self._head
+
+    def latest(self) -> LedgerState:
+        """State after every recorded event."""
+        with self._lock:
+            return self._sync_head().copy()
+
+    def state_at(self, date: str | pd.Timestamp) -> LedgerState:
+        """State after every event dated on or before `date`."""
+        date = pd.Timestamp(date).date().isoformat()
+        with self._lock:
+            state, offset = self._start_for(date)
+            for event, _ in self._events_from(offset):
+                if event.date <= date:
+                    state.apply(event)
+            return state
+
+    def events(self) -> list[LedgerEvent]:
+        with self._lock:
+            return [event for event, _ in self._events_from(0)]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._sync_head().seq == 0
+
+    # ----- writes -----
+
+    def append(self, events: LedgerEvent | Iterable[LedgerEvent]) -> list[LedgerEvent]:
+        """Number, fsync and fold new events; returns them with their sequence numbers."""
+        events = [events] if isinstance(events, LedgerEvent) else list(events)
+        if not events:
+            return []
+        with self._lock, _file_lock(self.lock_path):
+            return self._append(events)
+
+    def _append(self, events: list[LedgerEvent]) -> list[LedgerEvent]:
+        """append() body; the caller holds both locks."""
+        head = self._sync_head()  # picks up events other processes appended
+        numbered = [replace(ev, seq=head.seq + i + 1) for i, ev in enumerate(events)]
+        trial = head.copy()
+        for ev in numbered:
+            trial.apply(ev)  # reject an impossible event before anything is written
+        lines = [(ev.to_json() + "\n").encode("utf-8") for ev in numbered]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as fh:
+            fh.truncate(self._head_offset)  # drop a torn line left by an interrupted write
+            fh.write(b"".join(lines))
+            fh.flush()
+            os.fsync(fh.fileno())
+        for ev, line in zip(numbered, lines):
+            head.apply(ev)
+            self._head_offset += len(line)
+            if ev.seq % self.snapshot_every == 0:
+                self._write_snapshot(head)
+        return numbered
+
+    def _write_snapshot(self, state: LedgerState) -> None:
+        snap = {"offset": self._head_offset, "max_date": state.as_of, "state": state.to_dict()}
+        with open(self.snapshot_path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(snap) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._load_snapshots().append(snap)
+
+    def rebase(self, portfolio: Any, cash: float, date: str) -> LedgerEvent:
+        """Append an OPEN event that replaces the ledger state with `portfolio` and `cash`."""
+        opening = LedgerEvent("OPEN", date, cash=float(cash), positions=portfolio_positions(portfolio))
+        return self.append(opening)[0]
+
+    def record(
+        self,
+        events: LedgerEvent | Iterable[LedgerEvent],
+        portfolio: pd.DataFrame | list[dict[str, Any]] | None = None,
+        cash: float | None = None,
+        date: str | None = None,
+    ) -> list[LedgerEvent]:
+        """
+        Append trade events made against the caller's pre-trade `portfolio`/`cash`. An empty
+        ledger is opened with those holdings first. When a non-empty ledger disagrees with
+        them the differences are logged and the events are folded onto the ledger's own
+        state; rebase() adopts the caller's holdings deliberately.
+        """
+        events = [events] if isinstance(events, LedgerEvent) else list(events)
+        if not events:
+            return []
+        with self._lock, _file_lock(self.lock_path):
+            if cash is not None:
+                positions = portfolio_positions(portfolio)
+                head = self._sync_head()
+                if head.seq == 0:
+                    opening = LedgerEvent("OPEN", date or events[0].date, cash=float(cash), positions=positions)
+                    events = [opening] + events
+                else:
+                    diffs = state_differences(head, positions, float(cash))
+                    if diffs:
+                        logger.warning("Ledger %s disagrees with the portfolio passed in: %s", self.path, "; ".join(diffs))
+            return self._append(events)
+
+
+def state_differences(
+    state: LedgerState, positions: tuple[dict[str, Any], ...], cash: float, tol: float = 0.01
+) -> list[str]:
+    """Ways `positions`/`cash` (see portfolio_positions) differ from `state`; empty when they agree."""
+    out: list[str] = []
+    if abs(state.cash - cash) > tol:
+        out.append(f"cash {cash:.2f} vs ledger {state.cash:.2f}")
+    given = {p["ticker"]: p for p in positions}
+    for ticker in sorted(set(state.positions) - set(given)):
+        out.append(f"{ticker} missing (ledger holds {state.positions[ticker].shares:g} shares)")
+    for ticker, p in given.items():
+        pos = state.positions.get(ticker)
+        if pos is None:
+            out.append(f"{ticker} not held in the ledger")
+            continue
+        if abs(pos.shares - _whole(p["shares"])) > 1e-9:
+            out.append(f"{ticker} shares {p['shares']:g} vs ledger {pos.shares:g}")
+        if abs(pos.stop_loss - p["stop_loss"]) > 1e-9:
+            out.append(f"{ticker} stop {p['stop_loss']:g} vs ledger {pos.stop_loss:g}")
+        if abs(pos.cost_basis - p["cost_basis"]) > tol:
+            out.append(f"{ticker} cost basis {p['cost_basis']:.2f} vs ledger {pos.cost_basis:.2f}")
+    return out
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock on `path` shared with other processes (blocks until it is free)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as fh:
+        if _HAS_FCNTL:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if _HAS_FCNTL:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+_ledgers: dict[Path, Ledger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger(portfolio_csv: Path | str) -> Ledger:
+    """Shared Ledger for the data directory holding `portfolio_csv`."""
+    key = Path(portfolio_csv).resolve().with_name(LEDGER_FILE)
+    with _ledgers_lock:
+        ledger = _ledgers.get(key)
+        if ledger is None:
+            ledger = _ledgers[key] = Ledger(key)
+        return ledger
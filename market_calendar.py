@@ -0,0 +1,166 @@
+"""NYSE trading calendar (holidays, special closures and early closes).
+
+The session list is built once from holiday rules for 1990-2100 (about 0.1 s; weekdays
+come from np.is_busday) and kept as a sorted numpy datetime64[D] array, so every lookup
+is a single np.searchsorted call and works on scalars and arrays alike. No external
+calendar package is needed.
+
+Notes:
+- New Year's Day falling on a Saturday is NOT observed on the prior Friday (NYSE rule).
+- Juneteenth is a market holiday from 2022 onward.
+- One-off closures (9/11, Hurricane Sandy, state funerals) are listed in SPECIAL_CLOSURES.
+- Early closes (13:00 ET): July 3, the day after Thanksgiving, and Christmas Eve when they are sessions.
+"""
+
+from __future__ import annotations
+
+import warnings
+from datetime import datetime, time
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar,
+    GoodFriday,
+    Holiday,
+    USLaborDay,
+    USMartinLutherKingJr,
+    USMemorialDay,
+    USPresidentsDay,
+    USThanksgivingDay,
+    nearest_workday,
+    sunday_to_monday,
+)
+
+CALENDAR_START = "1990-01-01"
+CALENDAR_END = "2100-12-31"
+REGULAR_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+SPECIAL_CLOSURES = [
+    "1994-04-27",  # Nixon funeral
+    "2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14",  # September 11
+    "2004-06-11",  # Reagan funeral
+    "2007-01-02",  # Ford funeral
+    "2012-10-29", "2012-10-30",  # Hurricane Sandy
+    "2018-12-05",  # G.H.W. Bush funeral
+    "2025-01-09",  # Carter funeral
+]
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    rules = [
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+def _as_day(value: Any) -> Any:
+    """Coerce a date-like scalar or array to numpy datetime64[D]."""
+    if isinstance(value, (pd.Series, pd.Index, np.ndarray, list, tuple)):
+        return pd.DatetimeIndex(pd.to_datetime(value)).tz_localize(None).normalize().values.astype("datetime64[D]")
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return np.datetime64(ts.normalize().date(), "D")
+
+
+class TradingCalendar:
+    """Precomputed sessions with vectorized lookups."""
+
+    def __init__(self, start: str = CALENDAR_START, end: str = CALENDAR_END) -> None:
+        with warnings.catch_warnings():
+            # Easter and observance rules are applied date by date, which pandas flags.
+            warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+            holidays = NYSEHolidayCalendar().holidays(start=start, end=end)
+            thanksgiving = USThanksgivingDay.dates(start, end)
+        closed = holidays.union(pd.DatetimeIndex(SPECIAL_CLOSURES))
+        days = np.arange(_as_day(start), _as_day(end) + 1)
+        self.holidays = closed.values.astype("datetime64[D]")
+        self.sessions = np.setdiff1d(days[np.is_busday(days)], self.holidays)
+
+        years = range(pd.Timestamp(start).year, pd.Timestamp(end).year + 1)
+        candidates = pd.DatetimeIndex(
+            [pd.Timestamp(y, 7, 3) for y in years]
+            + [pd.Timestamp(y, 12, 24) for y in years]
+            + list(thanksgiving + pd.Timedelta(days=1))
+        ).values.astype("datetime64[D]")
+        self.early_closes = np.intersect1d(candidates, self.sessions)
+        self.first = self.sessions[0]
+        self.last = self.sessions[-1]
+
+    def _check_bounds(self, days: Any) -> None:
+        lo, hi = np.min(days), np.max(days)
+        if lo < self.first or hi > self.last:
+            raise ValueError(f"Date outside calendar range {self.first}..{self.last}")
+
+    def is_session(self, value: Any) -> Any:
+        days = _as_day(value)
+        self._check_bounds(days)
+        idx = np.searchsorted(self.sessions, days)
+        found = np.take(self.sessions, np.minimum(idx, self.sessions.size - 1)) == days
+        return bool(found) if np.ndim(found) == 0 else found
+
+    def is_early_close(self, value: Any) -> Any:
+        days = _as_day(value)
+        found = np.isin(days, self.early_closes)
+        return bool(found) if np.ndim(found) == 0 else found
+
+    def close_time(self, value: Any) -> time | None:
+        """Scheduled close (ET) for a single date, or None if the market is shut."""
+        if not self.is_session(value):
+            return None
+        return EARLY_CLOSE if self.is_early_close(value) else REGULAR_CLOSE
+
+    def previous_session(self, value: Any, offset: int = 0) -> Any:
+        """Latest session on or before `value`, then `offset` further sessions back.
+
+        Accepts a scalar (returns pd.Timestamp) or an array (returns DatetimeIndex).
+        """
+        days = _as_day(value)
+        self._check_bounds(days)
+        idx = np.searchsorted(self.sessions, days, side="right") - 1 - int(offset)
+        if np.any(idx < 0):
+            raise ValueError("No earlier session inside calendar range")
+        out = self.sessions[idx]
+        return pd.Timestamp(out) if np.ndim(out) == 0 else pd.DatetimeIndex(out)
+
+    def next_session(self, value: Any) -> Any:
+        """Earliest session on or after `value`."""
+        days = _as_day(value)
+        self._check_bounds(days)
+        out = self.sessions[np.searchsorted(self.sessions, days, side="left")]
+        return pd.Timestamp(out) if np.ndim(out) == 0 else pd.DatetimeIndex(out)
+
+    def sessions_in_range(self, start: Any, end: Any) -> pd.DatetimeIndex:
+        """Sessions in the half-open window [start, end)."""
+        lo = np.searchsorted(self.sessions, _as_day(start), side="left")
+        hi = np.searchsorted(self.sessions, _as_day(end), side="left")
+        return pd.DatetimeIndex(self.sessions[lo:hi])
+
+    def count_sessions(self, start: Any, end: Any) -> Any:
+        """Number of sessions in [start, end); vectorized over array inputs."""
+        lo = np.searchsorted(self.sessions, _as_day(start), side="left")
+        hi = np.searchsorted(self.sessions, _as_day(end), side="left")
+        return np.maximum(hi - lo, 0)
+
+
+@lru_cache(maxsize=1)
+def get_calendar() -> TradingCalendar:
+    """Process-wide calendar, built on first use."""
+    return TradingCalendar()
+
+
+def last_session(today: datetime | pd.Timestamp | str) -> pd.Timestamp:
+    """Most recent NYSE session on or before `today` (holidays and weekends roll back)."""
+    return get_calendar().previous_session(today)
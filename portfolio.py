@@ -0,0 +1,225 @@
+"""Array-backed holdings book.
+
+`Portfolio` keeps one slot per holding row: tickers in a list, and shares, stop loss, buy
+price and cost basis as rows of a single float64 array. A ticker -> slot index makes lookup,
+update, buy and sell O(1); removal leaves a hole that is compacted once holes outnumber
+live rows, so row order is preserved. `to_frame()` hands the arrays to pandas without
+copying them (after compacting), in the same column layout trading_script has always
+used for the portfolio DataFrame.
+
+Tickers are matched case-insensitively; the spelling of the first row for a ticker is kept.
+Several rows for one ticker are kept as they are (lookups use the first); `remove` drops all.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterator
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["ticker", "shares", "stop_loss", "buy_price", "cost_basis"]
+_FIELDS = COLUMNS[1:]
+_ROW = {name: i for i, name in enumerate(_FIELDS)}
+_MIN_CAPACITY = 8
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class Portfolio:
+    """Holdings with O(1) per-ticker operations; see the module docstring."""
+
+    __slots__ = ("_tickers", "_data", "_live", "_size", "_index", "_holes")
+
+    def __init__(self, capacity: int = _MIN_CAPACITY) -> None:
+        capacity = max(_MIN_CAPACITY, int(capacity))
+        self._tickers: list[str | None] = [None] * capacity
+        self._data = np.full((len(_FIELDS), capacity), np.nan)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._size = 0                        # slots used, including holes
+        self._index: dict[str, list[int]] = {}
+        self._holes = 0
+
+    # ----- construction -----
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame | list[dict[str, Any]] | "Portfolio" | None) -> "Portfolio":
+        """Build from a portfolio DataFrame, a list of records, or another Portfolio (copied)."""
+        if isinstance(df, Portfolio):
+            return df.copy()
+        if df is None:
+            return cls()
+        if not isinstance(df, pd.DataFrame):
+            df = pd.DataFrame(df)
+        n = len(df)
+        book = cls(n)
+        if n == 0 or "ticker" not in df:
+            return book
+        for name, row in _ROW.items():
+            if name in df:
+                book._data[row, :n] = pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+        book._tickers[:n] = [str(t) for t in df["ticker"].tolist()]
+        book._live[:n] = True
+        book._size = n
+        for slot, ticker in enumerate(book._tickers[:n]):
+            book._index.setdefault(str(ticker).upper(), []).append(slot)
+        return book
+
+    def copy(self) -> "Portfolio":
+        self.compact()
+        book = Portfolio(self._size)
+        n = self._size
+        book._tickers[:n] = self._tickers[:n]
+        book._data[:, :n] = self._data[:, :n]
+        book._live[:n] = True
+        book._size = n
+        book._index = {k: list(v) for k, v in self._index.items()}
+        return book
+
+    # ----- lookup -----
+
+    def __len__(self) -> int:
+        return self._size - self._holes
+
+    def __contains__(self, ticker: object) -> bool:
+        return str(ticker).upper() in self._index
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(self.records())
+
+    def __repr__(self) -> str:
+        return f"Portfolio({self.records()!r})"
+
+    def slot(self, ticker: str) -> int | None:
+        slots = self._index.get(str(ticker).upper())
+        return slots[0] if slots else None
+
+    def get(self, ticker: str) -> dict[str, Any] | None:
+        slot = self.slot(ticker)
+        return None if slot is None else self._record(slot)
+
+    def value(self, ticker: str, field: str) -> float:
+        slot = self.slot(ticker)
+        if slot is None:
+            raise KeyError(ticker)
+        return float(self._data[_ROW[field], slot])
+
+    def tickers(self) -> list[str]:
+        return [t for t, live in zip(self._tickers[: self._size], self._live[: self._size]) if live]  # type: ignore[misc]
+
+    def records(self) -> list[dict[str, Any]]:
+        return [self._record(int(s)) for s in np.flatnonzero(self._live[: self._size])]
+
+    def _record(self, slot: int) -> dict[str, Any]:
+        values = self._data[:, slot].tolist()
+        return {"ticker": self._tickers[slot], **dict(zip(_FIELDS, values))}
+
+    # ----- updates -----
+
+    def add(self, ticker: str, shares: float, buy_price: float, cost_basis: float | None = None,
+            stop_loss: float = 0.0) -> int:
+        """Append a new holding row and return its slot."""
+        if self._size == len(self._tickers):
+            self._grow()
+        slot = self._size
+        self._tickers[slot] = str(ticker)
+        col = self._data[:, slot]
+        col[_ROW["shares"]] = float(shares)
+        col[_ROW["buy_price"]] = float(buy_price)
+        col[_ROW["cost_basis"]] = float(shares) * float(buy_price) if cost_basis is None else float(cost_basis)
+        col[_ROW["stop_loss"]] = float(stop_loss)
+        self._live[slot] = True
+        self._size += 1
+        self._index.setdefault(str(ticker).upper(), []).append(slot)
+        return slot
+
+    def update(self, ticker: str, **fields: float) -> None:
+        slot = self.slot(ticker)
+        if slot is None:
+            raise KeyError(ticker)
+        for name, value in fields.items():
+            self._data[_ROW[name], slot] = _num(value)
+
+    def buy(self, ticker: str, shares: float, price: float, stop_loss: float, cost: float | None = None) -> None:
+        """Open a position, or add to it at the blended price; the stop becomes `stop_loss`."""
+        cost = float(shares) * float(price) if cost is None else float(cost)
+        slot = self.slot(ticker)
+        if slot is None:
+            self.add(ticker, shares, price, cost, stop_loss)
+            return
+        d = self._data
+        new_shares = float(d[_ROW["shares"], slot]) + float(shares)
+        new_cost = float(d[_ROW["cost_basis"], slot]) + cost
+        d[_ROW["shares"], slot] = new_shares
+        d[_ROW["cost_basis"], slot] = new_cost
+        d[_ROW["buy_price"], slot] = new_cost / new_shares if new_shares else 0.0
+        d[_ROW["stop_loss"], slot] = float(stop_loss)
+
+    def sell(self, ticker: str, shares: float) -> None:
+        """Reduce a position, keeping its buy price; it is removed when no shares are left."""
+        slot = self.slot(ticker)
+        if slot is None:
+            raise KeyError(ticker)
+        d = self._data
+        remaining = float(d[_ROW["shares"], slot]) - float(shares)
+        if remaining <= 0:
+            self.remove(ticker)
+            return
+        d[_ROW["shares"], slot] = remaining
+        d[_ROW["cost_basis"], slot] = remaining * float(d[_ROW["buy_price"], slot])
+
+    def remove(self, ticker: str) -> None:
+        """Drop every row for `ticker` (no-op when it is not held)."""
+        for slot in self._index.pop(str(ticker).upper(), []):
+            self._live[slot] = False
+            self._tickers[slot] = None
+            self._holes += 1
+        if self._holes > len(self):
+            self.compact()
+
+    # ----- storage -----
+
+    def _grow(self) -> None:
+        capacity = len(self._tickers) * 2
+        data = np.full((len(_FIELDS), capacity), np.nan)
+        data[:, : self._size] = self._data[:, : self._size]
+        live = np.zeros(capacity, dtype=bool)
+        live[: self._size] = self._live[: self._size]
+        self._data, self._live = data, live
+        self._tickers.extend([None] * (capacity - self._size))
+
+    def compact(self) -> None:
+        """Close the holes left by removals (row order is kept)."""
+        if not self._holes:
+            return
+        keep = np.flatnonzero(self._live[: self._size])
+        n = keep.size
+        # Fresh buffers, so frames handed out earlier by to_frame() keep their rows
+        data = np.full_like(self._data, np.nan)
+        data[:, :n] = self._data[:, keep]
+        tickers = [self._tickers[int(s)] for s in keep]
+        self._data = data
+        self._tickers = tickers + [None] * (len(self._tickers) - n)
+        self._live = np.zeros_like(self._live)
+        self._live[:n] = True
+        self._size, self._holes = n, 0
+        self._index = {}
+        for slot, ticker in enumerate(tickers):
+            self._index.setdefault(str(ticker).upper(), []).append(slot)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Holdings as a DataFrame whose numeric columns are views of this book's arrays: later
+        in-place updates show through, so call .copy() on it if the book keeps trading.
+        """
+        self.compact()
+        n = self._size
+        columns: dict[str, Any] = {"ticker": np.array(self._tickers[:n], dtype=object)}
+        for name, row in _ROW.items():
+            columns[name] = self._data[row, :n]
+        return pd.DataFrame(columns, columns=COLUMNS, copy=False)
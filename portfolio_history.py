@@ -0,0 +1,257 @@
+"""Indexed, append-only store for the daily portfolio history CSV.
+
+chatgpt_portfolio_update.csv stays the on-disk format (and what every reader opens), but
+writes no longer read and rewrite the whole file:
+
+- A sidecar index (<csv>.idx.json) records the byte offset where each date's block starts.
+- Replacing the most recent day truncates the file at that day's offset and appends the new
+  rows, so the cost is O(rows for that day) regardless of how much history precedes it.
+  A date the file does not hold yet is appended the same way, at the end, even when it is
+  older than the last date (a backfilled day is not sorted into place).
+- The new block is first written to a journal (<csv>.journal); an interrupted write is
+  completed from the journal the next time the history is opened, so the CSV is never left
+  half-written.
+- Replacing a date that is not the last block, or rows with a column the file does not have,
+  falls back to an atomic full rewrite via a temporary file and os.replace.
+
+The index is validated against the file's size and mtime and rebuilt by a single scan when
+the CSV was changed behind its back.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+INDEX_SUFFIX = ".idx.json"
+JOURNAL_SUFFIX = ".journal"
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as fh:
+        fh.write(text)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _first_field(line: bytes) -> str:
+    text = line.decode("utf-8").rstrip("\r\n")
+    if text.startswith('"'):
+        end = text.find('"', 1)
+        return text[1:end] if end > 0 else text[1:]
+    return text.split(",", 1)[0]
+
+
+class PortfolioHistory:
+    """Date-indexed view over one portfolio history CSV."""
+
+    def __init__(self, csv_path: Path | str) -> None:
+        self.path = Path(csv_path)
+        self.index_path = self.path.with_name(self.path.name + INDEX_SUFFIX)
+        self.journal_path = self.path.with_name(self.path.name + JOURNAL_SUFFIX)
+        self._lock = threading.RLock()
+        self._header: list[str] | None = None
+        self._blocks: list[tuple[str, int]] = []  # (date, start offset) in file order
+        self._loaded_stamp: tuple[int, int] | None = None
+
+    # ----- index -----
+
+    def _stamp(self) -> tuple[int, int] | None:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _load(self) -> None:
+        """Make the in-memory index match the file, replaying a journal first if one is left over."""
+        if self.journal_path.exists():
+            self._replay_journal()
+        stamp = self._stamp()
+        if stamp is None:
+            self._header, self._blocks, self._loaded_stamp = None, [], None
+            return
+        if stamp == self._loaded_stamp:
+            return
+        try:
+            idx = json.loads(self.index_path.read_text(encoding="utf-8"))
+            if (idx["size"], idx["mtime_ns"]) == stamp:
+                self._header = list(idx["header"])
+                self._blocks = [(str(d), int(o)) for d, o in idx["blocks"]]
+                self._loaded_stamp = stamp
+                return
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        self.rebuild_index()
+
+    def rebuild_index(self) -> None:
+        """Scan the CSV once and record where each date's block starts."""
+        with self._lock:
+            header: list[str] | None = None
+            blocks: list[tuple[str, int]] = []
+            with open(self.path, "rb") as fh:
+                first = fh.readline()
+                if first.strip():
+                    header = pd.read_csv(io.BytesIO(first), nrows=0).columns.map(str).tolist()
+                offset = len(first)
+                for line in iter(fh.readline, b""):
+                    if line.strip():
+                        date = _first_field(line)
+                        if not blocks or blocks[-1][0] != date:
+                            blocks.append((date, offset))
+                    offset += len(line)
+            self._header, self._blocks = header, blocks
+            self._save_index()
+
+    def _save_index(self) -> None:
+        stamp = self._stamp()
+        self._loaded_stamp = stamp
+        if stamp is None:
+            return
+        payload = {
+            "size": stamp[0],
+            "mtime_ns": stamp[1],
+            "header": self._header,
+            "blocks": [[d, o] for d, o in self._blocks],
+        }
+        _atomic_write_text(self.index_path, json.dumps(payload))
+
+    # ----- journal -----
+
+    def _replay_journal(self) -> None:
+        try:
+            entry = json.loads(self.journal_path.read_text(encoding="utf-8"))
+        except (ValueError, OSError):
+            # Journal itself was never completed: the CSV was not touched yet.
+            self.journal_path.unlink(missing_ok=True)
+            return
+        self._apply_tail(int(entry["offset"]), entry["block"])
+        self.journal_path.unlink(missing_ok=True)
+        self.rebuild_index()
+
+    def _apply_tail(self, offset: int, block: str) -> None:
+        with open(self.path, "r+b") as fh:
+            fh.truncate(offset)
+            fh.seek(offset)
+            fh.write(block.encode("utf-8"))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    # ----- reads -----
+
+    def dates(self) -> list[str]:
+        with self._lock:
+            self._load()
+            return list(dict.fromkeys(d for d, _ in self._blocks))
+
+    def last_date(self) -> str | None:
+        with self._lock:
+            self._load()
+            return self._blocks[-1][0] if self._blocks else None
+
+    def read(self, **read_csv_kwargs: Any) -> pd.DataFrame:
+        """The full history (same as pd.read_csv on the CSV)."""
+        with self._lock:
+            self._load()
+            return pd.read_csv(self.path, **read_csv_kwargs)
+
+    def read_day(self, date: str) -> pd.DataFrame:
+        """Rows for one date, reading only that date's block(s)."""
+        with self._lock:
+            self._load()
+            if self._header is None:
+                return pd.DataFrame()
+            size = self._stamp()[0]  # type: ignore[index]
+            chunks: list[bytes] = []
+            with open(self.path, "rb") as fh:
+                for i, (d, start) in enumerate(self._blocks):
+                    if d != str(date):
+                        continue
+                    end = self._blocks[i + 1][1] if i + 1 < len(self._blocks) else size
+                    fh.seek(start)
+                    chunks.append(fh.read(end - start))
+            if not chunks:
+                return pd.DataFrame(columns=self._header)
+            return pd.read_csv(io.BytesIO(b"".join(chunks)), header=None, names=self._header)
+
+    # ----- writes -----
+
+    def replace_day(self, date: str, rows: pd.DataFrame) -> None:
+        """Drop every existing row for `date`, then add `rows` at the end of the history."""
+        date = str(date)
+        with self._lock:
+            self._load()
+            hits = [i for i, (d, _) in enumerate(self._blocks) if d == date]
+            tail_only = hits == [len(self._blocks) - 1]
+            if self._header is None or (hits and not tail_only) or not set(rows.columns) <= set(self._header):
+                self._rewrite(date, rows)
+                return
+            if tail_only:
+                self._write_tail(self._blocks[-1][1], rows, keep_blocks=len(self._blocks) - 1)
+            else:
+                self._write_tail(self._stamp()[0], rows, keep_blocks=len(self._blocks))  # type: ignore[index]
+
+    def append(self, rows: pd.DataFrame) -> None:
+        """Add rows after the existing history without replacing anything."""
+        with self._lock:
+            self._load()
+            if self._header is None or not set(rows.columns) <= set(self._header):
+                self._rewrite(None, rows)
+                return
+            self._write_tail(self._stamp()[0], rows, keep_blocks=len(self._blocks))  # type: ignore[index]
+
+    def _write_tail(self, offset: int, rows: pd.DataFrame, keep_blocks: int) -> None:
+        assert self._header is not None
+        block = rows.reindex(columns=self._header).to_csv(header=False, index=False, lineterminator="\n")
+        if offset > 0:
+            with open(self.path, "rb") as fh:
+                fh.seek(offset - 1)
+                if fh.read(1) != b"\n":
+                    block = "\n" + block
+        _atomic_write_text(self.journal_path, json.dumps({"offset": offset, "block": block}))
+        self._apply_tail(offset, block)
+
+        blocks = self._blocks[:keep_blocks]
+        pos = offset + (1 if block.startswith("\n") else 0)
+        for line in block.lstrip("\n").splitlines(keepends=True):
+            date = _first_field(line.encode("utf-8"))
+            if not blocks or blocks[-1][0] != date:
+                blocks.append((date, pos))
+            pos += len(line.encode("utf-8"))
+        self._blocks = blocks
+        self._save_index()
+        self.journal_path.unlink(missing_ok=True)
+
+    def _rewrite(self, drop_date: str | None, rows: pd.DataFrame) -> None:
+        """Slow path: rewrite the whole CSV atomically and rebuild the index."""
+        if self.path.exists() and self.path.stat().st_size > 0:
+            existing = pd.read_csv(self.path)
+            if drop_date is not None and "Date" in existing:
+                existing = existing[existing["Date"].astype(str) != drop_date]
+            out = pd.concat([existing, rows], ignore_index=True) if not existing.empty else rows
+        else:
+            out = rows
+        _atomic_write_text(self.path, out.to_csv(index=False, lineterminator="\n"))
+        self.rebuild_index()
+
+
+_histories: dict[Path, PortfolioHistory] = {}
+_histories_lock = threading.Lock()
+
+
+def get_history(csv_path: Path | str) -> PortfolioHistory:
+    """Shared PortfolioHistory per CSV path, so concurrent writers in one process serialize."""
+    key = Path(csv_path).resolve()
+    with _histories_lock:
+        hist = _histories.get(key)
+        if hist is None:
+            hist = _histories[key] = PortfolioHistory(key)
+        return hist
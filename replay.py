@@ -0,0 +1,224 @@
+"""Replay a portfolio over a range of past trading days.
+
+Instead of looping `set_asof` + `process_portfolio` (one network round-trip per ticker per
+day), the replay fetches every bar for the range in a single download_price_data_many call
+(served from the SQLite cache or recorded fixtures when available), lays them out as a
+(day, ticker, OHLC) array and steps through the NYSE sessions in memory:
+
+1. the day's scheduled orders fill with the batch-order rules (sells first, then buys);
+2. stop-losses trigger and holdings are marked to market exactly as in process_portfolio;
+3. the next day starts from what a live run would reload from the CSV (whole shares,
+   cash rounded to cents).
+
+The result is the portfolio history and trade log in the usual CSV layouts.
+
+Usage:
+    python replay.py --start 2025-06-27 --end 2025-12-26 --cash 100 \\
+        --orders schedule.json --out-dir replay_out
+
+schedule.json maps dates to order lists (same order format as trading_script.py --orders);
+an order dated on a weekend or holiday executes on the next session:
+    {"2025-06-30": [{"action": "buy", "type": "moo", "ticker": "ABCD", "shares": 10, "stop_loss": 4.5}]}
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from market_calendar import get_calendar
+from portfolio import Portfolio
+from storage import PORTFOLIO_FILE, TRADE_LOG_COLUMNS, TRADE_LOG_FILE, open_storage
+from trading_script import (
+    Order,
+    download_price_data_many,
+    fill_orders,
+    portfolio_day_rows,
+    set_market_data_mode,
+    value_positions,
+)
+
+OrderSchedule = dict[str, list[Order]]
+
+
+@dataclass
+class ReplayResult:
+    history: pd.DataFrame        # chatgpt_portfolio_update.csv rows for every session
+    trades: pd.DataFrame         # chatgpt_trade_log.csv rows
+    portfolio: pd.DataFrame      # holdings after the last session
+    cash: float
+
+    @property
+    def final_equity(self) -> float:
+        totals = self.history[self.history["Ticker"] == "TOTAL"]
+        return float(totals["Total Equity"].iloc[-1]) if not totals.empty else self.cash
+
+    def save(self, data_dir: Path | str, storage: str = "csv") -> None:
+        """Write the history and trade log into `data_dir` with the chosen backend."""
+        data_dir = Path(data_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        store = open_storage(storage, data_dir / PORTFOLIO_FILE, data_dir / TRADE_LOG_FILE)
+        store.write_history(self.history)
+        store.write_trades(self.trades)
+
+
+def load_order_schedule(path: Path | str) -> OrderSchedule:
+    """{"YYYY-MM-DD": [order, ...], ...} from a JSON file."""
+    raw = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path}: expected an object mapping dates to lists of orders")
+    schedule: OrderSchedule = {}
+    for date, orders in raw.items():
+        if not isinstance(orders, list):
+            raise ValueError(f"{path}: orders for {date} must be a list")
+        day = pd.Timestamp(date).date().isoformat()
+        schedule.setdefault(day, []).extend(Order.from_dict(o, i) for i, o in enumerate(orders))
+    return schedule
+
+
+def _bar_cube(prices: dict[str, pd.DataFrame], tickers: list[str], sessions: pd.DatetimeIndex) -> np.ndarray:
+    """(sessions, tickers, 4) Open/High/Low/Close array; NaN where a ticker has no bar."""
+    cube = np.full((len(sessions), len(tickers), 4), np.nan)
+    for j, ticker in enumerate(tickers):
+        df = prices.get(ticker)
+        if df is None or df.empty:
+            continue
+        idx = pd.DatetimeIndex(df.index)
+        if idx.tz is not None:
+            idx = idx.tz_localize(None)
+        df = df.set_axis(idx.normalize())
+        df = df[~df.index.duplicated(keep="last")]
+        frame = df.reindex(index=sessions, columns=["Open", "High", "Low", "Close"])
+        cube[:, j, :] = frame.to_numpy(dtype=float)
+    # A missing Open fills at the Close, as in latest_bars
+    cube[:, :, 0] = np.where(np.isnan(cube[:, :, 0]), cube[:, :, 3], cube[:, :, 0])
+    return cube
+
+
+def _align_schedule(schedule: OrderSchedule | None, sessions: pd.DatetimeIndex,
+                    report: Callable[[str], None]) -> dict[int, list[Order]]:
+    """Session index -> orders; orders on non-session days move to the next session."""
+    by_day: dict[int, list[Order]] = {}
+    if not schedule:
+        return by_day
+    days = sessions.values.astype("datetime64[D]")
+    for date in sorted(schedule):
+        pos = int(np.searchsorted(days, np.datetime64(date, "D"), side="left"))
+        if pos >= len(days) or np.datetime64(date, "D") < days[0]:
+            report(f"Orders for {date} fall outside the replay range; skipped.")
+            continue
+        by_day.setdefault(pos, []).extend(schedule[date])
+    return by_day
+
+
+def replay(
+    start: str | pd.Timestamp,
+    end: str | pd.Timestamp,
+    portfolio: pd.DataFrame | list[dict[str, Any]] | Portfolio | None = None,
+    cash: float = 0.0,
+    schedule: OrderSchedule | None = None,
+    prices: dict[str, pd.DataFrame] | None = None,
+    report: Callable[[str], None] | None = None,
+) -> ReplayResult:
+    """
+    Step `portfolio` and `cash` through every NYSE session in [start, end].
+
+    `prices` (ticker -> daily OHLC frame) skips the fetch; otherwise every ticker that is
+    held or ordered is downloaded once for the whole range, unadjusted, as the live run uses.
+    `report` receives the per-order and stop-loss messages (silent by default).
+    """
+    report = report or (lambda _msg: None)
+    sessions = get_calendar().sessions_in_range(start, pd.Timestamp(end) + pd.Timedelta(days=1))
+    if sessions.empty:
+        raise ValueError(f"No trading sessions between {start} and {end}")
+
+    book = Portfolio.from_frame(portfolio)
+    by_day = _align_schedule(schedule, sessions, report)
+    tickers = list(dict.fromkeys(
+        [t.upper() for t in book.tickers()] + [o.ticker for orders in by_day.values() for o in orders]
+    ))
+    if prices is None:
+        fetched = download_price_data_many(
+            tickers, start=sessions[0], end=sessions[-1] + pd.Timedelta(days=1), auto_adjust=False, progress=False
+        ) if tickers else {}
+        prices = {t: fetch.df for t, fetch in fetched.items()}
+    else:
+        prices = {str(t).upper(): df for t, df in prices.items()}
+    cube = _bar_cube(prices, tickers, sessions)
+    has_bar = ~np.isnan(cube[:, :, 3])
+    column = {t: j for j, t in enumerate(tickers)}
+
+    history: list[pd.DataFrame] = []
+    trades: list[dict[str, Any]] = []
+    holdings = book.to_frame()
+    for d, session in enumerate(sessions):
+        today = session.date().isoformat()
+        orders = by_day.get(d)
+        if orders:
+            cols = [column[o.ticker] for o in orders]
+            sources = {o.ticker: "replay" for o in orders}
+            cash, rows, _ = fill_orders(orders, book, cash, cube[d, cols], has_bar[d, cols], today, sources, report)
+            trades.extend(rows)
+            holdings = book.to_frame()
+
+        cols = [column[str(t).upper()] for t in holdings["ticker"]]
+        valuation = value_positions(holdings, cube[d, cols], has_bar[d, cols], today)
+        for ticker in valuation.sells["Ticker"]:
+            report(f"{today}: {ticker} stop loss was met. Selling all shares.")
+        if valuation.sold.any():
+            cash = valuation.settle(cash)
+            trades.extend(valuation.sells.to_dict(orient="records"))
+        history.append(portfolio_day_rows(valuation, cash, today))
+
+        # Tomorrow starts from what a live run would reload from today's CSV rows
+        kept = valuation.results[~valuation.sold]
+        holdings = pd.DataFrame({
+            "ticker": kept["Ticker"].to_numpy(),
+            "shares": pd.to_numeric(kept["Shares"], errors="coerce").to_numpy(dtype=float),
+            "stop_loss": pd.to_numeric(kept["Stop Loss"], errors="coerce").to_numpy(dtype=float),
+            "buy_price": pd.to_numeric(kept["Buy Price"], errors="coerce").to_numpy(dtype=float),
+            "cost_basis": pd.to_numeric(kept["Cost Basis"], errors="coerce").to_numpy(dtype=float),
+        })
+        book = Portfolio.from_frame(holdings)
+        cash = round(cash, 2)
+
+    trade_log = pd.DataFrame(trades)
+    extra = [c for c in trade_log.columns if c not in TRADE_LOG_COLUMNS]
+    return ReplayResult(
+        history=pd.concat(history, ignore_index=True),
+        trades=trade_log.reindex(columns=TRADE_LOG_COLUMNS + extra),
+        portfolio=holdings,
+        cash=cash,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a portfolio over past trading days")
+    parser.add_argument("--start", required=True, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--cash", type=float, default=100.0, help="Starting cash")
+    parser.add_argument("--holdings", default=None, metavar="JSON",
+                        help="Starting holdings: list of {ticker, shares, buy_price, cost_basis, stop_loss}")
+    parser.add_argument("--orders", default=None, metavar="JSON", help="Order schedule: {date: [orders]}")
+    parser.add_argument("--out-dir", default="replay_out", help="Where the history and trade log are written")
+    parser.add_argument("--storage", default="csv", choices=["csv", "parquet"], help="Output format")
+    parser.add_argument("--replay-fixtures", default=None, metavar="DIR", help="Serve all market data from DIR (no network)")
+    parser.add_argument("--verbose", action="store_true", help="Print every fill and stop-loss")
+    args = parser.parse_args()
+
+    if args.replay_fixtures:
+        set_market_data_mode("replay", args.replay_fixtures)
+    holdings = json.loads(Path(args.holdings).read_text(encoding="utf-8")) if args.holdings else None
+    schedule = load_order_schedule(args.orders) if args.orders else None
+
+    result = replay(args.start, args.end, holdings, args.cash, schedule, report=print if args.verbose else None)
+    result.save(args.out_dir, args.storage)
+    sessions = int((result.history["Ticker"] == "TOTAL").sum())
+    print(f"Replayed {sessions} sessions, {len(result.trades)} trades. "
+          f"Final equity ${result.final_equity:,.2f}. Output in {args.out_dir}")
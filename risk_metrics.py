@@ -0,0 +1,433 @@
+"""Incrementally maintained risk metrics for the TOTAL-equity series.
+
+`RiskState` keeps the sufficient statistics behind every number daily_results reports, so
+adding a day costs O(1) no matter how long the history is:
+
+- equity peak, max drawdown and its date;
+- count, running mean and sum of squared deviations of daily returns (Welford), the sum of
+  squared downside deviations below the daily risk-free rate, and the compounded growth;
+- count, means and co-moments of (market excess, portfolio excess) return pairs, which give
+  the CAPM beta, alpha and R² of a least-squares fit without the raw series;
+- the same counts, means and co-moments against each configured benchmark (IWO, XBI, ...),
+  which also give the tracking error (the spread of portfolio minus benchmark returns);
+- the ^GSPC closes at the start and end of the window, for the "$X in the S&P 500" line;
+- the last RECENT_DAYS (date, equity, market return) points, for the rolling-window report.
+
+Days are first *staged* (date and equity only, when the history is written), then
+*settled* once the market returns for those days are known. The last settled day can be
+replaced (re-running the same date) by keeping the state from before it.
+
+Every fit is the closed-form simple regression on those co-moments (`_fit_table`, all
+benchmarks in one vectorized step); there is no separate least-squares solve.
+`full_risk_metrics` is the original whole-series computation and `full_benchmark_metrics`
+rebuilds the co-moments from the aligned return series; they are the references the
+incremental state is checked against.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+RF_ANNUAL = 0.045
+TRADING_DAYS = 252
+RECENT_DAYS = 121     # equity points kept for the rolling report (a 120-day window of returns)
+STATE_FORMAT = 3
+
+
+def daily_risk_free(rf_annual: float) -> float:
+    return (1 + rf_annual) ** (1 / TRADING_DAYS) - 1
+
+
+def _ratio(a: float, b: float) -> float:
+    """a / b with float semantics (inf/nan) instead of ZeroDivisionError, as pandas does."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(np.float64(a) / np.float64(b))
+
+
+def close_returns(closes: pd.DataFrame) -> pd.DataFrame:
+    """Daily returns of each close column over its own trading days (gaps are skipped, not filled)."""
+    return pd.DataFrame({c: closes[c].dropna().astype(float).sort_index().pct_change() for c in closes.columns})
+
+
+@dataclass
+class RiskState:
+    format: int = STATE_FORMAT
+    rf_annual: float = RF_ANNUAL
+    first_date: str | None = None
+    last_date: str | None = None
+    last_equity: float = math.nan
+    days: int = 0                      # equity points applied
+    peak: float = math.nan
+    max_drawdown: float = 0.0
+    mdd_date: str | None = None
+    # Daily returns
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    downside_sq: float = 0.0
+    growth: float = 1.0
+    n_finite: int = 0
+    # (market excess, portfolio excess) pairs
+    capm_n: int = 0
+    mean_x: float = 0.0
+    mean_y: float = 0.0
+    cxx: float = 0.0
+    cyy: float = 0.0
+    cxy: float = 0.0
+    # The same statistics per benchmark: [n, mean_x, mean_y, cxx, cyy, cxy] in `benchmarks` order
+    benchmarks: list[str] = field(default_factory=list)
+    bench: list[list[float]] = field(default_factory=list)
+    # ^GSPC closes at the first and last date
+    market_start_close: float | None = None
+    market_last_close: float | None = None
+    # Last RECENT_DAYS [date, equity, market return or None]
+    recent: list[list[Any]] = field(default_factory=list)
+    # Staged (date, equity) days waiting for their market returns
+    pending: list[list[Any]] = field(default_factory=list)
+    # Settled fields from before `last_date` was applied (so that day can be replaced)
+    previous: dict[str, Any] | None = None
+
+    # ----- persistence -----
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "RiskState":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+    @classmethod
+    def load(cls, data: dict[str, Any] | None) -> "RiskState | None":
+        """from_dict for a saved state, or None when there is none or it has an older layout."""
+        if data is None or data.get("format") != STATE_FORMAT:
+            return None
+        return cls.from_dict(data)
+
+    def _settled(self) -> dict[str, Any]:
+        state = self.to_dict()
+        state.pop("pending")
+        state.pop("previous")
+        return state
+
+    # ----- updates -----
+
+    def latest_date(self) -> str | None:
+        return self.pending[-1][0] if self.pending else self.last_date
+
+    def market_needed_from(self) -> str | None:
+        """First date whose market close settle() needs (the day before the staged days)."""
+        first_pending = self.pending[0][0] if self.pending else None
+        if self.market_start_close is None:
+            return self.first_date or first_pending
+        return self.last_date or first_pending
+
+    def stage(self, date: str, equity: float) -> bool:
+        """
+        Queue `date`'s TOTAL equity. Returns False when the state cannot follow the change
+        (an older date, or a non-finite equity); the caller should then rebuild it.
+        """
+        date, equity = str(date), float(equity)
+        if not math.isfinite(equity):
+            return False
+        latest = self.latest_date()
+        if self.pending and date == latest:
+            self.pending[-1] = [date, equity]
+            return True
+        if latest is None or date > latest:
+            self.pending.append([date, equity])
+            return True
+        if date == self.last_date and self.previous is not None:
+            kept = self.previous
+            for name, value in kept.items():
+                setattr(self, name, value)
+            self.previous = None
+            self.pending = [[date, equity]]
+            return True
+        return False
+
+    def settle(self, market_close: pd.Series | None = None, benchmark_closes: pd.DataFrame | None = None) -> None:
+        """
+        Apply the staged days. `market_close` (^GSPC closes by date) and `benchmark_closes`
+        (one column per name in `benchmarks`) should cover the day before the first staged
+        date through the last; a day without a market or benchmark return adds no CAPM pair
+        for it, as in the full computation.
+        """
+        if not self.pending:
+            return
+        market = pd.Series(dtype=float) if market_close is None else market_close.dropna().astype(float).sort_index()
+        market_ret = market.pct_change()
+        if len(self.bench) != len(self.benchmarks):
+            self.bench = [[0.0] * 6 for _ in self.benchmarks]
+        dates = pd.DatetimeIndex([pd.Timestamp(d) for d, _ in self.pending])
+        closes = benchmark_closes if benchmark_closes is not None else pd.DataFrame(index=dates)
+        bench_ret = close_returns(closes).reindex(index=dates, columns=self.benchmarks).to_numpy(dtype=float)
+        for (date, equity), bench_r in zip(self.pending, bench_ret):
+            self.previous = self._settled()
+            m = market_ret.get(pd.Timestamp(date))
+            self._apply(date, float(equity), None if m is None or pd.isna(m) else float(m), bench_r)
+        self.pending = []
+        if not market.empty:
+            if self.market_start_close is None:
+                start = market[market.index >= pd.Timestamp(self.first_date)]
+                if not start.empty:
+                    self.market_start_close = float(start.iloc[0])
+            upto = market[market.index <= pd.Timestamp(self.last_date)]
+            if not upto.empty:
+                self.market_last_close = float(upto.iloc[-1])
+
+    def _apply(
+        self, date: str, equity: float, market_return: float | None, benchmark_returns: np.ndarray | None = None
+    ) -> None:
+        if self.days == 0:
+            self.first_date = date
+            self.peak = equity
+            self.max_drawdown = 0.0
+            self.mdd_date = date
+        else:
+            rf = daily_risk_free(self.rf_annual)
+            r = _ratio(equity, self.last_equity) - 1
+            self.n += 1
+            delta = r - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (r - self.mean)
+            self.downside_sq += min(r - rf, 0.0) ** 2
+            if math.isfinite(r):
+                self.growth *= 1 + r
+                self.n_finite += 1
+            if market_return is not None:
+                x, y = market_return - rf, r - rf
+                self.capm_n += 1
+                dx = x - self.mean_x
+                self.mean_x += dx / self.capm_n
+                dy = y - self.mean_y
+                self.mean_y += dy / self.capm_n
+                self.cxx += dx * (x - self.mean_x)
+                self.cyy += dy * (y - self.mean_y)
+                self.cxy += dx * (y - self.mean_y)
+            if benchmark_returns is not None and self.bench:
+                self._apply_benchmarks(np.asarray(benchmark_returns, dtype=float) - rf, r - rf)
+        self.peak = max(self.peak, equity)
+        drawdown = _ratio(equity, self.peak) - 1
+        if drawdown < self.max_drawdown:
+            self.max_drawdown = drawdown
+            self.mdd_date = date
+        self.last_date = date
+        self.last_equity = equity
+        self.days += 1
+        self.recent.append([date, equity, market_return])
+        if len(self.recent) > RECENT_DAYS:
+            del self.recent[: len(self.recent) - RECENT_DAYS]
+
+    def _apply_benchmarks(self, x: np.ndarray, y: float) -> None:
+        """One Welford step for every benchmark with a return on this day (NaN = no pair)."""
+        n, mean_x, mean_y, cxx, cyy, cxy = np.asarray(self.bench, dtype=float).T
+        pair = ~np.isnan(x)
+        n = n + pair
+        with np.errstate(invalid="ignore"):
+            dx = np.where(pair, x - mean_x, 0.0)
+            dy = np.where(pair, y - mean_y, 0.0)
+            mean_x = mean_x + np.where(pair, dx / np.maximum(n, 1), 0.0)
+            mean_y = mean_y + np.where(pair, dy / np.maximum(n, 1), 0.0)
+            cxx = cxx + np.where(pair, dx * (x - mean_x), 0.0)
+            cyy = cyy + np.where(pair, dy * (y - mean_y), 0.0)
+            cxy = cxy + np.where(pair, dx * (y - mean_y), 0.0)
+        self.bench = np.column_stack([n, mean_x, mean_y, cxx, cyy, cxy]).tolist()
+
+    # ----- report -----
+
+    def benchmark_metrics(self, include_market: bool = False) -> pd.DataFrame:
+        """
+        Beta, annualized alpha, R², annualized tracking error and pair count per benchmark
+        (with a first ^GSPC row from the CAPM statistics when `include_market` is set).
+        """
+        names = list(self.benchmarks)
+        stats = np.asarray(self.bench, dtype=float) if self.bench else np.zeros((len(names), 6))
+        if include_market:
+            market = [self.capm_n, self.mean_x, self.mean_y, self.cxx, self.cyy, self.cxy]
+            names, stats = ["^GSPC", *names], np.vstack([market, stats.reshape(-1, 6)])
+        n, mean_x, mean_y, cxx, cyy, cxy = stats.T
+        return _fit_table(names, n, mean_x, mean_y, cxx, cyy, cxy)
+
+    def recent_series(self) -> tuple[pd.Series, pd.Series]:
+        """Equity and market returns of the last RECENT_DAYS settled days, by date."""
+        index = pd.DatetimeIndex([pd.Timestamp(d) for d, _, _ in self.recent])
+        equity = pd.Series([e for _, e, _ in self.recent], index=index, dtype=float)
+        market = pd.Series([np.nan if m is None else m for _, _, m in self.recent], index=index, dtype=float)
+        return equity, market
+
+    def metrics(self) -> dict[str, Any]:
+        """The daily_results numbers for the settled days (staged days are not included)."""
+        n = self.n
+        rf_daily = daily_risk_free(self.rf_annual)
+        rf_period = (1 + rf_daily) ** n - 1
+        std_daily = math.sqrt(self.m2 / (n - 1)) if n > 1 else math.nan
+        downside_std = math.sqrt(self.downside_sq / n) if n else math.nan
+        period_return = self.growth - 1 if self.n_finite else math.nan
+
+        def positive(x: float) -> bool:
+            return bool(x) and x > 0
+
+        beta = alpha_annual = r2 = math.nan
+        n_obs = self.capm_n if self.capm_n >= 2 else 0
+        if n_obs and self.cxx > 0:
+            beta = self.cxy / self.cxx
+            alpha_daily = self.mean_y - beta * self.mean_x
+            alpha_annual = (1 + alpha_daily) ** TRADING_DAYS - 1
+            r2 = self.cxy ** 2 / (self.cxx * self.cyy) if self.cyy > 0 else math.nan
+
+        return {
+            "as_of": self.last_date,
+            "final_equity": self.last_equity,
+            "max_drawdown": self.max_drawdown if self.days else math.nan,
+            "mdd_date": self.mdd_date,
+            "n_days": n,
+            "mean_daily": self.mean if n else math.nan,
+            "std_daily": std_daily,
+            "downside_std": downside_std,
+            "period_return": period_return,
+            "sharpe_period": (period_return - rf_period) / (std_daily * math.sqrt(n)) if positive(std_daily) else math.nan,
+            "sharpe_annual": (self.mean - rf_daily) / std_daily * math.sqrt(TRADING_DAYS) if positive(std_daily) else math.nan,
+            "sortino_period": (period_return - rf_period) / (downside_std * math.sqrt(n)) if positive(downside_std) else math.nan,
+            "sortino_annual": (self.mean - rf_daily) / downside_std * math.sqrt(TRADING_DAYS) if positive(downside_std) else math.nan,
+            "beta": beta,
+            "alpha_annual": alpha_annual,
+            "r2": r2,
+            "n_obs": n_obs,
+            "market_start_close": self.market_start_close,
+            "market_last_close": self.market_last_close,
+        }
+
+
+def full_risk_metrics(
+    equity: pd.Series, market_close: pd.Series | None = None, rf_annual: float = RF_ANNUAL
+) -> dict[str, Any]:
+    """The same numbers as RiskState.metrics, recomputed from the whole equity series."""
+    equity = equity.astype(float).sort_index()
+    running_max = equity.cummax()
+    drawdowns = (equity / running_max) - 1.0
+    r = equity.pct_change().dropna()
+    n_days = len(r)
+
+    rf_daily = daily_risk_free(rf_annual)
+    rf_period = (1 + rf_daily) ** n_days - 1
+    mean_daily = float(r.mean()) if n_days else math.nan
+    std_daily = float(r.std(ddof=1)) if n_days else math.nan
+    downside = (r - rf_daily).clip(upper=0)
+    downside_std = float((downside.pow(2).mean()) ** 0.5) if not downside.empty else np.nan
+    finite = r[np.isfinite(r)]
+    period_return = float(np.prod(1 + finite.to_numpy())) - 1 if len(finite) else math.nan
+
+    sharpe_period = (period_return - rf_period) / (std_daily * np.sqrt(n_days)) if std_daily > 0 else np.nan
+    sharpe_annual = ((mean_daily - rf_daily) / std_daily) * np.sqrt(TRADING_DAYS) if std_daily > 0 else np.nan
+    sortino_period = (period_return - rf_period) / (downside_std * np.sqrt(n_days)) if downside_std and downside_std > 0 else np.nan
+    sortino_annual = ((mean_daily - rf_daily) / downside_std) * np.sqrt(TRADING_DAYS) if downside_std and downside_std > 0 else np.nan
+
+    beta = alpha_annual = r2 = np.nan
+    n_obs = 0
+    start_close = last_close = None
+    if market_close is not None and not market_close.dropna().empty:
+        market = market_close.dropna().astype(float).sort_index()
+        mkt_ret = market.pct_change().dropna()
+        common_idx = r.index.intersection(list(mkt_ret.index))
+        if len(common_idx) >= 2:
+            x = np.asarray(mkt_ret.reindex(common_idx) - rf_daily, dtype=float)
+            y = np.asarray(r.reindex(common_idx) - rf_daily, dtype=float)
+            n_obs = x.size
+            if float(np.std(x, ddof=1)) > 0:
+                beta, alpha_daily = np.polyfit(x, y, 1)
+                alpha_annual = (1 + float(alpha_daily)) ** TRADING_DAYS - 1
+                r2 = float(np.corrcoef(x, y)[0, 1] ** 2)
+        window = market[(market.index >= equity.index.min()) & (market.index <= equity.index.max())]
+        if not window.empty:
+            start_close, last_close = float(window.iloc[0]), float(window.iloc[-1])
+
+    return {
+        "as_of": equity.index.max().date().isoformat() if len(equity) else None,
+        "final_equity": float(equity.iloc[-1]) if len(equity) else math.nan,
+        "max_drawdown": float(drawdowns.min()) if len(equity) else math.nan,
+        "mdd_date": drawdowns.idxmin().date().isoformat() if len(equity) else None,
+        "n_days": n_days,
+        "mean_daily": mean_daily,
+        "std_daily": std_daily,
+        "downside_std": downside_std,
+        "period_return": period_return,
+        "sharpe_period": sharpe_period,
+        "sharpe_annual": sharpe_annual,
+        "sortino_period": sortino_period,
+        "sortino_annual": sortino_annual,
+        "beta": float(beta),
+        "alpha_annual": float(alpha_annual),
+        "r2": float(r2),
+        "n_obs": n_obs,
+        "market_start_close": start_close,
+        "market_last_close": last_close,
+    }
+
+
+def _fit_table(
+    names: list[str], n: np.ndarray, mean_x: np.ndarray, mean_y: np.ndarray,
+    cxx: np.ndarray, cyy: np.ndarray, cxy: np.ndarray,
+) -> pd.DataFrame:
+    """Closed-form simple regressions from (centred) co-moments, for all benchmarks at once."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fit = (n >= 2) & (cxx > 0)
+        beta = np.where(fit, cxy / cxx, np.nan)
+        alpha_daily = mean_y - beta * mean_x
+        r2 = np.where(fit & (cyy > 0), cxy * cxy / (cxx * cyy), np.nan)
+        active_var = np.maximum(cyy + cxx - 2 * cxy, 0.0) / (n - 1)
+        tracking = np.where(n >= 2, np.sqrt(active_var * TRADING_DAYS), np.nan)
+        return pd.DataFrame(
+            {
+                "beta": beta,
+                "alpha_annual": (1 + alpha_daily) ** TRADING_DAYS - 1,
+                "r2": r2,
+                "tracking_error": tracking,
+                "n_obs": np.where(n >= 2, n, 0).astype(int),
+            },
+            index=pd.Index(list(names), name="benchmark"),
+        )
+
+
+def full_benchmark_metrics(
+    equity: pd.Series, benchmark_closes: pd.DataFrame, rf_annual: float = RF_ANNUAL
+) -> pd.DataFrame:
+    """
+    The same table as RiskState.benchmark_metrics, from the co-moments of the whole aligned
+    return series (a day a benchmark has no return for drops out of that benchmark only).
+    """
+    equity = equity.astype(float).sort_index()
+    r = equity.pct_change().dropna()
+    names = list(benchmark_closes.columns)
+    rf = daily_risk_free(rf_annual)
+    x = close_returns(benchmark_closes).reindex(index=r.index, columns=names).to_numpy(dtype=float) - rf  # (n, K)
+    y = np.broadcast_to((r.to_numpy(dtype=float) - rf)[:, None], x.shape)
+    pair = ~np.isnan(x)
+    n = pair.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x = np.where(pair, x, 0.0).sum(axis=0) / n
+        mean_y = np.where(pair, y, 0.0).sum(axis=0) / n
+        dx = np.where(pair, x - mean_x, 0.0)
+        dy = np.where(pair, y - mean_y, 0.0)
+    return _fit_table(names, n, mean_x, mean_y, (dx * dx).sum(axis=0), (dy * dy).sum(axis=0), (dx * dy).sum(axis=0))
+
+
+def compare_metrics(a: dict[str, Any], b: dict[str, Any], rel_tol: float = 1e-9, abs_tol: float = 1e-12) -> dict[str, tuple[Any, Any]]:
+    """Keys whose values differ beyond float tolerance (NaN equals NaN)."""
+    diffs: dict[str, tuple[Any, Any]] = {}
+    for key in a.keys() | b.keys():
+        x, y = a.get(key), b.get(key)
+        if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+            if math.isnan(x) and math.isnan(y):
+                continue
+            if math.isclose(x, y, rel_tol=rel_tol, abs_tol=abs_tol):
+                continue
+        elif x == y:
+            continue
+        diffs[key] = (x, y)
+    return diffs
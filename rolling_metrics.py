@@ -0,0 +1,188 @@
+"""Rolling-window risk metrics over equity series.
+
+For every trailing window (20/60/120 sessions by default) and every session:
+
+- volatility     annualized standard deviation of daily returns
+- sharpe         annualized (mean return - daily risk-free) / std, as in daily_results
+- sortino        the same over the downside deviation below the daily risk-free rate
+- beta, alpha    least-squares fit of excess returns on ^GSPC excess returns (alpha annualized)
+- drawdown       equity below the highest equity of the window
+
+plus the full-history drawdown. The inputs may be one portfolio (a Series) or many (a
+DataFrame with one column per portfolio); everything is computed for all columns at once.
+
+Window sums come from one cumulative sum per quantity (a window sum is the difference of
+two prefix sums), so the cost is O(sessions x portfolios) whatever the window; returns are
+centred on their column mean first so the variance terms do not lose precision. The window
+high for the drawdown is a max over a strided sliding-window view. NaNs (missing days) are
+skipped; a window needs `min_periods` valid returns (default: the full window).
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from risk_metrics import RF_ANNUAL, TRADING_DAYS, daily_risk_free
+
+DEFAULT_WINDOWS = (20, 60, 120)
+METRICS = ("volatility", "sharpe", "sortino", "beta", "alpha", "drawdown")
+
+
+def _as_2d(values: np.ndarray | pd.Series | pd.DataFrame) -> np.ndarray:
+    arr = np.asarray(values, dtype=float)
+    return arr.reshape(len(arr), -1)
+
+
+def _window_sums(x: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """Trailing `window`-row sums of the non-NaN entries of x, and how many there were."""
+    valid = ~np.isnan(x)
+    prefix = np.zeros((x.shape[0] + 1, x.shape[1]))
+    np.cumsum(np.where(valid, x, 0.0), axis=0, out=prefix[1:])
+    counts = np.zeros((x.shape[0] + 1, x.shape[1]), dtype=np.int64)
+    np.cumsum(valid, axis=0, out=counts[1:])
+    lo = np.maximum(np.arange(1, x.shape[0] + 1) - window, 0)
+    return prefix[1:] - prefix[lo], counts[1:] - counts[lo]
+
+
+def _centred(x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    with np.errstate(invalid="ignore"):
+        centre = np.nanmean(x, axis=0) if x.size else np.zeros(x.shape[1])
+    centre = np.nan_to_num(centre)
+    return x - centre, centre
+
+
+def daily_returns(equity: np.ndarray) -> np.ndarray:
+    """Simple returns row over row (NaN for the first row and for non-finite results)."""
+    r = np.full_like(equity, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r[1:] = equity[1:] / equity[:-1] - 1
+    r[~np.isfinite(r)] = np.nan
+    return r
+
+
+def drawdown(equity: np.ndarray | pd.Series | pd.DataFrame) -> np.ndarray:
+    """Equity below its running high (<= 0), per column."""
+    e = _as_2d(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return e / np.fmax.accumulate(e, axis=0) - 1
+
+
+def rolling_arrays(
+    equity: np.ndarray | pd.Series | pd.DataFrame,
+    window: int,
+    market_returns: np.ndarray | pd.Series | None = None,
+    rf_annual: float = RF_ANNUAL,
+    min_periods: int | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    Rolling metrics for one window as (sessions, portfolios) arrays, keyed by METRICS
+    (beta/alpha only with `market_returns`, one value per session aligned with `equity`).
+    """
+    window = int(window)
+    if window < 2:
+        raise ValueError("Rolling windows need at least 2 sessions")
+    need = max(2, window if min_periods is None else int(min_periods))
+    e = _as_2d(equity)
+    r = daily_returns(e)
+    rf = daily_risk_free(rf_annual)
+    ann = math.sqrt(TRADING_DAYS)
+
+    total, n = _window_sums(r, window)
+    centred, _ = _centred(r)
+    c1, _ = _window_sums(centred, window)
+    c2, _ = _window_sums(centred * centred, window)
+    down2, _ = _window_sums(np.minimum(r - rf, 0.0) ** 2, window)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        enough = n >= need
+        mean = total / n
+        std = np.sqrt(np.maximum(c2 - c1 * c1 / n, 0.0) / (n - 1))
+        downside = np.sqrt(down2 / n)
+        out = {
+            "volatility": np.where(enough, std * ann, np.nan),
+            "sharpe": np.where(enough & (std > 0), (mean - rf) / std * ann, np.nan),
+            "sortino": np.where(enough & (downside > 0), (mean - rf) / downside * ann, np.nan),
+        }
+
+        if market_returns is not None:
+            m = np.asarray(market_returns, dtype=float).reshape(-1, 1)
+            pair = ~np.isnan(r) & ~np.isnan(m)
+            x, x_centre = _centred(np.where(pair, m - rf, np.nan))
+            y, y_centre = _centred(np.where(pair, r - rf, np.nan))
+            sx, k = _window_sums(x, window)
+            sy, _ = _window_sums(y, window)
+            sxx, _ = _window_sums(x * x, window)
+            sxy, _ = _window_sums(x * y, window)
+            var_x = sxx - sx * sx / k
+            beta = (sxy - sx * sy / k) / var_x
+            alpha_daily = (sy / k + y_centre) - beta * (sx / k + x_centre)
+            fit = (k >= need) & (var_x > 0)
+            out["beta"] = np.where(fit, beta, np.nan)
+            out["alpha"] = np.where(fit, (1 + alpha_daily) ** TRADING_DAYS - 1, np.nan)
+
+        # Window high over the last `window` equity points (strided view, NaNs skipped)
+        padded = np.vstack([np.full((window - 1, e.shape[1]), np.nan), e])
+        high = np.fmax.reduce(sliding_window_view(padded, window, axis=0), axis=-1)
+        _, points = _window_sums(e, window)
+        out["drawdown"] = np.where(points >= min(need, window), e / high - 1, np.nan)
+    return out
+
+
+def rolling_metrics(
+    equity: pd.Series | pd.DataFrame,
+    market_returns: pd.Series | None = None,
+    windows: Iterable[int] = DEFAULT_WINDOWS,
+    rf_annual: float = RF_ANNUAL,
+    min_periods: int | None = None,
+) -> pd.DataFrame:
+    """
+    Rolling metrics indexed like `equity`.
+
+    For a Series the columns are "<metric>_<window>d" plus "drawdown" (from the all-time
+    high); for a DataFrame (one column per portfolio) they are (portfolio, metric) pairs.
+    `market_returns` (e.g. ^GSPC closes .pct_change()) is aligned to `equity`'s index.
+    """
+    market = None if market_returns is None else market_returns.reindex(equity.index).to_numpy(dtype=float)
+    labels: list[str] = []
+    blocks: list[np.ndarray] = []
+    for w in windows:
+        arrays = rolling_arrays(equity, w, market, rf_annual, min_periods)
+        for metric in METRICS:
+            if metric in arrays:
+                labels.append(f"{metric}_{w}d")
+                blocks.append(arrays[metric])
+    labels.append("drawdown")
+    blocks.append(drawdown(equity))
+    if isinstance(equity, pd.Series):
+        return pd.DataFrame(np.column_stack(blocks), index=equity.index, columns=labels)
+    # (sessions, portfolios, metrics) -> one column per (portfolio, metric)
+    cube = np.stack(blocks, axis=2).reshape(len(equity), -1)
+    columns = pd.MultiIndex.from_product([equity.columns, labels])
+    return pd.DataFrame(cube, index=equity.index, columns=columns)
+
+
+def rolling_summary(
+    equity: pd.Series,
+    market_returns: pd.Series | None = None,
+    windows: Iterable[int] = DEFAULT_WINDOWS,
+    rf_annual: float = RF_ANNUAL,
+) -> pd.DataFrame:
+    """Latest value of each rolling metric: one row per metric, one column per window."""
+    windows = list(windows)
+    return latest_summary(rolling_metrics(equity, market_returns, windows, rf_annual), windows)
+
+
+def latest_summary(frame: pd.DataFrame, windows: Iterable[int] = DEFAULT_WINDOWS) -> pd.DataFrame:
+    """rolling_summary layout of the last row of a rolling_metrics frame (Series input)."""
+    windows = list(windows)
+    latest = frame.iloc[-1] if len(frame) else pd.Series(dtype=float)
+    metrics = [m for m in METRICS if f"{m}_{windows[0]}d" in latest.index] if windows else []
+    return pd.DataFrame(
+        {f"{w}d": [float(latest.get(f"{m}_{w}d", np.nan)) for m in metrics] for w in windows},
+        index=pd.Index(metrics, name="metric"),
+    )
@@ -0,0 +1,467 @@
+"""Sweep stop-loss policies over the book's past and current positions.
+
+Every position the experiment has held becomes a lot: the holdings on the first history
+date, plus every buy in the trade log. Each stop policy is then replayed over the same
+daily bars with the process_portfolio rules:
+
+- a stop triggers when the day's Low is at or below it;
+- the fill is the Open if the price gapped below the stop, otherwise the stop;
+- manual sells from the trade log are kept (FIFO across the ticker's lots), and the
+  recorded stop-outs are replaced by what the policy would have done.
+
+Policies:
+    fixed     stop = buy price * (1 - pct)
+    trailing  stop = highest High since entry (or the buy price) * (1 - pct), never lowered
+    atr       stop = highest High since entry - k * ATR(window) of the prior day, never lowered
+
+A stop only uses data up to the previous close, as a stop set after the close would. Lots
+are marked at the last known Close, so the equity curve is start equity + the PnL of all
+lots.
+
+The bars and lot arrays are written once into a shared-memory block. Pool workers attach
+to it, so each task only pickles the policies it evaluates.
+
+Usage:
+    python stop_sweep.py --file "Start Your Own/chatgpt_portfolio_update.csv" \\
+        --fixed 0.05:0.40:0.01 --trailing 0.05:0.40:0.01 --atr 1:6:0.25 --atr-window 10,14,20
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+from market_calendar import get_calendar
+from trading_script import (
+    STOP_LOSS_REASON,
+    download_price_data_many,
+    get_storage,
+    last_trading_date,
+    set_data_dir,
+    set_market_data_mode,
+)
+
+POLICY_KINDS = ("none", "fixed", "trailing", "atr")
+ATR_LOOKBACK_DAYS = 60   # calendar days of bars fetched before the first entry, for the ATR
+TRADING_DAYS = 252
+
+
+@dataclass(frozen=True)
+class StopPolicy:
+    kind: str          # one of POLICY_KINDS
+    value: float = 0.0 # fraction below the reference price, or the ATR multiple
+    window: int = 14   # ATR lookback (atr only)
+
+    def __post_init__(self) -> None:
+        if self.kind not in POLICY_KINDS:
+            raise ValueError(f"Unknown stop policy {self.kind!r}; expected one of {', '.join(POLICY_KINDS)}")
+
+    @property
+    def label(self) -> str:
+        if self.kind == "none":
+            return "no stop"
+        if self.kind == "atr":
+            return f"atr {self.value:g}x{self.window}"
+        return f"{self.kind} {self.value:.1%}"
+
+
+def policy_grid(
+    fixed: Iterable[float] = (),
+    trailing: Iterable[float] = (),
+    atr: Iterable[float] = (),
+    atr_windows: Iterable[int] = (14,),
+    baseline: bool = True,
+) -> list[StopPolicy]:
+    """Every combination of the given levels, with the no-stop baseline first."""
+    policies = [StopPolicy("none")] if baseline else []
+    policies += [StopPolicy("fixed", float(p)) for p in fixed]
+    policies += [StopPolicy("trailing", float(p)) for p in trailing]
+    policies += [StopPolicy("atr", float(k), int(w)) for w in atr_windows for k in atr]
+    return policies
+
+
+def parse_levels(spec: str | None) -> list[float]:
+    """"0.05,0.1" or an inclusive range "start:stop:step" -> levels."""
+    if not spec:
+        return []
+    if ":" in spec:
+        start, stop, step = (float(x) for x in spec.split(":"))
+        if step <= 0:
+            raise ValueError(f"Step must be positive in {spec!r}")
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(max(count, 0))]
+    return [float(x) for x in spec.split(",") if x.strip()]
+
+
+# ------------------------------
+# Inputs
+# ------------------------------
+
+@dataclass
+class SweepInputs:
+    """Bars and lots for a sweep; every array is shared with the pool workers as is."""
+    sessions: pd.DatetimeIndex
+    tickers: list[str]
+    bars: np.ndarray          # (4, sessions, tickers) Open/High/Low/Close, NaN without a bar
+    mark: np.ndarray          # (sessions, tickers) last known Close
+    lot_ticker: np.ndarray    # (lots,) column in `tickers`
+    lot_entry: np.ndarray     # (lots,) session index of the buy
+    lot_shares: np.ndarray    # (lots,)
+    lot_price: np.ndarray     # (lots,) buy price
+    sold_shares: np.ndarray   # (sessions, lots) shares sold manually that day
+    sold_cash: np.ndarray     # (sessions, lots) proceeds of those sells
+    first: int                # session index of the first entry; curves start here
+    start_equity: float
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "bars": self.bars, "mark": self.mark, "lot_ticker": self.lot_ticker,
+            "lot_entry": self.lot_entry, "lot_shares": self.lot_shares, "lot_price": self.lot_price,
+            "sold_shares": self.sold_shares, "sold_cash": self.sold_cash,
+        }
+
+
+def _number(frame: pd.DataFrame, column: str) -> pd.Series:
+    if column not in frame:
+        return pd.Series(np.nan, index=frame.index)
+    return pd.to_numeric(frame[column], errors="coerce")
+
+
+def load_sweep_inputs(
+    portfolio_csv: Path | str | None = None,
+    trade_log_csv: Path | str | None = None,
+    end: str | pd.Timestamp | None = None,
+    start_equity: float = 100.0,
+    prices: dict[str, pd.DataFrame] | None = None,
+) -> SweepInputs:
+    """
+    Lots from the portfolio history and trade log, with their bars up to `end` (default:
+    the last trading day). Bars come from one download_price_data_many call, so the price
+    cache and fixture modes apply, unless `prices` (ticker -> OHLC frame) is given.
+    """
+    storage = get_storage(portfolio_csv, trade_log_csv)
+    history = storage.read_history()
+    trades = storage.read_trades()
+
+    # Lots as [entry date, ticker, shares, price]; manual sells also note how many lots preceded them
+    lots: list[list] = []
+    if not history.empty:
+        dates = pd.to_datetime(history["Date"], errors="coerce")
+        first_day = history[(dates == dates.min()) & (history["Ticker"].astype(str).str.upper() != "TOTAL")]
+        for ticker, shares, price in zip(first_day["Ticker"], _number(first_day, "Shares"), _number(first_day, "Buy Price")):
+            if shares > 0 and price > 0:
+                lots.append([pd.Timestamp(dates.min()), str(ticker).upper(), float(shares), float(price)])
+    sells: list[tuple[pd.Timestamp, str, float, float, int]] = []
+    if not trades.empty:
+        when = pd.to_datetime(trades["Date"], errors="coerce")
+        bought, buy_price = _number(trades, "Shares Bought"), _number(trades, "Buy Price")
+        sold, sell_price = _number(trades, "Shares Sold"), _number(trades, "Sell Price")
+        reason = trades["Reason"].astype(str).str.strip().str.upper() if "Reason" in trades else pd.Series("", index=trades.index)
+        for i in range(len(trades)):
+            ticker = str(trades["Ticker"].iloc[i]).upper()
+            if bought.iloc[i] > 0 and buy_price.iloc[i] > 0:
+                lots.append([when.iloc[i], ticker, float(bought.iloc[i]), float(buy_price.iloc[i])])
+            elif sold.iloc[i] > 0 and reason.iloc[i] != STOP_LOSS_REASON:
+                sells.append((when.iloc[i], ticker, float(sold.iloc[i]), float(sell_price.iloc[i]), len(lots)))
+    if not lots:
+        raise ValueError("No positions found in the portfolio history or trade log")
+
+    end_ts = pd.Timestamp(end) if end is not None else last_trading_date()
+    first_entry = min(lot[0] for lot in lots)
+    sessions = get_calendar().sessions_in_range(
+        first_entry - pd.Timedelta(days=ATR_LOOKBACK_DAYS), end_ts.normalize() + pd.Timedelta(days=1)
+    )
+    days = sessions.values.astype("datetime64[D]")
+    tickers = list(dict.fromkeys(lot[1] for lot in lots))
+    column = {t: j for j, t in enumerate(tickers)}
+
+    lot_entry = np.searchsorted(days, np.array([lot[0] for lot in lots], dtype="datetime64[D]"), side="left")
+    keep = lot_entry < len(days)
+    n = len(lots)
+    lot_shares = np.array([lot[2] for lot in lots])
+    sold_shares = np.zeros((len(days), n))
+    sold_cash = np.zeros((len(days), n))
+    left = lot_shares.copy()
+    for date, ticker, shares, price, lots_before in sells:
+        day = int(np.searchsorted(days, np.datetime64(date, "D"), side="left"))
+        if day >= len(days):
+            continue
+        # FIFO over this ticker's lots bought before the sell (in trade-log order)
+        for j in range(lots_before):
+            if shares <= 0:
+                break
+            if lots[j][1] != ticker or left[j] <= 0 or lot_entry[j] > day:
+                continue
+            take = min(left[j], shares)
+            left[j] -= take
+            shares -= take
+            sold_shares[day, j] += take
+            sold_cash[day, j] += round(take * price, 2)
+
+    if prices is None:
+        fetched = download_price_data_many(
+            tickers, start=sessions[0], end=sessions[-1] + pd.Timedelta(days=1), auto_adjust=False, progress=False
+        )
+        prices = {t: fetch.df for t, fetch in fetched.items()}
+    else:
+        prices = {str(t).upper(): df for t, df in prices.items()}
+    bars = np.full((4, len(sessions), len(tickers)), np.nan)
+    for ticker, j in column.items():
+        df = prices.get(ticker)
+        if df is None or df.empty:
+            continue
+        idx = pd.DatetimeIndex(df.index)
+        if idx.tz is not None:
+            idx = idx.tz_localize(None)
+        df = df.set_axis(idx.normalize())
+        df = df[~df.index.duplicated(keep="last")]
+        bars[:, :, j] = df.reindex(index=sessions, columns=["Open", "High", "Low", "Close"]).to_numpy(dtype=float).T
+    bars[0] = np.where(np.isnan(bars[0]), bars[3], bars[0])
+    mark = pd.DataFrame(bars[3]).ffill().to_numpy()
+
+    return SweepInputs(
+        sessions=sessions,
+        tickers=tickers,
+        bars=bars,
+        mark=mark,
+        lot_ticker=np.array([column[lot[1]] for lot in lots], dtype=np.int64)[keep],
+        lot_entry=lot_entry[keep].astype(np.int64),
+        lot_shares=lot_shares[keep],
+        lot_price=np.array([lot[3] for lot in lots])[keep],
+        sold_shares=sold_shares[:, keep],
+        sold_cash=sold_cash[:, keep],
+        first=int(lot_entry[keep].min()) if keep.any() else len(days),
+        start_equity=float(start_equity),
+    )
+
+
+# ------------------------------
+# Evaluation (runs in the workers)
+# ------------------------------
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    return np.round(values, 2)
+
+
+def _atr(bars: np.ndarray, window: int) -> np.ndarray:
+    """Simple moving average of the true range, per ticker (NaN until `window` bars exist)."""
+    _, high, low, close = bars
+    prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return pd.DataFrame(true_range).rolling(window, min_periods=window).mean().to_numpy()
+
+
+def evaluate_policy(
+    policy: StopPolicy, a: dict[str, np.ndarray], start_equity: float, atr_cache: dict[int, np.ndarray] | None = None
+) -> tuple[np.ndarray, int]:
+    """Equity curve over all sessions and the number of stop-outs for one policy."""
+    bars, tix, entry = a["bars"], a["lot_ticker"], a["lot_entry"]
+    price, shares = a["lot_price"], a["lot_shares"]
+    sessions = bars.shape[1]
+    o, h, l, c = (bars[k][:, tix] for k in range(4))
+    mark = a["mark"][:, tix]
+    mark = np.where(np.isnan(mark), price, mark)
+    days = np.arange(sessions)[:, None]
+    active = days >= entry[None, :]
+
+    remaining = np.trunc(np.maximum(shares - np.cumsum(a["sold_shares"], axis=0), 0.0))
+    cash_in = np.cumsum(a["sold_cash"], axis=0)
+    cost = shares * price
+    pnl = np.where(active, cash_in + _round2(remaining * mark) - cost, 0.0)
+
+    if policy.kind == "none":
+        return start_equity + pnl.sum(axis=1), 0
+    if policy.kind == "fixed":
+        stop = np.broadcast_to(price * (1 - policy.value), (sessions, price.size))
+    else:
+        # Highest High before each day since entry, starting from the buy price
+        high_so_far = np.fmax.accumulate(np.where(active, h, np.nan), axis=0)
+        peak = np.fmax(np.vstack([np.full((1, price.size), np.nan), high_so_far[:-1]]), price)
+        if policy.kind == "trailing":
+            stop = peak * (1 - policy.value)
+        else:
+            cache = atr_cache if atr_cache is not None else {}
+            if policy.window not in cache:
+                cache[policy.window] = _atr(bars, policy.window)
+            atr = cache[policy.window][:, tix]
+            prior_atr = np.vstack([np.full((1, price.size), np.nan), atr[:-1]])
+            stop = np.fmax.accumulate(np.where(active, peak - policy.value * prior_atr, np.nan), axis=0)
+    stop = np.nan_to_num(_round2(stop), nan=0.0)
+
+    with np.errstate(invalid="ignore"):
+        triggered = active & (remaining > 0) & ~np.isnan(c) & (stop > 0) & (l <= stop)
+    hit = triggered.any(axis=0)
+    if hit.any():
+        lots = np.flatnonzero(hit)
+        day = triggered[:, lots].argmax(axis=0)
+        fill = _round2(np.where(o[day, lots] <= stop[day, lots], o[day, lots], stop[day, lots]))
+        settled = cash_in[day, lots] + _round2(remaining[day, lots] * fill) - cost[lots]
+        after = days >= day[None, :]
+        pnl[:, lots] = np.where(after, settled[None, :], pnl[:, lots])
+    return start_equity + pnl.sum(axis=1), int(hit.sum())
+
+
+_SHARED: dict[str, np.ndarray] = {}
+_SEGMENT: shared_memory.SharedMemory | None = None
+_START_EQUITY = 0.0
+_ATR_CACHE: dict[int, np.ndarray] = {}
+
+
+def _attach(name: str, layout: dict[str, tuple[int, tuple[int, ...], str]], start_equity: float) -> None:
+    """Pool initializer: map the parent's shared block as read-only arrays."""
+    global _SEGMENT, _START_EQUITY
+    _SEGMENT = shared_memory.SharedMemory(name=name)
+    _SHARED.clear()
+    _ATR_CACHE.clear()
+    for key, (offset, shape, dtype) in layout.items():
+        view = np.ndarray(shape, dtype=dtype, buffer=_SEGMENT.buf, offset=offset)
+        view.flags.writeable = False
+        _SHARED[key] = view
+    _START_EQUITY = start_equity
+
+
+def _evaluate_chunk(chunk: list[tuple[int, StopPolicy]]) -> list[tuple[int, np.ndarray, int]]:
+    return [(i, *evaluate_policy(policy, _SHARED, _START_EQUITY, _ATR_CACHE)) for i, policy in chunk]
+
+
+def _share(arrays: dict[str, np.ndarray]) -> tuple[shared_memory.SharedMemory, dict[str, tuple[int, tuple[int, ...], str]]]:
+    """Copy `arrays` into one new shared-memory block; returns it with the layout for _attach."""
+    layout: dict[str, tuple[int, tuple[int, ...], str]] = {}
+    offset = 0
+    for key, arr in arrays.items():
+        offset = -(-offset // 8) * 8
+        layout[key] = (offset, arr.shape, arr.dtype.str)
+        offset += arr.nbytes
+    segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for key, arr in arrays.items():
+        start, shape, dtype = layout[key]
+        np.ndarray(shape, dtype=dtype, buffer=segment.buf, offset=start)[...] = arr
+    return segment, layout
+
+
+# ------------------------------
+# Sweep
+# ------------------------------
+
+@dataclass
+class SweepResult:
+    policies: list[StopPolicy]
+    sessions: pd.DatetimeIndex
+    equity: np.ndarray        # (policies, sessions)
+    stop_outs: np.ndarray     # (policies,)
+
+    def curves(self) -> pd.DataFrame:
+        """Equity curves, one column per policy label."""
+        return pd.DataFrame(self.equity.T, index=self.sessions.rename("Date"), columns=[p.label for p in self.policies])
+
+    def summary(self) -> pd.DataFrame:
+        """Final equity, return, max drawdown, Sharpe and stop-outs per policy, best first."""
+        equity = self.equity
+        start = equity[:, :1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drawdown = (equity / np.maximum.accumulate(equity, axis=1) - 1).min(axis=1)
+            daily = np.diff(equity, axis=1) / equity[:, :-1]
+            std = daily.std(axis=1, ddof=1) if daily.shape[1] > 1 else np.full(len(equity), np.nan)
+            sharpe = np.where(std > 0, daily.mean(axis=1) / std * math.sqrt(TRADING_DAYS), np.nan)
+        table = pd.DataFrame({
+            "Policy": [p.label for p in self.policies],
+            "Kind": [p.kind for p in self.policies],
+            "Value": [p.value for p in self.policies],
+            "Window": [p.window if p.kind == "atr" else np.nan for p in self.policies],
+            "Final Equity": _round2(equity[:, -1]),
+            "Return %": _round2((equity[:, -1] / start[:, 0] - 1) * 100),
+            "Max Drawdown %": _round2(drawdown * 100),
+            "Sharpe": np.round(sharpe, 4),
+            "Stop-outs": self.stop_outs,
+        })
+        return table.sort_values("Final Equity", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def run_sweep(
+    inputs: SweepInputs,
+    policies: Sequence[StopPolicy],
+    workers: int | None = None,
+    chunk_size: int | None = None,
+) -> SweepResult:
+    """
+    Evaluate every policy in `policies` over `inputs` across a process pool.
+
+    `workers=1` evaluates in this process (no pool, no shared memory). Policies are handed
+    out in chunks (by default about four per worker) to keep the per-task overhead low.
+    """
+    policies = list(policies)
+    workers = max(1, workers or os.cpu_count() or 1)
+    sessions = inputs.bars.shape[1]
+    equity = np.empty((len(policies), sessions))
+    stop_outs = np.zeros(len(policies), dtype=np.int64)
+    indexed = list(enumerate(policies))
+
+    if workers == 1 or len(policies) <= 1:
+        cache: dict[int, np.ndarray] = {}
+        results = [(i, *evaluate_policy(p, inputs.arrays(), inputs.start_equity, cache)) for i, p in indexed]
+    else:
+        size = chunk_size or max(1, math.ceil(len(policies) / (workers * 4)))
+        # Group ATR windows together so each worker computes few ATR tables
+        indexed.sort(key=lambda item: (item[1].kind, item[1].window))
+        chunks = [indexed[k:k + size] for k in range(0, len(indexed), size)]
+        segment, layout = _share(inputs.arrays())
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_attach, initargs=(segment.name, layout, inputs.start_equity)
+            ) as pool:
+                results = [item for part in pool.map(_evaluate_chunk, chunks) for item in part]
+        finally:
+            segment.close()
+            segment.unlink()
+
+    for i, curve, count in results:
+        equity[i] = curve
+        stop_outs[i] = count
+    first = min(inputs.first, sessions - 1)
+    return SweepResult(policies, inputs.sessions[first:], equity[:, first:], stop_outs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare stop-loss policies on past and current holdings")
+    parser.add_argument("--file", default=None, help="Path to chatgpt_portfolio_update.csv (trade log next to it)")
+    parser.add_argument("--end", default=None, help="Last day to evaluate (default: last trading day)")
+    parser.add_argument("--fixed", default=None, help="Fixed stop levels below the buy price, e.g. 0.05:0.40:0.01")
+    parser.add_argument("--trailing", default=None, help="Trailing stop levels below the high, e.g. 0.05,0.1,0.15")
+    parser.add_argument("--atr", default=None, help="ATR multiples, e.g. 1:6:0.25")
+    parser.add_argument("--atr-window", default="14", help="ATR lookbacks, e.g. 10,14,20")
+    parser.add_argument("--start-equity", type=float, default=100.0, help="Equity the curves start from")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--top", type=int, default=15, help="Rows of the summary to print")
+    parser.add_argument("--out", default=None, help="Write the full summary to this CSV")
+    parser.add_argument("--curves", default=None, help="Write the equity curves to this CSV")
+    parser.add_argument("--replay-fixtures", default=None, metavar="DIR", help="Serve all market data from DIR (no network)")
+    args = parser.parse_args()
+
+    if args.replay_fixtures:
+        set_market_data_mode("replay", args.replay_fixtures)
+    if args.file:
+        set_data_dir(Path(args.file).resolve().parent)
+    grid = policy_grid(
+        fixed=parse_levels(args.fixed),
+        trailing=parse_levels(args.trailing),
+        atr=parse_levels(args.atr),
+        atr_windows=[int(w) for w in parse_levels(args.atr_window)],
+    )
+    inputs = load_sweep_inputs(end=args.end, start_equity=args.start_equity)
+    result = run_sweep(inputs, grid, workers=args.workers)
+    table = result.summary()
+    print(f"{len(grid)} policies, {inputs.lot_entry.size} lots, {len(result.sessions)} sessions")
+    print(table.head(args.top).to_string(index=False))
+    if args.out:
+        table.to_csv(args.out, index=False)
+    if args.curves:
+        result.curves().to_csv(args.curves)
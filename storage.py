@@ -0,0 +1,523 @@
+"""Pluggable storage for the portfolio history and the trade log.
+
+Backends:
+- "csv": chatgpt_portfolio_update.csv / chatgpt_trade_log.csv. Day replacement goes through
+  portfolio_history (indexed, in place); trade rows are appended under the existing header.
+- "parquet": typed, columnar datasets next to the CSVs (chatgpt_portfolio_update.parquet/,
+  chatgpt_trade_log.parquet/), partitioned by month (month=YYYY-MM/part-0.parquet). Replacing
+  a day rewrites only that month's file; reads fetch only the requested columns and can
+  filter on Ticker before anything is converted to pandas. Needs pyarrow.
+- "auto" (default): "parquet" when the Parquet history exists next to the CSV, else "csv".
+
+Select with PORTFOLIO_STORAGE=csv|parquet|auto, trading_script.set_data_dir(..., storage=...)
+or set_storage_backend(). Migrate existing data with:
+
+    python storage.py import --data-dir "Scripts and CSV Files"    # CSV -> Parquet (verified)
+    python storage.py export --data-dir "Scripts and CSV Files"    # Parquet -> CSV
+
+Numbers round-trip exactly; integer-valued cells come back as floats (5 -> 5.0) and blank
+cells as empty values, which is how pandas already reads them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+from portfolio_history import get_history
+
+# Optional pyarrow import; only the Parquet backend needs it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except Exception:
+    _HAS_PYARROW = False
+
+PORTFOLIO_FILE = "chatgpt_portfolio_update.csv"
+TRADE_LOG_FILE = "chatgpt_trade_log.csv"
+
+PORTFOLIO_COLUMNS = [
+    "Date", "Ticker", "Shares", "Buy Price", "Cost Basis", "Stop Loss", "Current Price",
+    "Total Value", "PnL", "Action", "Cash Balance", "Total Equity",
+]
+# Union of buy and sell columns; new logs are written in this order.
+TRADE_LOG_COLUMNS = [
+    "Date", "Ticker", "Shares Bought", "Buy Price", "Cost Basis", "PnL", "Reason", "Shares Sold", "Sell Price",
+]
+TEXT_COLUMNS = {"Date", "Ticker", "Action", "Reason"}
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+RISK_STATE_SUFFIX = ".risk.json"
+
+BACKENDS = ("csv", "parquet", "auto")
+
+
+def resolve_backend_name(name: str | None = None) -> str:
+    name = (name or os.environ.get("PORTFOLIO_STORAGE") or "auto").strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {name!r}; expected one of {', '.join(BACKENDS)}")
+    return name
+
+
+def parquet_dir_for(csv_path: Path | str) -> Path:
+    path = Path(csv_path)
+    return path.with_suffix(".parquet")
+
+
+def _csv_cell(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return value
+
+
+def _filter_tickers(df: pd.DataFrame, tickers: Iterable[str] | None) -> pd.DataFrame:
+    if tickers is None or "Ticker" not in df:
+        return df
+    return df[df["Ticker"].isin(list(tickers))].copy()
+
+
+class StorageBackend(ABC):
+    """Interface shared by the CSV and Parquet backends."""
+
+    name = "base"
+    portfolio_csv: Path
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.portfolio_csv.with_name(self.portfolio_csv.name + CHECKPOINT_SUFFIX)
+
+    @abstractmethod
+    def history_version(self) -> str | None:
+        """Cheap token that changes whenever the history is written (None if there is no history)."""
+
+    # ----- state files stamped with the history version -----
+
+    def _read_stamped(self, path: Path) -> dict[str, Any] | None:
+        """
+        The state saved at `path`, or None when it is missing, unreadable or was written
+        against a different version of the history than the one on disk now.
+        """
+        try:
+            state = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get("version") is None:
+            return None
+        if state["version"] != self.history_version():
+            return None
+        return state
+
+    def _write_stamped(self, path: Path, state: dict[str, Any]) -> None:
+        """Save `state` to `path` (atomically) stamped with the current history version."""
+        version = self.history_version()
+        if version is None:
+            path.unlink(missing_ok=True)
+            return
+        payload = json.dumps({**state, "version": version})
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+    # ----- latest-state checkpoint -----
+
+    def read_checkpoint(self) -> dict[str, Any] | None:
+        return self._read_stamped(self.checkpoint_path)
+
+    def write_checkpoint(self, state: dict[str, Any]) -> None:
+        self._write_stamped(self.checkpoint_path, state)
+
+    def drop_checkpoint(self) -> None:
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    # ----- incremental risk metrics -----
+
+    @property
+    def risk_state_path(self) -> Path:
+        return self.portfolio_csv.with_name(self.portfolio_csv.name + RISK_STATE_SUFFIX)
+
+    def read_risk_state(self) -> dict[str, Any] | None:
+        return self._read_stamped(self.risk_state_path)
+
+    def write_risk_state(self, state: dict[str, Any]) -> None:
+        self._write_stamped(self.risk_state_path, state)
+
+    def drop_risk_state(self) -> None:
+        self.risk_state_path.unlink(missing_ok=True)
+
+    # ----- history -----
+
+    @abstractmethod
+    def history_exists(self) -> bool:
+        """Whether any portfolio history has been written."""
+
+    @abstractmethod
+    def read_history(self, columns: list[str] | None = None, tickers: Iterable[str] | None = None) -> pd.DataFrame:
+        """Portfolio history rows, optionally only `columns` and rows whose Ticker is in `tickers`."""
+
+    @abstractmethod
+    def write_history(self, df: pd.DataFrame) -> None:
+        """Replace the whole history."""
+
+    @abstractmethod
+    def replace_history_day(self, date: str, rows: pd.DataFrame) -> None:
+        """Drop every row for `date`, then add `rows`."""
+
+    @abstractmethod
+    def append_history(self, rows: pd.DataFrame) -> None:
+        """Add `rows` after the existing history."""
+
+    @abstractmethod
+    def trades_exist(self) -> bool:
+        """Whether any trade log has been written."""
+
+    @abstractmethod
+    def read_trades(self, columns: list[str] | None = None) -> pd.DataFrame:
+        """Trade log rows, optionally only `columns`."""
+
+    @abstractmethod
+    def write_trades(self, df: pd.DataFrame) -> None:
+        """Replace the whole trade log."""
+
+    @abstractmethod
+    def append_trades(self, rows: list[dict[str, Any]]) -> None:
+        """Add trade rows after the existing log."""
+
+
+# ------------------------------
+# CSV backend
+# ------------------------------
+
+class CsvStorage(StorageBackend):
+    name = "csv"
+
+    def __init__(self, portfolio_csv: Path | str, trade_log_csv: Path | str | None = None) -> None:
+        self.portfolio_csv = Path(portfolio_csv)
+        self.trade_log_csv = Path(trade_log_csv) if trade_log_csv else self.portfolio_csv.with_name(TRADE_LOG_FILE)
+
+    def history_exists(self) -> bool:
+        return self.portfolio_csv.exists()
+
+    def history_version(self) -> str | None:
+        try:
+            st = self.portfolio_csv.stat()
+        except FileNotFoundError:
+            return None
+        return f"csv:{st.st_size}:{st.st_mtime_ns}"
+
+    def read_history(self, columns: list[str] | None = None, tickers: Iterable[str] | None = None) -> pd.DataFrame:
+        wanted = None
+        if columns is not None:
+            wanted = set(columns) | ({"Ticker"} if tickers is not None else set())
+        df = get_history(self.portfolio_csv).read(usecols=(lambda c: c in wanted) if wanted else None)
+        df = _filter_tickers(df, tickers)
+        return df[[c for c in columns if c in df]] if columns is not None else df
+
+    def write_history(self, df: pd.DataFrame) -> None:
+        df.to_csv(self.portfolio_csv, index=False)
+
+    def replace_history_day(self, date: str, rows: pd.DataFrame) -> None:
+        get_history(self.portfolio_csv).replace_day(date, rows)
+
+    def append_history(self, rows: pd.DataFrame) -> None:
+        get_history(self.portfolio_csv).append(rows)
+
+    def trades_exist(self) -> bool:
+        return self.trade_log_csv.exists()
+
+    def read_trades(self, columns: list[str] | None = None) -> pd.DataFrame:
+        if not self.trade_log_csv.exists():
+            return pd.DataFrame(columns=columns or TRADE_LOG_COLUMNS)
+        wanted = set(columns) if columns is not None else None
+        return pd.read_csv(self.trade_log_csv, usecols=(lambda c: c in wanted) if wanted else None)
+
+    def write_trades(self, df: pd.DataFrame) -> None:
+        df.to_csv(self.trade_log_csv, index=False)
+
+    def append_trades(self, rows: list[dict[str, Any]]) -> None:
+        """
+        Append rows in place under the file's existing header; a missing or empty file gets
+        TRADE_LOG_COLUMNS. Only a row carrying a column the header lacks forces a one-off
+        rewrite to the column union.
+        """
+        if not rows:
+            return
+        path = self.trade_log_csv
+        header = self._read_header(path)
+        extra = list(dict.fromkeys(k for row in rows for k in row if k not in (header or TRADE_LOG_COLUMNS)))
+        if header and extra:
+            # Old file without e.g. the sell columns: widen it once, then keep appending.
+            existing = pd.read_csv(path, dtype=str, keep_default_na=False)
+            header = header + extra
+            existing.reindex(columns=header).to_csv(path, index=False)
+        elif not header:
+            header = TRADE_LOG_COLUMNS + extra
+        with open(path, "a+", newline="", encoding="utf-8") as fh:
+            fh.seek(0, os.SEEK_END)
+            if fh.tell() == 0:
+                csv.writer(fh, lineterminator="\n").writerow(header)
+            else:
+                fh.seek(fh.tell() - 1)
+                if fh.read(1) != "\n":
+                    fh.write("\n")
+            writer = csv.DictWriter(fh, fieldnames=header, restval="", lineterminator="\n")
+            writer.writerows({k: _csv_cell(v) for k, v in row.items()} for row in rows)
+
+    @staticmethod
+    def _read_header(path: Path) -> list[str] | None:
+        if not path.exists():
+            return None
+        with open(path, newline="", encoding="utf-8") as fh:
+            first = next(csv.reader(fh), None)
+        return first or None
+
+
+# ------------------------------
+# Parquet backend
+# ------------------------------
+
+def typed_frame(df: pd.DataFrame, base_columns: list[str], strict: bool = False) -> pd.DataFrame:
+    """
+    Coerce a history/trade-log frame to the stored types: text columns as strings (None
+    when blank), everything else float64. With strict=True, a non-blank cell that is not a
+    number raises instead of silently becoming NaN.
+    """
+    columns = base_columns + [c for c in df.columns if c not in base_columns]
+    out = pd.DataFrame(index=df.index)
+    for col in columns:
+        src = df[col] if col in df else pd.Series(np.nan, index=df.index)
+        if col in TEXT_COLUMNS or (col not in base_columns and src.dtype == object):
+            text = src.astype(object).where(src.notna(), None)
+            out[col] = text.map(lambda v: None if v is None or v == "" else str(v))
+            continue
+        num = pd.to_numeric(src, errors="coerce")
+        if strict:
+            bad = src.notna() & (src.astype(str).str.strip() != "") & num.isna()
+            if bad.any():
+                sample = src[bad].iloc[0]
+                raise ValueError(f"Column {col!r} has non-numeric value {sample!r}; cannot store it as a number")
+        out[col] = num.astype("float64")
+    return out.reset_index(drop=True)
+
+
+def _month_key(date: Any) -> str:
+    text = str(date) if date is not None else ""
+    return text[:7] if len(text) >= 7 and text[4] == "-" else "unknown"
+
+
+class ParquetStorage(StorageBackend):
+    name = "parquet"
+    _write_lock = threading.RLock()
+
+    def __init__(self, portfolio_csv: Path | str, trade_log_csv: Path | str | None = None) -> None:
+        if not _HAS_PYARROW:
+            raise RuntimeError("Parquet storage needs pyarrow (pip install pyarrow).")
+        portfolio_csv = Path(portfolio_csv)
+        trade_log_csv = Path(trade_log_csv) if trade_log_csv else portfolio_csv.with_name(TRADE_LOG_FILE)
+        self.portfolio_csv = portfolio_csv
+        self.history_dir = parquet_dir_for(portfolio_csv)
+        self.trades_dir = parquet_dir_for(trade_log_csv)
+
+    # ----- partition helpers -----
+
+    @staticmethod
+    def _parts(root: Path) -> list[Path]:
+        return sorted(root.glob("month=*/part-0.parquet")) if root.exists() else []
+
+    @staticmethod
+    def _part_path(root: Path, month: str) -> Path:
+        return root / f"month={month}" / "part-0.parquet"
+
+    @staticmethod
+    def _bump_version(root: Path) -> None:
+        """Record that the dataset changed; history_version() reads this single small file."""
+        root.mkdir(parents=True, exist_ok=True)
+        tmp = root / "_version.tmp"
+        tmp.write_text(uuid.uuid4().hex, encoding="utf-8")
+        os.replace(tmp, root / "_version")
+
+    def _read(self, root: Path, base: list[str], columns: list[str] | None,
+              tickers: Iterable[str] | None = None) -> pd.DataFrame:
+        filters = [("Ticker", "in", list(tickers))] if tickers is not None else None
+        tables = []
+        for part in self._parts(root):
+            names = pq.read_schema(part).names
+            cols = [c for c in (columns or names) if c in names]
+            if filters is not None and "Ticker" not in names:
+                continue
+            tables.append(pq.read_table(part, columns=cols, filters=filters))
+        if not tables:
+            return pd.DataFrame(columns=columns or base)
+        table = pa.concat_tables(tables, promote_options="default")
+        df = table.to_pandas()
+        if columns is not None:
+            df = df.reindex(columns=columns)
+        return df
+
+    def _write_month(self, root: Path, month: str, df: pd.DataFrame, base: list[str]) -> None:
+        path = self._part_path(root, month)
+        if df.empty:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(typed_frame(df, base), preserve_index=False)
+        tmp = path.with_name(path.name + ".tmp")
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+
+    def _read_month(self, root: Path, month: str) -> pd.DataFrame:
+        path = self._part_path(root, month)
+        return pq.read_table(path).to_pandas() if path.exists() else pd.DataFrame()
+
+    def _write_all(self, root: Path, df: pd.DataFrame, base: list[str]) -> None:
+        with self._write_lock:
+            for part in self._parts(root):
+                part.unlink()
+            if not df.empty:
+                months = df["Date"].map(_month_key)
+                for month, chunk in df.groupby(months, sort=False):
+                    self._write_month(root, str(month), chunk, base)
+            self._bump_version(root)
+
+    def _append(self, root: Path, rows: pd.DataFrame, base: list[str], drop_date: str | None = None) -> None:
+        with self._write_lock:
+            months = rows["Date"].map(_month_key) if not rows.empty else pd.Series(dtype=str)
+            targets = set(months) | ({_month_key(drop_date)} if drop_date is not None else set())
+            for month in targets:
+                cur = self._read_month(root, month)
+                if drop_date is not None and not cur.empty:
+                    cur = cur[cur["Date"].astype(str) != str(drop_date)]
+                new = typed_frame(rows[months == month], base) if not rows.empty else pd.DataFrame()
+                frames = [f for f in (cur, new) if not f.empty]
+                merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+                self._write_month(root, month, merged, base)
+            self._bump_version(root)
+
+    # ----- history -----
+
+    def history_exists(self) -> bool:
+        return self.history_dir.exists()
+
+    def history_version(self) -> str | None:
+        try:
+            return "parquet:" + (self.history_dir / "_version").read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return "parquet:initial" if self.history_dir.exists() else None
+
+    def read_history(self, columns: list[str] | None = None, tickers: Iterable[str] | None = None) -> pd.DataFrame:
+        return self._read(self.history_dir, PORTFOLIO_COLUMNS, columns, tickers)
+
+    def write_history(self, df: pd.DataFrame) -> None:
+        self._write_all(self.history_dir, df, PORTFOLIO_COLUMNS)
+
+    def replace_history_day(self, date: str, rows: pd.DataFrame) -> None:
+        self._append(self.history_dir, rows, PORTFOLIO_COLUMNS, drop_date=str(date))
+
+    def append_history(self, rows: pd.DataFrame) -> None:
+        self._append(self.history_dir, rows, PORTFOLIO_COLUMNS)
+
+    # ----- trade log -----
+
+    def trades_exist(self) -> bool:
+        return self.trades_dir.exists()
+
+    def read_trades(self, columns: list[str] | None = None) -> pd.DataFrame:
+        return self._read(self.trades_dir, TRADE_LOG_COLUMNS, columns)
+
+    def write_trades(self, df: pd.DataFrame) -> None:
+        self._write_all(self.trades_dir, df, TRADE_LOG_COLUMNS)
+
+    def append_trades(self, rows: list[dict[str, Any]]) -> None:
+        if rows:
+            self._append(self.trades_dir, pd.DataFrame(rows), TRADE_LOG_COLUMNS)
+
+
+def open_storage(
+    name: str | None,
+    portfolio_csv: Path | str,
+    trade_log_csv: Path | str | None = None,
+) -> StorageBackend:
+    """Backend for the given CSV locations ("auto" picks Parquet when its history exists)."""
+    name = resolve_backend_name(name)
+    if name == "auto":
+        name = "parquet" if parquet_dir_for(portfolio_csv).exists() else "csv"
+    if name == "parquet":
+        return ParquetStorage(portfolio_csv, trade_log_csv)
+    return CsvStorage(portfolio_csv, trade_log_csv)
+
+
+# ------------------------------
+# CSV <-> Parquet migration
+# ------------------------------
+
+def _numeric_equal(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    for col in a.columns:
+        x, y = a[col].reset_index(drop=True), b[col].reset_index(drop=True)
+        if x.dtype == object or y.dtype == object:
+            if not x.fillna("").astype(str).equals(y.fillna("").astype(str)):
+                return False
+        elif not np.array_equal(x.to_numpy(dtype=float), y.to_numpy(dtype=float), equal_nan=True):
+            return False
+    return True
+
+
+def import_csv(data_dir: Path | str) -> None:
+    """Copy the CSV history and trade log into Parquet, then verify every value reads back."""
+    data_dir = Path(data_dir)
+    store = ParquetStorage(data_dir / PORTFOLIO_FILE, data_dir / TRADE_LOG_FILE)
+    jobs = [
+        ("portfolio history", data_dir / PORTFOLIO_FILE, PORTFOLIO_COLUMNS, store.write_history, store.read_history),
+        ("trade log", data_dir / TRADE_LOG_FILE, TRADE_LOG_COLUMNS, store.write_trades, store.read_trades),
+    ]
+    for label, csv_path, base, write, read in jobs:
+        if not csv_path.exists():
+            print(f"No {label} CSV at {csv_path}; skipped.")
+            continue
+        source = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+        typed = typed_frame(source, base, strict=True)
+        write(typed)
+        if not _numeric_equal(typed, read()):
+            raise SystemExit(f"Verification failed for {label}: the Parquet copy differs from {csv_path}.")
+        print(f"Imported {len(typed)} {label} rows into {parquet_dir_for(csv_path)}")
+
+
+def export_csv(data_dir: Path | str, out_dir: Path | str | None = None) -> None:
+    """Write the Parquet history and trade log back out as the standard CSV files."""
+    data_dir = Path(data_dir)
+    out_dir = Path(out_dir) if out_dir else data_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pq_store = ParquetStorage(data_dir / PORTFOLIO_FILE, data_dir / TRADE_LOG_FILE)
+    if pq_store.history_exists():
+        pq_store.read_history().to_csv(out_dir / PORTFOLIO_FILE, index=False)
+        print(f"Exported portfolio history to {out_dir / PORTFOLIO_FILE}")
+    if pq_store.trades_exist():
+        pq_store.read_trades().to_csv(out_dir / TRADE_LOG_FILE, index=False)
+        print(f"Exported trade log to {out_dir / TRADE_LOG_FILE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move portfolio history and trade log between CSV and Parquet")
+    parser.add_argument("command", choices=["import", "export"], help="import: CSV -> Parquet, export: Parquet -> CSV")
+    parser.add_argument("--data-dir", required=True, help="Folder holding the CSV files / Parquet datasets")
+    parser.add_argument("--out-dir", default=None, help="Where export writes the CSVs (default: --data-dir)")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        import_csv(args.data_dir)
+        print("Parquet is now picked up automatically (PORTFOLIO_STORAGE=auto). The CSVs are left as they were.")
+    else:
+        export_csv(args.data_dir, args.out_dir)
@@ -0,0 +1,92 @@
+"""Fetches ask Yahoo only for what the bar store does not cover yet, and notice rescaled prices."""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import trading_script as ts  # noqa: E402
+
+
+SCALE = {"factor": 1.0}  # Yahoo's current adjustment of past prices
+
+
+def bars(symbol: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    idx = pd.bdate_range(start, end - pd.Timedelta(days=1), name="Date")
+    v = float(sum(map(ord, symbol))) * SCALE["factor"]
+    return pd.DataFrame({"Open": v, "High": v, "Low": v, "Close": v, "Adj Close": v, "Volume": 1.0}, index=idx)
+
+
+@pytest.fixture
+def yahoo_calls(monkeypatch, tmp_path):
+    calls: list[tuple[list[str], pd.Timestamp, pd.Timestamp]] = []
+
+    def fake_download(tickers, cancel=None, start=None, end=None, **kwargs):
+        symbols = [tickers] if isinstance(tickers, str) else list(tickers)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        calls.append((sorted(symbols), start, end))
+        frames = {t: bars(t, start, end) for t in symbols}
+        if len(symbols) == 1:
+            return frames[symbols[0]]
+        return pd.concat(frames, axis=1).swaplevel(0, 1, axis=1)
+
+    monkeypatch.setattr(ts, "_yahoo_download", fake_download)
+    monkeypatch.setattr(ts, "_stooq_download", lambda t, start, end: pd.DataFrame())
+    ts._health.reset()
+    monkeypatch.setattr(ts, "BAR_STORE_PATH", tmp_path / "bars.sqlite")
+    monkeypatch.setattr(ts, "_bar_store", None)
+    monkeypatch.setitem(SCALE, "factor", 1.0)
+    yield calls
+    ts._health.reset()
+
+
+def test_warm_store_requests_only_the_uncovered_tail(yahoo_calls):
+    first = ts.download_price_data_many(["AAA", "BBB"], start="2025-06-02", end="2025-06-14")
+    assert yahoo_calls == [(["AAA", "BBB"], pd.Timestamp("2025-06-02"), pd.Timestamp("2025-06-14"))]
+    assert all(len(res.df) == 10 for res in first.values())
+
+    yahoo_calls.clear()
+    second = ts.download_price_data_many(["AAA", "BBB"], start="2025-06-02", end="2025-06-21")
+    # The tail, plus the last stored session to check it has not been rescaled
+    assert yahoo_calls == [(["AAA", "BBB"], pd.Timestamp("2025-06-13"), pd.Timestamp("2025-06-21"))]
+    assert all(len(res.df) == 15 for res in second.values())
+    assert (second["AAA"].df["Close"] == float(sum(map(ord, "AAA")))).all()
+
+
+def test_symbols_with_different_gaps_are_batched_by_gap_start(yahoo_calls):
+    ts.download_price_data_many(["AAA"], start="2025-06-02", end="2025-06-14")
+    yahoo_calls.clear()
+    out = ts.download_price_data_many(["AAA", "CCC", "DDD"], start="2025-06-02", end="2025-06-21")
+    assert yahoo_calls == [
+        (["CCC", "DDD"], pd.Timestamp("2025-06-02"), pd.Timestamp("2025-06-21")),
+        (["AAA"], pd.Timestamp("2025-06-13"), pd.Timestamp("2025-06-21")),
+    ]
+    assert [len(out[t].df) for t in ("AAA", "CCC", "DDD")] == [15, 15, 15]
+
+    yahoo_calls.clear()
+    ts.download_price_data_many(["AAA", "CCC", "DDD"], start="2025-06-02", end="2025-06-21")
+    assert yahoo_calls == []
+
+
+def test_rescaled_history_is_fetched_again(yahoo_calls):
+    ts.download_price_data_many(["AAA", "BBB"], start="2025-06-02", end="2025-06-14")
+    SCALE["factor"] = 0.5  # e.g. a 2:1 split: Yahoo now reports every past price halved
+    yahoo_calls.clear()
+    out = ts.download_price_data_many(["AAA", "BBB"], start="2025-06-02", end="2025-06-21")
+    assert yahoo_calls[0] == (["AAA", "BBB"], pd.Timestamp("2025-06-13"), pd.Timestamp("2025-06-21"))
+    assert sorted(c[0] for c in yahoo_calls[1:]) == [["AAA"], ["BBB"]]
+    assert all(c[1:] == (pd.Timestamp("2025-06-02"), pd.Timestamp("2025-06-21")) for c in yahoo_calls[1:])
+    for t in ("AAA", "BBB"):
+        assert len(out[t].df) == 15
+        assert (out[t].df["Close"] == sum(map(ord, t)) / 2).all(), out[t].df["Close"]
+
+    yahoo_calls.clear()
+    single = ts.download_price_data("AAA", start="2025-06-02", end="2025-06-21")
+    assert yahoo_calls == [] and (single.df["Close"] == sum(map(ord, "AAA")) / 2).all()
+
+    SCALE["factor"] = 0.25
+    single = ts.download_price_data("AAA", start="2025-06-02", end="2025-06-28")
+    assert len(single.df) == 20 and (single.df["Close"] == sum(map(ord, "AAA")) / 4).all()
@@ -0,0 +1,80 @@
+"""Concurrent hedged fetches must each get their own symbol's bars."""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import yfinance.multi
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import trading_script as ts  # noqa: E402
+
+START, END = pd.Timestamp("2025-06-02"), pd.Timestamp("2025-06-10")
+YAHOO_DELAY = {"SLOWA": 0.3, "SLOWB": 0.3, "FASTC": 0.0, "NEXTD": 0.6}
+
+
+def price_of(symbol: str) -> float:
+    return float(sum(map(ord, symbol)))
+
+
+def bars(symbol: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    idx = pd.bdate_range(start, end - pd.Timedelta(days=1), name="Date")
+    v = price_of(symbol)
+    return pd.DataFrame({"Open": v, "High": v, "Low": v, "Close": v, "Adj Close": v, "Volume": 1.0}, index=idx)
+
+
+class FakeTicker:
+    """Stands in for yfinance.Ticker inside yf.download, so the real shared-state code runs."""
+
+    def __init__(self, symbol: str) -> None:
+        self.symbol = symbol
+
+    def history(self, start=None, end=None, **kwargs):
+        time.sleep(YAHOO_DELAY.get(self.symbol, 0.0))
+        return bars(self.symbol, pd.Timestamp(start), pd.Timestamp(end))
+
+
+@pytest.fixture(autouse=True)
+def fake_providers(monkeypatch):
+    monkeypatch.setattr(yfinance.multi, "Ticker", FakeTicker)
+    monkeypatch.setattr(ts, "_stooq_download", lambda t, start, end: bars(t, start, end))
+    monkeypatch.setattr(ts, "YAHOO_BASE_URL", None)
+    ts._health.reset()
+    yield
+    # Let abandoned hedge losers finish while the fakes are still in place
+    pool, ts._hedge_pool = ts._hedge_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+    ts._health.reset()
+
+
+def fetch(symbol: str, out: dict, **kwargs) -> None:
+    out[symbol] = ts.download_price_data(symbol, start=START, end=END, use_cache=False, **kwargs)
+
+
+def test_concurrent_hedged_fetches_keep_their_symbols():
+    stdout = sys.stdout
+    out: dict[str, ts.FetchResult] = {}
+    threads = [
+        threading.Thread(target=fetch, args=(t, out), kwargs={"hedge_after": 0.02})
+        for t in ("SLOWA", "SLOWB", "FASTC")
+    ]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    # The losers' Yahoo calls are still running; a plain fetch started now overlaps their finish.
+    fetch("NEXTD", out)
+
+    for symbol, res in out.items():
+        close = res.df["Close"]
+        assert isinstance(close, pd.Series) and not close.empty, (symbol, res.source, list(res.df.columns))
+        assert (close == price_of(symbol)).all(), (symbol, res.source)
+    assert out["SLOWA"].source == "stooq-pdr"
+    assert out["SLOWB"].source == "stooq-pdr"
+    assert out["NEXTD"].source == "yahoo"
+    assert sys.stdout is stdout
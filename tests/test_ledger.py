@@ -0,0 +1,112 @@
+"""Folding, snapshots and seeding of the position ledger, and its check against the CSV."""
+
+import logging
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import trading_script as ts  # noqa: E402
+from ledger import Ledger, LedgerEvent  # noqa: E402
+
+HOLDINGS = pd.DataFrame({"ticker": ["ABC"], "shares": [10.0], "stop_loss": [1.0], "buy_price": [2.0], "cost_basis": [20.0]})
+
+
+def trades(n: int) -> list[LedgerEvent]:
+    events = []
+    for i in range(n):
+        day = (pd.Timestamp("2025-01-02") + pd.offsets.BDay(i)).date().isoformat()
+        if i % 3 == 2:
+            events.append(LedgerEvent("SELL", day, "XYZ", 1, 3.0 + i / 10))
+        else:
+            events.append(LedgerEvent("BUY", day, "XYZ", 2, 2.0 + i / 10, stop_loss=1.5))
+    return events
+
+
+def test_events_fold_into_holdings_and_cash(tmp_path):
+    lg = Ledger(tmp_path / "chatgpt_ledger.jsonl")
+    lg.append(LedgerEvent("OPEN", "2025-01-02", cash=100.0, positions=({"ticker": "abc", "shares": 10.7, "buy_price": 2.0, "cost_basis": 20.0},)))
+    lg.append(LedgerEvent("BUY", "2025-01-03", "XYZ", 5, 3.0, stop_loss=2.0))
+    lg.append(LedgerEvent("BUY", "2025-01-03", "ABC", 10, 4.0, stop_loss=3.0))
+    lg.append(LedgerEvent("SELL", "2025-01-06", "ABC", 5.5, 5.0))
+    lg.append(LedgerEvent("STOP", "2025-01-07", "XYZ", 5, 1.5, amount=7.5))
+
+    state = lg.latest()
+    assert state.seq == 5 and state.as_of == "2025-01-07"
+    assert state.cash == pytest.approx(100 - 15 - 40 + 27.5 + 7.5)
+    assert list(state.positions) == ["ABC"]
+    abc = state.positions["ABC"]
+    assert abc.shares == 14.0  # whole shares, as the CSV keeps them
+    assert abc.buy_price == pytest.approx(60 / 20) and abc.stop_loss == 3.0
+    assert set(lg.state_at("2025-01-03").positions) == {"ABC", "XYZ"}
+    assert lg.state_at("2024-12-31").seq == 0
+
+    with pytest.raises(ValueError):
+        lg.append(LedgerEvent("SELL", "2025-01-08", "NOPE", 1, 1.0))
+    assert Ledger(lg.path).latest().seq == 5
+
+
+@pytest.mark.parametrize("k", [0, 1, 4])
+def test_restart_from_snapshot_equals_replay_from_scratch(tmp_path, k):
+    path = tmp_path / "chatgpt_ledger.jsonl"
+    lg = Ledger(path, snapshot_every=5)
+    lg.append(LedgerEvent("OPEN", "2025-01-01", cash=1000.0))
+    events = trades(14 + k)
+    lg.append(events[:14])
+    assert lg.snapshot_path.exists()
+
+    restarted = Ledger(path, snapshot_every=5)
+    restarted.append(events[14:])
+    scratch = Ledger(path, snapshot_every=10_000)
+    assert restarted.latest().to_dict() == scratch.latest().to_dict()
+    assert Ledger(path, snapshot_every=5).latest().to_dict() == scratch.latest().to_dict()
+    for day in ("2025-01-08", "2025-01-15", "2025-01-22"):
+        assert Ledger(path, snapshot_every=5).state_at(day).to_dict() == scratch.state_at(day).to_dict()
+
+
+def test_record_seeds_an_empty_ledger_only(tmp_path, caplog):
+    lg = Ledger(tmp_path / "chatgpt_ledger.jsonl")
+    buy = LedgerEvent("BUY", "2025-01-02", "XYZ", 5, 3.0, stop_loss=2.0)
+    written = lg.record(buy, HOLDINGS, 100.0)
+    assert [e.kind for e in written] == ["OPEN", "BUY"]
+    assert written[0].positions[0]["ticker"] == "ABC" and written[0].cash == 100.0
+
+    state = lg.latest()
+    assert lg.record(LedgerEvent("SELL", "2025-01-03", "XYZ", 1, 3.0), state.to_frame(), state.cash)[0].kind == "SELL"
+
+    with caplog.at_level(logging.WARNING, logger="ledger"):
+        written = lg.record(LedgerEvent("BUY", "2025-01-06", "Q", 1, 1.0), HOLDINGS, 50.0)
+    assert [e.kind for e in written] == ["BUY"]
+    assert "XYZ missing" in caplog.text and "cash 50.00" in caplog.text
+
+
+def write_history(storage, holdings: list[tuple[str, float]], cash: float) -> None:
+    rows = [
+        {"Date": "2025-01-06", "Ticker": t, "Shares": s, "Buy Price": 2.0, "Cost Basis": 2.0 * s,
+         "Stop Loss": 1.0, "Current Price": 2.0, "Total Value": 2.0 * s, "PnL": 0.0, "Action": "HOLD",
+         "Cash Balance": "", "Total Equity": ""}
+        for t, s in holdings
+    ]
+    rows.append({"Date": "2025-01-06", "Ticker": "TOTAL", "Cash Balance": cash, "Total Equity": cash})
+    storage.write_history(pd.DataFrame(rows))
+    storage.drop_checkpoint()
+
+
+def test_history_that_disagrees_with_the_ledger_needs_a_rebase(tmp_path):
+    csv = tmp_path / "chatgpt_portfolio_update.csv"
+    storage = ts.get_storage(csv, tmp_path / "chatgpt_trade_log.csv")
+    write_history(storage, [("ABC", 10.0)], 80.0)
+    ts.get_ledger(csv).rebase(HOLDINGS, 80.0, "2025-01-06")
+    holdings, cash = ts.load_latest_portfolio_state(str(csv))
+    assert cash == 80.0 and holdings[0]["shares"] == 10
+
+    write_history(storage, [("ABC", 12.0)], 76.0)  # edited by hand
+    with pytest.raises(ts.LedgerMismatchError, match="ABC shares 12 vs ledger 10"):
+        ts.load_latest_portfolio_state(str(csv))
+    holdings, cash = ts.load_latest_portfolio_state(str(csv), rebase_ledger=True)
+    assert cash == 76.0 and holdings[0]["shares"] == 12
+    assert ts.get_ledger(csv).latest().positions["ABC"].shares == 12
+    assert ts.load_latest_portfolio_state(str(csv)) == (holdings, cash)
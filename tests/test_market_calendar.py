@@ -0,0 +1,70 @@
+"""NYSE holiday rules, special closures and early closes of the trading calendar."""
+
+import sys
+import warnings
+from datetime import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import market_calendar as mc  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def cal():
+    return mc.get_calendar()
+
+
+def test_build_emits_no_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        mc.TradingCalendar("2020-01-01", "2030-12-31")
+
+
+@pytest.mark.parametrize("day", ["2024-03-29", "2025-04-18", "2000-04-21"])
+def test_good_friday_is_closed(cal, day):
+    assert not cal.is_session(day)
+    assert cal.is_session(pd.Timestamp(day) - pd.Timedelta(days=1))
+
+
+def test_juneteenth_from_2022_on(cal):
+    assert cal.is_session("2021-06-18")           # Saturday the 19th, not yet a holiday
+    assert not cal.is_session("2022-06-20")       # Sunday the 19th, observed Monday
+    assert not cal.is_session("2023-06-19")
+    assert not cal.is_session("2026-06-19")       # Friday
+    assert not cal.is_session("2027-06-18")       # Saturday the 19th -> Friday
+
+
+def test_observed_new_year_and_christmas(cal):
+    assert not cal.is_session("2023-01-02")       # Sunday Jan 1 -> Monday
+    assert cal.is_session("2021-12-31")           # Saturday Jan 1 2022 is not moved back
+    assert not cal.is_session("2021-12-24")       # Saturday Christmas -> Friday
+    assert not cal.is_session("2022-12-26")       # Sunday Christmas -> Monday
+    assert not cal.is_session("2025-12-25")
+
+
+@pytest.mark.parametrize("day", mc.SPECIAL_CLOSURES)
+def test_special_closures(cal, day):
+    assert not cal.is_session(day)
+    assert cal.close_time(day) is None
+
+
+def test_special_closures_move_session_lookups(cal):
+    assert cal.previous_session("2001-09-14") == pd.Timestamp("2001-09-10")
+    assert cal.next_session("2012-10-29") == pd.Timestamp("2012-10-31")
+    assert cal.count_sessions("2001-09-10", "2001-09-18") == 2
+
+
+@pytest.mark.parametrize("day", ["2024-07-03", "2024-11-29", "2024-12-24", "2025-07-03", "2025-12-24"])
+def test_early_closes(cal, day):
+    assert cal.is_early_close(day)
+    assert cal.close_time(day) == time(13, 0)
+
+
+def test_early_close_candidates_that_are_not_sessions(cal):
+    assert not cal.is_early_close("2022-12-24")   # Saturday
+    assert not cal.is_early_close("2021-12-24")   # observed Christmas
+    assert cal.close_time("2024-07-05") == time(16, 0)
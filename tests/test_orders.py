@@ -0,0 +1,116 @@
+"""Orders-file parsing and the one-pass fill of a list of orders."""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import trading_script as ts  # noqa: E402
+from portfolio import Portfolio  # noqa: E402
+
+TODAY = "2025-06-03"
+
+
+def test_load_orders_accepts_a_list_or_an_orders_object(tmp_path):
+    raw = [
+        {"action": "Buy", "type": "MOO", "ticker": " abc ", "shares": "10", "stop_loss": 4.5},
+        {"action": "sell", "ticker": "xyz", "shares": 5, "limit_price": 7.1, "reason": "take profit"},
+    ]
+    path = tmp_path / "orders.json"
+    path.write_text(json.dumps(raw), encoding="utf-8")
+    orders = ts.load_orders(path)
+    assert orders == [
+        ts.Order("buy", "moo", "ABC", 10.0, None, 4.5, ""),
+        ts.Order("sell", "limit", "XYZ", 5.0, 7.1, 0.0, "take profit"),  # sells default to limit
+    ]
+    path.write_text(json.dumps({"orders": raw}), encoding="utf-8")
+    assert ts.load_orders(path) == orders
+
+    path.write_text(json.dumps({"trades": raw}), encoding="utf-8")
+    with pytest.raises(ValueError, match="expected a list of orders"):
+        ts.load_orders(path)
+
+
+@pytest.mark.parametrize("raw, message", [
+    ("buy ABC", "must be an object"),
+    ({"action": "sell", "type": "moo", "ticker": "ABC", "shares": 1}, "unsupported order"),
+    ({"action": "hold", "ticker": "ABC", "shares": 1}, "unsupported order"),
+    ({"action": "buy", "type": "moo", "ticker": "  ", "shares": 1}, "ticker is required"),
+    ({"action": "buy", "type": "moo", "ticker": "ABC"}, "must be numbers"),
+    ({"action": "buy", "type": "limit", "ticker": "ABC", "shares": 1}, "limit_price must be numbers"),
+    ({"action": "buy", "type": "limit", "ticker": "ABC", "shares": "ten", "limit_price": 1}, "must be numbers"),
+    ({"action": "buy", "type": "moo", "ticker": "ABC", "shares": 0}, "must be positive"),
+    ({"action": "buy", "type": "limit", "ticker": "ABC", "shares": 1, "limit_price": -2}, "must be positive"),
+    ({"action": "buy", "type": "moo", "ticker": "ABC", "shares": 1, "stop_loss": -1}, "stop_loss non-negative"),
+])
+def test_order_from_dict_rejects_bad_orders(raw, message):
+    with pytest.raises(ValueError, match=message) as err:
+        ts.Order.from_dict(raw, 2)
+    assert str(err.value).startswith("Order #3")
+
+
+def fill(orders, book, cash, bars, sources=None):
+    messages: list[str] = []
+    bars = np.array([bars[o.ticker] for o in orders], dtype=float)
+    has_data = ~np.isnan(bars[:, 3])
+    cash, rows, events = ts.fill_orders(orders, book, cash, bars, has_data, TODAY, sources, messages.append)
+    return cash, rows, events, messages
+
+
+def test_sells_run_before_buys_so_their_proceeds_pay_for_the_buys():
+    book = Portfolio.from_frame([{"ticker": "OLD", "shares": 10, "stop_loss": 0.0, "buy_price": 2.0, "cost_basis": 20.0}])
+    orders = [
+        ts.Order("buy", "moo", "NEW", 5, stop_loss=1.0),
+        ts.Order("sell", "limit", "OLD", 10, limit_price=3.0, reason="rotate"),
+    ]
+    bars = {"NEW": (6.0, 6.5, 5.5, 6.2), "OLD": (3.2, 3.4, 3.0, 3.1)}  # O, H, L, C
+    cash, rows, events, messages = fill(orders, book, 5.0, bars, {"NEW": "yahoo", "OLD": "yahoo"})
+
+    assert [e.kind for e in events] == ["SELL", "BUY"]
+    assert [r["Ticker"] for r in rows] == ["OLD", "NEW"]
+    assert rows[0]["Sell Price"] == 3.2 and rows[0]["PnL"] == pytest.approx(12.0)
+    assert cash == pytest.approx(5.0 + 32.0 - 30.0)
+    assert book.tickers() == ["NEW"]
+    assert messages == ["SELL LIMIT OLD filled at $3.20 (yahoo).", "BUY MOO NEW filled at $6.00 (yahoo)."]
+
+
+def test_buy_that_costs_more_than_cash_is_skipped():
+    book = Portfolio()
+    orders = [ts.Order("buy", "moo", "BIG", 10), ts.Order("buy", "limit", "SMALL", 2, limit_price=1.5)]
+    bars = {"BIG": (5.0, 5.5, 4.5, 5.2), "SMALL": (1.6, 1.7, 1.4, 1.5)}
+    cash, rows, events, messages = fill(orders, book, 20.0, bars)
+
+    assert messages[0] == "BUY MOO BIG failed: cost 50.00 exceeds cash 20.00."
+    assert [r["Ticker"] for r in rows] == ["SMALL"] and rows[0]["Buy Price"] == 1.5  # filled at the limit
+    assert cash == pytest.approx(17.0)
+    assert book.tickers() == ["SMALL"] and len(events) == 1
+
+
+def test_limit_that_is_never_reached_does_not_fill():
+    book = Portfolio.from_frame([{"ticker": "HOLD", "shares": 4, "stop_loss": 0.0, "buy_price": 2.0, "cost_basis": 8.0}])
+    orders = [
+        ts.Order("buy", "limit", "CHEAP", 3, limit_price=1.0),
+        ts.Order("sell", "limit", "HOLD", 4, limit_price=9.0),
+    ]
+    bars = {"CHEAP": (1.2, 1.3, 1.1, 1.25), "HOLD": (2.5, 2.8, 2.4, 2.6)}
+    cash, rows, events, messages = fill(orders, book, 10.0, bars)
+
+    assert cash == 10.0 and rows == [] and events == []
+    assert book.value("HOLD", "shares") == 4 and "CHEAP" not in book
+    assert messages == [
+        "SELL LIMIT HOLD limit $9.00 not reached today (range 2.40-2.80). Order not filled.",
+        "BUY LIMIT CHEAP limit $1.00 not reached today (range 1.10-1.30). Order not filled.",
+    ]
+
+
+def test_missing_data_names_an_unknown_source_unless_one_is_given():
+    orders = [ts.Order("buy", "moo", "GONE", 1)]
+    bars = {"GONE": (np.nan,) * 4}
+    *_, messages = fill(orders, Portfolio(), 10.0, bars)
+    assert messages == ["BUY MOO GONE failed: no market data available (source=unknown)."]
+    *_, messages = fill(orders, Portfolio(), 10.0, bars, {"GONE": "stooq"})
+    assert messages == ["BUY MOO GONE failed: no market data available (source=stooq)."]
@@ -0,0 +1,88 @@
+"""Tail writes, journal recovery and index rebuilds of the portfolio history CSV."""
+
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from portfolio_history import PortfolioHistory  # noqa: E402
+
+COLUMNS = ["Date", "Ticker", "Shares", "Total Equity"]
+
+
+def day(date: str, equity: float, tickers: tuple[str, ...] = ("ABC",)) -> pd.DataFrame:
+    rows = [[date, t, 10, ""] for t in tickers] + [[date, "TOTAL", "", equity]]
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def expected(*days: pd.DataFrame) -> pd.DataFrame:
+    return pd.read_csv(pd.io.common.StringIO(pd.concat(days, ignore_index=True).to_csv(index=False)))
+
+
+def make(tmp_path: Path, *days: pd.DataFrame) -> PortfolioHistory:
+    path = tmp_path / "chatgpt_portfolio_update.csv"
+    pd.concat(days, ignore_index=True).to_csv(path, index=False)
+    return PortfolioHistory(path)
+
+
+def test_new_dates_are_appended_and_older_replacements_rewrite(tmp_path):
+    d1, d2 = day("2025-06-02", 100.0), day("2025-06-03", 101.0)
+    hist = make(tmp_path, d1, d2)
+    hist.replace_day("2025-06-03", day("2025-06-03", 102.0, ("ABC", "XYZ")))
+    backfill = day("2025-05-30", 99.0)
+    hist.replace_day("2025-05-30", backfill)  # not in the file: appended at the end
+    assert hist.dates() == ["2025-06-02", "2025-06-03", "2025-05-30"]
+    pd.testing.assert_frame_equal(hist.read(), expected(d1, day("2025-06-03", 102.0, ("ABC", "XYZ")), backfill))
+
+    hist.replace_day("2025-06-02", day("2025-06-02", 98.0))  # not the last block: full rewrite
+    assert hist.dates() == ["2025-06-03", "2025-05-30", "2025-06-02"]
+    pd.testing.assert_frame_equal(hist.read_day("2025-06-02"), expected(day("2025-06-02", 98.0)))
+
+
+def test_interrupted_tail_write_is_completed_from_the_journal(tmp_path):
+    d1, d2 = day("2025-06-02", 100.0), day("2025-06-03", 101.0)
+    hist = make(tmp_path, d1, d2)
+    hist.dates()
+    offset = json.loads(hist.index_path.read_text(encoding="utf-8"))["blocks"][-1][1]
+
+    new = day("2025-06-03", 105.0, ("ABC", "XYZ"))
+    block = new.to_csv(header=False, index=False, lineterminator="\n")
+    hist.journal_path.write_text(json.dumps({"offset": offset, "block": block}), encoding="utf-8")
+    with open(hist.path, "r+b") as fh:  # crash halfway through the tail write
+        fh.truncate(offset)
+        fh.seek(offset)
+        fh.write(block.encode()[:7])
+
+    reopened = PortfolioHistory(hist.path)
+    pd.testing.assert_frame_equal(reopened.read(), expected(d1, new))
+    assert not reopened.journal_path.exists()
+    assert reopened.dates() == ["2025-06-02", "2025-06-03"]
+
+
+def test_torn_journal_leaves_the_csv_alone(tmp_path):
+    d1, d2 = day("2025-06-02", 100.0), day("2025-06-03", 101.0)
+    hist = make(tmp_path, d1, d2)
+    hist.journal_path.write_text('{"offset": 12, "blo', encoding="utf-8")
+    reopened = PortfolioHistory(hist.path)
+    pd.testing.assert_frame_equal(reopened.read(), expected(d1, d2))
+    assert not reopened.journal_path.exists()
+
+
+def test_index_is_rebuilt_after_an_external_edit(tmp_path):
+    d1, d2 = day("2025-06-02", 100.0), day("2025-06-03", 101.0)
+    hist = make(tmp_path, d1, d2)
+    assert hist.dates() == ["2025-06-02", "2025-06-03"]
+
+    edited = day("2025-06-02", 100.5, ("ABC", "LONGER_TICKER"))
+    d3 = day("2025-06-04", 103.0)
+    pd.concat([edited, d2, d3], ignore_index=True).to_csv(hist.path, index=False)  # another tool
+    assert hist.dates() == ["2025-06-02", "2025-06-03", "2025-06-04"]
+    pd.testing.assert_frame_equal(hist.read_day("2025-06-03"), expected(d2))
+
+    hist.replace_day("2025-06-04", day("2025-06-04", 104.0))
+    fresh = PortfolioHistory(hist.path)
+    pd.testing.assert_frame_equal(fresh.read(), expected(edited, d2, day("2025-06-04", 104.0)))
+    pd.testing.assert_frame_equal(fresh.read_day("2025-06-02"), expected(edited))
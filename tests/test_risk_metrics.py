@@ -0,0 +1,148 @@
+"""The incremental risk state against whole-series recomputations."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import trading_script as ts  # noqa: E402
+from risk_metrics import (  # noqa: E402
+    STATE_FORMAT,
+    TRADING_DAYS,
+    RiskState,
+    close_returns,
+    compare_metrics,
+    daily_risk_free,
+    full_benchmark_metrics,
+    full_risk_metrics,
+)
+
+BENCHMARKS = ["IWO", "XBI", "GAPPY"]
+
+
+def series(n: int, seed: int, start: str = "2025-01-02") -> pd.Series:
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, periods=n)
+    return pd.Series(100 * np.cumprod(1 + rng.normal(0.0005, 0.015, n)), index=days)
+
+
+def benchmark_closes(n: int) -> pd.DataFrame:
+    closes = pd.DataFrame({name: series(n, seed) for seed, name in enumerate(BENCHMARKS, start=10)})
+    closes.iloc[[5, 6, 40], 2] = np.nan  # GAPPY misses a few sessions
+    return closes
+
+
+def lstsq_table(equity: pd.Series, closes: pd.DataFrame) -> pd.DataFrame:
+    """Per-benchmark OLS with np.linalg.lstsq on the days both returns exist."""
+    rf = daily_risk_free(0.045)
+    r = equity.pct_change().dropna() - rf
+    rows = {}
+    for name in closes.columns:
+        x = close_returns(closes[[name]])[name].reindex(r.index) - rf
+        ok = x.notna()
+        xs, ys = x[ok].to_numpy(), r[ok].to_numpy()
+        (alpha, beta), *_ = np.linalg.lstsq(np.column_stack([np.ones_like(xs), xs]), ys, rcond=None)
+        resid = ys - alpha - beta * xs
+        rows[name] = {
+            "beta": beta,
+            "alpha_annual": (1 + alpha) ** TRADING_DAYS - 1,
+            "r2": 1 - (resid ** 2).sum() / ((ys - ys.mean()) ** 2).sum(),
+            "tracking_error": np.std(ys - xs, ddof=1) * np.sqrt(TRADING_DAYS),
+            "n_obs": int(ok.sum()),
+        }
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def test_benchmark_table_matches_lstsq():
+    equity = series(80, 1)
+    closes = benchmark_closes(80)
+    expected = lstsq_table(equity, closes)
+
+    state = RiskState(benchmarks=BENCHMARKS)
+    for date, value in equity.items():
+        state.stage(date.date().isoformat(), value)
+    state.settle(series(80, 2), closes)
+
+    for table in (state.benchmark_metrics(), full_benchmark_metrics(equity, closes)):
+        assert list(table.index) == BENCHMARKS
+        assert (table["n_obs"].to_numpy() == expected["n_obs"].to_numpy()).all()
+        for column in ("beta", "alpha_annual", "r2", "tracking_error"):
+            np.testing.assert_allclose(table[column].to_numpy(), expected[column].to_numpy(), rtol=1e-9)
+
+
+def market_with_gaps(n: int) -> pd.Series:
+    market = series(n + 1, 3, start="2024-12-31")
+    return market.drop(market.index[[7, 30, 31]])  # sessions without a ^GSPC bar
+
+
+def assert_matches_full(state: RiskState, equity: pd.Series, market: pd.Series) -> None:
+    assert compare_metrics(state.metrics(), full_risk_metrics(equity, market), rel_tol=1e-8) == {}
+
+
+def test_staged_replaced_and_settled_days_match_full_recomputation():
+    equity = series(60, 4)
+    market = market_with_gaps(60)
+    rng = np.random.default_rng(5)
+    state = RiskState()
+    shown = equity.iloc[:0]
+
+    for start in range(0, 60, 7):
+        chunk = equity.iloc[start:start + 7]
+        for i, (date, value) in enumerate(chunk.items()):
+            day = date.date().isoformat()
+            if i == 2:
+                # A pending day restaged with a different equity before it settles
+                assert state.stage(day, value * 1.05)
+            assert state.stage(day, value)
+        shown = equity.iloc[:start + len(chunk)]
+        assert state.metrics()["as_of"] == (shown.index[start - 1].date().isoformat() if start else None)
+        state.settle(market)
+        assert_matches_full(state, shown, market)
+
+        # Re-running the last settled day replaces it
+        last = shown.index[-1]
+        replaced = shown.copy()
+        replaced.iloc[-1] *= 1 + rng.normal(0, 0.02)
+        assert state.stage(last.date().isoformat(), replaced.iloc[-1])
+        state.settle(market)
+        assert_matches_full(state, replaced, market)
+        assert state.stage(last.date().isoformat(), shown.iloc[-1])
+        state.settle(market)
+        assert_matches_full(state, shown, market)
+
+    # Older days cannot be followed; the caller rebuilds
+    assert not state.stage(shown.index[-3].date().isoformat(), 1.0)
+
+
+def test_settle_without_market_matches_full_recomputation():
+    equity = series(30, 6)
+    state = RiskState()
+    for date, value in equity.items():
+        state.stage(date.date().isoformat(), value)
+    state.settle()
+    assert_matches_full(state, equity, None)
+
+
+def test_saved_state_of_another_format_is_rebuilt(tmp_path, monkeypatch):
+    equity = series(40, 8)
+    market = market_with_gaps(40)
+    monkeypatch.setattr(ts, "load_benchmarks", lambda *a, **k: [])
+    monkeypatch.setattr(ts, "_market_closes", lambda first, last, benchmarks=(): pd.DataFrame({"^GSPC": market}))
+    storage = ts.get_storage(tmp_path / "chatgpt_portfolio_update.csv", tmp_path / "chatgpt_trade_log.csv")
+    storage.write_history(pd.DataFrame({
+        "Date": [d.date().isoformat() for d in equity.index],
+        "Ticker": "TOTAL",
+        "Total Equity": equity.round(2).to_numpy(),
+    }))
+    stale = RiskState(days=999, last_date="2099-01-01").to_dict()
+    storage.write_risk_state({**stale, "format": STATE_FORMAT - 1})
+    assert RiskState.load(storage.read_risk_state()) is None
+
+    state = ts.risk_state(storage)
+    assert state.format == STATE_FORMAT and state.days == len(equity) and not state.pending
+    assert storage.read_risk_state()["format"] == STATE_FORMAT
+    assert_matches_full(state, equity.round(2), market)
+    assert ts.verify_risk_state(storage) == {}
@@ -0,0 +1,42 @@
+"""CSV -> Parquet -> CSV round trip of the tracked experiment data."""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import storage  # noqa: E402
+
+pytest.importorskip("pyarrow")
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "Scripts and CSV Files"
+
+
+def test_storage_backend_is_abstract():
+    with pytest.raises(TypeError):
+        storage.StorageBackend()
+
+
+@pytest.mark.parametrize("name", [storage.PORTFOLIO_FILE, storage.TRADE_LOG_FILE])
+def test_round_trip_of_tracked_data(tmp_path, name):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    for f in (storage.PORTFOLIO_FILE, storage.TRADE_LOG_FILE):
+        shutil.copy(DATA_DIR / f, src / f)
+
+    storage.import_csv(src)
+    assert storage.parquet_dir_for(src / name).is_dir()
+    storage.export_csv(src, out)
+
+    # A whitespace-only cell is a blank cell; integer-valued cells come back as floats.
+    original = pd.read_csv(DATA_DIR / name, skipinitialspace=True)
+    exported = pd.read_csv(out / name)
+    assert len(original) > 0
+    pd.testing.assert_frame_equal(exported, original, check_dtype=False)
+
+    store = storage.open_storage("auto", src / storage.PORTFOLIO_FILE, src / storage.TRADE_LOG_FILE)
+    assert store.name == "parquet"
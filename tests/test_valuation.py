@@ -0,0 +1,115 @@
+"""The vectorized stop-loss/valuation pass against the original row-by-row loop."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import trading_script as ts  # noqa: E402
+
+TODAY = "2025-06-03"
+
+PORTFOLIO = pd.DataFrame([
+    # ticker, shares, stop_loss, buy_price, cost_basis
+    ("gap", 10, 5.0, 6.0, 60.0),         # opens below its stop: filled at the open
+    ("INTRA", 7.9, 4.0, 4.5, np.nan),    # trades through its stop: filled at the stop
+    ("NOOPEN", 3, 2.5, 2.0, 6.0),        # NaN open: the close stands in for it
+    ("NODATA", 4, 1.0, 1.0, 4.0),        # nothing came back
+    ("TIE", 1000, np.nan, 0.01, 10.0),   # close 0.015 is a rounding near-tie
+    ("TIESTOP", 100, 0.065, 0.05, 5.0),  # stop fill at a near-tie
+    ("HOLD", 12, 0.0, 3.0, 36.0),        # zero stop never triggers
+], columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"])
+
+BARS = {
+    "GAP": (4.8, 5.2, 4.7, 5.0),
+    "INTRA": (4.4, 4.6, 3.9, 4.2),
+    "NOOPEN": (np.nan, 3.1, 2.9, 3.05),
+    "TIE": (0.02, 0.02, 0.014, 0.015),
+    "TIESTOP": (0.07, 0.08, 0.06, 0.07),
+    "HOLD": (3.3, 3.5, 0.5, 3.456),
+}
+
+
+def fetch_results() -> dict[str, ts.FetchResult]:
+    out = {}
+    for ticker in PORTFOLIO["ticker"].str.upper():
+        bar = BARS.get(ticker)
+        if bar is None:
+            df = pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"])
+        else:
+            df = pd.DataFrame([(1, 1, 1, 1), bar], columns=["Open", "High", "Low", "Close"],
+                              index=pd.to_datetime(["2025-06-02", TODAY]))
+        out[ticker] = ts.FetchResult(df, "yahoo" if bar else "empty")
+    return out
+
+
+def baseline(portfolio_df: pd.DataFrame, prices: dict[str, ts.FetchResult], cash: float):
+    """The iterrows loop process_portfolio ran before it was vectorized."""
+    results, sells = [], []
+    total_value = total_pnl = 0.0
+    for _, stock in portfolio_df.iterrows():
+        ticker = str(stock["ticker"]).upper()
+        shares = int(stock["shares"]) if not pd.isna(stock["shares"]) else 0
+        cost = float(stock["buy_price"]) if not pd.isna(stock["buy_price"]) else 0.0
+        cost_basis = float(stock["cost_basis"]) if not pd.isna(stock["cost_basis"]) else cost * shares
+        stop = float(stock["stop_loss"]) if not pd.isna(stock["stop_loss"]) else 0.0
+        data = prices[ticker].df
+        row = {"Date": TODAY, "Ticker": ticker, "Shares": shares, "Buy Price": cost, "Cost Basis": cost_basis, "Stop Loss": stop}
+        if data.empty:
+            results.append({**row, "Current Price": "", "Total Value": "", "PnL": "", "Action": "NO DATA",
+                            "Cash Balance": "", "Total Equity": ""})
+            continue
+        o = float(data["Open"].iloc[-1]) if "Open" in data else np.nan
+        l, c = float(data["Low"].iloc[-1]), float(data["Close"].iloc[-1])
+        if np.isnan(o):
+            o = c
+        if stop and l <= stop:
+            price = round(o if o <= stop else stop, 2)
+            value, pnl = round(price * shares, 2), round((price - cost) * shares, 2)
+            action = "SELL - Stop Loss Triggered"
+            cash += value
+            sells.append({"Date": TODAY, "Ticker": ticker, "Shares Sold": shares, "Sell Price": price,
+                          "Cost Basis": cost, "PnL": pnl, "Reason": "AUTOMATED SELL - STOPLOSS TRIGGERED"})
+        else:
+            price = round(c, 2)
+            value, pnl = round(price * shares, 2), round((price - cost) * shares, 2)
+            action = "HOLD"
+            total_value += value
+            total_pnl += pnl
+        results.append({**row, "Current Price": price, "Total Value": value, "PnL": pnl, "Action": action,
+                        "Cash Balance": "", "Total Equity": ""})
+    results.append({
+        "Date": TODAY, "Ticker": "TOTAL", "Shares": "", "Buy Price": "", "Cost Basis": "", "Stop Loss": "",
+        "Current Price": "", "Total Value": round(total_value, 2), "PnL": round(total_pnl, 2), "Action": "",
+        "Cash Balance": round(cash, 2), "Total Equity": round(total_value + cash, 2),
+    })
+    return pd.DataFrame(results), pd.DataFrame(sells), cash
+
+
+def assert_same_cells(got: pd.DataFrame, expected: pd.DataFrame) -> None:
+    assert list(got.columns) == list(expected.columns)
+    assert len(got) == len(expected)
+    for i in range(len(expected)):
+        for column in expected.columns:
+            a, b = got[column].iloc[i], expected[column].iloc[i]
+            assert type(a) is type(b) or (isinstance(a, (int, float)) and isinstance(b, (int, float))), (i, column, a, b)
+            assert a == b, (i, column, a, b)
+
+
+def test_vectorized_valuation_matches_row_by_row_loop():
+    prices = fetch_results()
+    tickers = PORTFOLIO["ticker"].astype(str).str.upper().tolist()
+    bars, has_data = ts.latest_bars(prices, tickers)
+    valuation = ts.value_positions(PORTFOLIO, bars, has_data, TODAY)
+    cash = valuation.settle(100.0)
+    rows = ts.portfolio_day_rows(valuation, cash, TODAY)
+
+    expected_rows, expected_sells, expected_cash = baseline(PORTFOLIO, prices, 100.0)
+    assert cash == expected_cash
+    assert_same_cells(rows, expected_rows)
+    assert_same_cells(valuation.sells, expected_sells)
+    assert list(valuation.sells["Ticker"]) == ["GAP", "INTRA", "TIESTOP"]
+    assert list(expected_rows["Current Price"].iloc[:6]) == [4.8, 4.0, 3.05, "", 0.01, 0.07]
@@ -5,8 +5,13 @@ This module rewrites the original script to:
 - Ensure ALL price requests go through the same accessor
 - Handle empty Yahoo frames (no exception) so fallback actually triggers
 - Normalize Stooq output to Yahoo-like columns
-- Make weekend handling consistent and testable
+- Make weekend and exchange-holiday handling consistent and testable (NYSE calendar)
 - Keep behavior and CSV formats compatible with prior runs
+- Cache daily bars in a local SQLite store so only missing date ranges hit the network
+- Replace a day's rows in the portfolio history in place (indexed, append-only CSV)
+- Skip failing sources (circuit breaker) and symbols a source is known not to carry
+- Record every buy, sell and stop-out in an event-sourced ledger (see ledger.py)
+- Execute a JSON list of orders in one non-interactive pass (--orders orders.json)
 
 Notes:
 - Some tickers/indices are not available on Stooq (e.g., ^RUT). These stay on Yahoo.
@@ -16,18 +21,37 @@ Notes:
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, cast,Dict, List, Optional
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, cast,Dict, List, Optional
+import asyncio
+import functools
+import io
 import os
+import sqlite3
+import threading
+import time
 import warnings
 
 import numpy as np
 import pandas as pd
+import requests
 import yfinance as yf
 import json
+from urllib.parse import quote, unquote
 import logging
+from requests.adapters import HTTPAdapter
+
+from ledger import Ledger, LedgerEvent, get_ledger as _ledger_for, portfolio_positions, state_differences
+from market_calendar import get_calendar
+from portfolio import Portfolio
+from risk_metrics import RiskState, compare_metrics, full_benchmark_metrics, full_risk_metrics
+from rolling_metrics import rolling_summary
+from storage import TRADE_LOG_COLUMNS, StorageBackend, open_storage, resolve_backend_name
 
 # Optional pandas-datareader import for Stooq access
 try:
@@ -36,6 +60,13 @@ try:
 except Exception:
     _HAS_PDR = False
 
+# Optional curl_cffi import; yfinance >= 0.2.60 only accepts curl_cffi sessions
+try:
+    from curl_cffi import requests as curl_requests
+    _HAS_CURL_CFFI = True
+except Exception:
+    _HAS_CURL_CFFI = False
+
 # -------- AS-OF override --------
 ASOF_DATE: pd.Timestamp | None = None
 
@@ -66,6 +97,8 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 DATA_DIR = SCRIPT_DIR  # Save files alongside this script by default
 PORTFOLIO_CSV = DATA_DIR / "chatgpt_portfolio_update.csv"
 TRADE_LOG_CSV = DATA_DIR / "chatgpt_trade_log.csv"
+# "csv", "parquet" or "auto" (Parquet once `python storage.py import` has been run); see storage.py
+STORAGE_BACKEND = resolve_backend_name(os.environ.get("PORTFOLIO_STORAGE"))
 DEFAULT_BENCHMARKS = ["IWO", "XBI", "SPY", "IWM"]
 
 # ------------------------------
@@ -150,21 +183,28 @@ def load_benchmarks(script_dir: Path | None = None) -> List[str]:
 # Date helpers
 # ------------------------------
 
-def last_trading_date(today: datetime | None = None) -> pd.Timestamp:
-    """Return last trading date (Mon–Fri), mapping Sat/Sun -> Fri."""
-    dt = pd.Timestamp(today or _effective_now())
+def _last_weekday(dt: pd.Timestamp) -> pd.Timestamp:
     if dt.weekday() == 5:  # Sat -> Fri
         return (dt - pd.Timedelta(days=1)).normalize()
     if dt.weekday() == 6:  # Sun -> Fri
         return (dt - pd.Timedelta(days=2)).normalize()
     return dt.normalize()
 
+def last_trading_date(today: datetime | None = None) -> pd.Timestamp:
+    """Return the last NYSE session on or before today (weekends and exchange holidays roll back)."""
+    dt = pd.Timestamp(today or _effective_now())
+    try:
+        return get_calendar().previous_session(dt)
+    except ValueError:
+        # Outside the precomputed calendar range: plain Mon–Fri rule
+        return _last_weekday(dt)
+
 def check_weekend() -> str:
     """Backwards-compatible wrapper returning ISO date string for last trading day."""
     return last_trading_date().date().isoformat()
 
 def trading_day_window(target: datetime | None = None) -> tuple[pd.Timestamp, pd.Timestamp]:
-    """[start, end) window for the last trading day (Fri on weekends)."""
+    """[start, end) window for the last trading session (prior session on weekends/holidays)."""
     d = last_trading_date(target)
     return d, (d + pd.Timedelta(days=1))
 
@@ -184,15 +224,334 @@ STOOQ_MAP = {
 # Symbols we should *not* attempt on Stooq
 STOOQ_BLOCKLIST = {"^RUT"}
 
+# Provider endpoints. Point these at fake_market_server.py (or any stand-in) for load tests:
+#   STOOQ_BASE_URL=http://127.0.0.1:8765 YAHOO_BASE_URL=http://127.0.0.1:8765 python trading_script.py ...
+# With YAHOO_BASE_URL unset, Yahoo goes through yfinance, whose hosts cannot be overridden.
+DEFAULT_STOOQ_BASE_URL = "https://stooq.com"
+STOOQ_BASE_URL = os.environ.get("STOOQ_BASE_URL") or DEFAULT_STOOQ_BASE_URL
+YAHOO_BASE_URL: str | None = os.environ.get("YAHOO_BASE_URL") or None
+
+def set_provider_base_urls(yahoo: str | None = None, stooq: str | None = None) -> None:
+    """Redirect the Yahoo chart and Stooq CSV fetchers. None restores the real providers."""
+    global YAHOO_BASE_URL, STOOQ_BASE_URL
+    YAHOO_BASE_URL = yahoo or None
+    STOOQ_BASE_URL = stooq or DEFAULT_STOOQ_BASE_URL
+
+
+# ------------------------------
+# HTTP sessions (shared by all fetchers)
+# ------------------------------
+
+HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "10"))
+
+class HttpSessions:
+    """Process-wide, lazily created keep-alive sessions so each host costs one TLS handshake, not one per ticker.
+
+    - stooq(): requests.Session with a pooled HTTPAdapter (Stooq CSV + pandas-datareader)
+    - yahoo(): curl_cffi session handed to yfinance (falls back to requests on old yfinance)
+    """
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT) -> None:
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._stooq: requests.Session | None = None
+        self._yahoo: Any = None
+        self._lock = threading.Lock()
+
+    def stooq(self) -> requests.Session:
+        # Also serves direct Yahoo chart calls when YAHOO_BASE_URL points at a stand-in.
+        with self._lock:
+            if self._stooq is None:
+                sess = requests.Session()
+                sess.headers.update({"User-Agent": HTTP_USER_AGENT, "Connection": "keep-alive"})
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                self._stooq = sess
+            return self._stooq
+
+    def yahoo(self) -> Any:
+        with self._lock:
+            if self._yahoo is None:
+                if _HAS_CURL_CFFI:
+                    self._yahoo = curl_requests.Session(impersonate="chrome")
+                else:
+                    sess = requests.Session()
+                    sess.headers.update({"User-Agent": HTTP_USER_AGENT})
+                    self._yahoo = sess
+            return self._yahoo
+
+    def close(self) -> None:
+        with self._lock:
+            for sess in (self._stooq, self._yahoo):
+                if sess is not None:
+                    try:
+                        sess.close()
+                    except Exception:
+                        pass
+            self._stooq = None
+            self._yahoo = None
+
+_http = HttpSessions()
+
+def configure_http(pool_size: int | None = None, timeout: float | None = None) -> None:
+    """Change pool size / timeout. Existing sessions are closed and rebuilt on next use."""
+    global HTTP_POOL_SIZE, HTTP_TIMEOUT
+    if pool_size is not None:
+        HTTP_POOL_SIZE = int(pool_size)
+    if timeout is not None:
+        HTTP_TIMEOUT = float(timeout)
+    _http.close()
+    _http.pool_size = HTTP_POOL_SIZE
+    _http.timeout = HTTP_TIMEOUT
+
+def close_http_sessions() -> None:
+    """Release pooled connections (call on app shutdown)."""
+    _http.close()
+
+
+# ------------------------------
+# Source health (circuit breaker + negative cache)
+# ------------------------------
+
+BREAKER_FAILURE_THRESHOLD = 5      # consecutive transport/rate-limit failures before a source is skipped
+BREAKER_COOLDOWN_SECONDS = 120.0   # how long an open breaker skips the source before one trial call
+NEGATIVE_TTL_SECONDS = 24 * 3600   # how long a learned "symbol not on this source" answer is trusted
+
+class SourceHealth:
+    """Per-source circuit breakers plus a learned (ticker, source) negative cache.
+
+    Failures (exceptions, non-200s, rate limits) count toward the breaker; empty answers do not.
+    A "missing" answer is only recorded when it is conclusive (unknown symbol, or no bars
+    over a window too long to be explained by a holiday), so one quiet day never blocks a ticker.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._failures: dict[str, int] = {}
+        self._open_until: dict[str, float] = {}
+        self._totals: dict[str, dict[str, int]] = {}
+        self._missing: dict[tuple[str, str], float] = {}
+
+    def _count(self, source: str, key: str) -> None:
+        bucket = self._totals.setdefault(source, {"success": 0, "failure": 0, "empty": 0, "skipped": 0})
+        bucket[key] += 1
+
+    def allow(self, source: str, ticker: str | None = None) -> bool:
+        """False if the source's breaker is open or `ticker` is known to be missing there."""
+        now = time.monotonic()
+        with self._lock:
+            if ticker is not None:
+                expires = self._missing.get((ticker, source))
+                if expires is not None:
+                    if expires > now:
+                        self._count(source, "skipped")
+                        return False
+                    del self._missing[(ticker, source)]
+            until = self._open_until.get(source)
+            if until is not None and until > now:
+                self._count(source, "skipped")
+                return False
+            return True
+
+    def record_success(self, source: str) -> None:
+        with self._lock:
+            self._failures[source] = 0
+            self._open_until.pop(source, None)
+            self._count(source, "success")
+
+    def record_empty(self, source: str, ticker: str | None = None, conclusive: bool = False) -> None:
+        with self._lock:
+            # The source answered, so it is reachable even if it had nothing for us.
+            self._failures[source] = 0
+            self._open_until.pop(source, None)
+            self._count(source, "empty")
+            if ticker is not None and conclusive:
+                self._missing[(ticker, source)] = time.monotonic() + NEGATIVE_TTL_SECONDS
+
+    def record_failure(self, source: str) -> None:
+        with self._lock:
+            n = self._failures.get(source, 0) + 1
+            self._failures[source] = n
+            self._count(source, "failure")
+            # Half-open trial failed, or threshold reached: (re)open for a full cool-down.
+            if n >= BREAKER_FAILURE_THRESHOLD:
+                self._open_until[source] = time.monotonic() + BREAKER_COOLDOWN_SECONDS
+
+    def reset(self) -> None:
+        with self._lock:
+            self._failures.clear()
+            self._open_until.clear()
+            self._totals.clear()
+            self._missing.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            sources: dict[str, Any] = {}
+            for name in sorted(set(self._totals) | set(self._failures)):
+                until = self._open_until.get(name)
+                if until is None:
+                    state = "closed"
+                elif until > now:
+                    state = "open"
+                else:
+                    state = "half-open"
+                sources[name] = {
+                    "state": state,
+                    "consecutive_failures": self._failures.get(name, 0),
+                    "retry_in_seconds": round(max(until - now, 0.0), 1) if until is not None else 0.0,
+                    **self._totals.get(name, {}),
+                }
+            negative: dict[str, list[str]] = {}
+            for (ticker, source), expires in self._missing.items():
+                if expires > now:
+                    negative.setdefault(source, []).append(ticker)
+        return {
+            "sources": sources,
+            "negative_cache": {k: sorted(v) for k, v in sorted(negative.items())},
+            "static_blocklist": {"stooq": sorted(STOOQ_BLOCKLIST)},
+        }
+
+_health = SourceHealth()
+
+def data_source_health() -> dict[str, Any]:
+    """Snapshot of breaker state, per-source counters and the learned negative cache."""
+    return _health.snapshot()
+
+def _window_is_conclusive(start: Any, end: Any) -> bool:
+    """True if [start, end) holds enough completed sessions that an empty answer means "not carried here"."""
+    try:
+        s, e = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    except Exception:
+        return False
+    # Today's bar may not be published yet, so only count sessions before today.
+    e = min(e, pd.Timestamp.now().normalize())
+    if e <= s:
+        return False
+    n = _count_sessions(s, e)
+    if n is None:
+        return int(np.busday_count(s.date(), e.date())) >= 3
+    return n >= 2
+
+def _classify_yahoo_errors(tickers: list[str], errors: dict[str, Any]) -> tuple[bool, set[str], str]:
+    """
+    Inspect a copy of yfinance's per-ticker error table, taken right after the download it
+    belongs to: (transport_failure, unknown_symbols, first_error).
+    """
+    failed = False
+    unknown: set[str] = set()
+    first_error = ""
+    for t in tickers:
+        msg = str(errors.get(t.upper(), ""))
+        if not msg:
+            continue
+        if "no timezone found" in msg or "YFTzMissingError" in msg:
+            unknown.add(t)
+        elif "YFPricesMissingError" in msg or "possibly delisted" in msg:
+            continue
+        else:
+            failed = True
+            first_error = first_error or msg
+    return failed, unknown, first_error
+
 
 # ------------------------------
 # Data access layer (UPDATED)
 # ------------------------------
 
+@dataclass
+class FetchAttempt:
+    source: str                         # "cache" | "yahoo" | "yahoo-batch" | "stooq-pdr" | "stooq-csv" | "proxy"
+    elapsed: float                      # wall seconds spent in this stage
+    ok: bool                            # stage produced a non-empty frame
+    reason: str = ""                    # why it failed / was skipped ("" on success)
+    bytes_received: int | None = None   # payload size where the client exposes it
+
 @dataclass
 class FetchResult:
     df: pd.DataFrame
-    source: str  # "yahoo" | "stooq-pdr" | "stooq-csv" | "yahoo:<proxy>-proxy" | "empty"
+    source: str  # "yahoo" | "stooq-pdr" | "stooq-csv" | "yahoo:<proxy>-proxy" | "cache" | "cache+<source>" | "empty"
+    attempts: list[FetchAttempt] = field(default_factory=list)
+
+class FetchStats:
+    """Process-wide latency and hit-rate aggregation over every FetchAttempt."""
+
+    def __init__(self, max_samples: int = 10_000) -> None:
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self._elapsed: dict[str, deque[float]] = {}
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def record(self, attempt: FetchAttempt) -> None:
+        with self._lock:
+            self._elapsed.setdefault(attempt.source, deque(maxlen=self._max_samples)).append(attempt.elapsed)
+            c = self._counts.setdefault(attempt.source, {"attempts": 0, "hits": 0, "bytes": 0})
+            c["attempts"] += 1
+            c["hits"] += int(attempt.ok)
+            c["bytes"] += attempt.bytes_received or 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._elapsed.clear()
+            self._counts.clear()
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            out: dict[str, dict[str, float]] = {}
+            for source, c in sorted(self._counts.items()):
+                samples = np.fromiter(self._elapsed[source], dtype=float)
+                p50, p95 = (np.percentile(samples, [50, 95]) * 1000.0) if samples.size else (np.nan, np.nan)
+                out[source] = {
+                    "attempts": c["attempts"],
+                    "hits": c["hits"],
+                    "hit_rate": c["hits"] / c["attempts"] if c["attempts"] else np.nan,
+                    "p50_ms": float(p50),
+                    "p95_ms": float(p95),
+                    "bytes": c["bytes"],
+                }
+            return out
+
+_fetch_stats = FetchStats()
+
+def fetch_stats() -> dict[str, dict[str, float]]:
+    """Per-source attempts, hit rate, p50/p95 latency (ms) and bytes since start or last reset."""
+    return _fetch_stats.summary()
+
+def reset_fetch_stats() -> None:
+    _fetch_stats.reset()
+
+# Fetchers leave a note here explaining an empty answer; _run_stage turns it into a FetchAttempt.
+_stage_note = threading.local()
+
+def _note_stage(reason: str | None = None, nbytes: int | None = None) -> None:
+    if reason is not None:
+        _stage_note.reason = reason
+    if nbytes is not None:
+        _stage_note.nbytes = nbytes
+
+def _run_stage(
+    source: str, attempts: list[FetchAttempt], fn: Callable[..., pd.DataFrame], *args: Any, **kwargs: Any
+) -> pd.DataFrame:
+    """Call one fetcher, time it, and append the resulting FetchAttempt to `attempts`."""
+    _stage_note.reason = None
+    _stage_note.nbytes = None
+    t0 = time.perf_counter()
+    df = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - t0
+    ok = isinstance(df, pd.DataFrame) and not df.empty
+    attempt = FetchAttempt(
+        source=source,
+        elapsed=elapsed,
+        ok=ok,
+        reason="" if ok else (getattr(_stage_note, "reason", None) or "empty"),
+        bytes_received=getattr(_stage_note, "nbytes", None),
+    )
+    attempts.append(attempt)
+    _fetch_stats.record(attempt)
+    return df if isinstance(df, pd.DataFrame) else pd.DataFrame()
 
 def _to_datetime_index(df: pd.DataFrame) -> pd.DataFrame:
     if not isinstance(df.index, pd.DatetimeIndex):
@@ -202,42 +561,184 @@ def _to_datetime_index(df: pd.DataFrame) -> pd.DataFrame:
             pass
     return df
 
-def _normalize_ohlcv(df: pd.DataFrame) -> pd.DataFrame:
+_OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+def _single_symbol(df: pd.DataFrame, ticker: str | None) -> pd.DataFrame:
+    """
+    The `ticker` columns of a (Price, Ticker) MultiIndex frame. A frame whose ticker level
+    does not hold that symbol (or, without `ticker`, holds several) comes back empty rather
+    than with other symbols' prices under the same column names.
+    """
+    price_level = next(
+        (i for i in range(df.columns.nlevels) if set(_OHLCV_COLUMNS) & set(df.columns.get_level_values(i))),
+        None,
+    )
+    if price_level is None or df.columns.nlevels != 2:
+        logger.warning("Unexpected price columns %s; ignoring the frame.", list(df.columns)[:6])
+        return pd.DataFrame(columns=_OHLCV_COLUMNS)
+    ticker_level = 1 - price_level
+    symbols = list(dict.fromkeys(str(t) for t in df.columns.get_level_values(ticker_level)))
+    wanted = str(ticker).upper() if ticker is not None else (symbols[0] if len(symbols) == 1 else None)
+    match = next((t for t in symbols if t.upper() == wanted), None)
+    if match is None:
+        logger.warning("Price frame holds %s, expected %s; ignoring it.", symbols, ticker or "one symbol")
+        return pd.DataFrame(columns=_OHLCV_COLUMNS)
+    return df.xs(match, axis=1, level=ticker_level).copy()
+
+def _normalize_ohlcv(df: pd.DataFrame, ticker: str | None = None) -> pd.DataFrame:
+    # yfinance returns (Price, Ticker) MultiIndex columns even for one symbol
+    if isinstance(df.columns, pd.MultiIndex):
+        df = _single_symbol(df, ticker)
     # Ensure all expected columns exist
     for c in ["Open", "High", "Low", "Close", "Volume"]:
         if c not in df.columns:
             df[c] = np.nan
     if "Adj Close" not in df.columns:
         df["Adj Close"] = df["Close"]
-    cols = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
-    return df[cols]
+    return df[_OHLCV_COLUMNS]
 
-def _yahoo_download(ticker: str, **kwargs: Any) -> pd.DataFrame:
-    """Call yfinance.download with a real UA and silence all chatter."""
-    import io, logging, requests
-    from contextlib import redirect_stderr, redirect_stdout
+# yf.download resets and fills module globals (yf.shared._DFS, _ERRORS, _TRACEBACKS) on every
+# call, so two overlapping calls can hand each other's frames back. One call at a time.
+_yf_lock = threading.Lock()
 
-    sess = requests.Session()
-    sess.headers.update({"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"})
+def _yahoo_download(
+    ticker: str | list[str], cancel: threading.Event | None = None, **kwargs: Any
+) -> pd.DataFrame:
+    """
+    Call yfinance.download on the shared session. Accepts one symbol or a list. Calls are
+    serialized (see _yf_lock); chatter is silenced through the yfinance logger and
+    progress=False rather than by swapping the process-wide stdout. A call whose `cancel`
+    is set by the time it gets the lock (an abandoned hedge) does not download at all.
+    """
+    symbols = [ticker] if isinstance(ticker, str) else list(ticker)
+    if not _health.allow("yahoo", ticker if isinstance(ticker, str) else None):
+        _note_stage("skipped: circuit open or symbol known missing")
+        return pd.DataFrame()
     kwargs.setdefault("progress", False)
     kwargs.setdefault("threads", False)
-    kwargs.setdefault("session", sess)
+    kwargs.setdefault("session", _http.yahoo())
+    kwargs.setdefault("timeout", _http.timeout)
+
+    if YAHOO_BASE_URL:
+        return _yahoo_chart_download(symbols, **kwargs)
 
     logging.getLogger("yfinance").setLevel(logging.CRITICAL)
-    buf = io.StringIO()
-    with warnings.catch_warnings():
+    with _yf_lock, warnings.catch_warnings():
+        if cancel is not None and cancel.is_set():
+            _note_stage("skipped: hedge already decided")
+            return pd.DataFrame()
         warnings.simplefilter("ignore")
         try:
-            with redirect_stdout(buf), redirect_stderr(buf):
-                df = cast(pd.DataFrame, yf.download(ticker, **kwargs))
-        except Exception:
+            df = cast(pd.DataFrame, yf.download(ticker, **kwargs))
+        except Exception as exc:
+            _health.record_failure("yahoo")
+            _note_stage(f"error: {exc!r}")
             return pd.DataFrame()
-    return df if isinstance(df, pd.DataFrame) else pd.DataFrame()
+        errors = dict(getattr(getattr(yf, "shared", None), "_ERRORS", None) or {})
+    df = df if isinstance(df, pd.DataFrame) else pd.DataFrame()
+
+    failed, unknown, first_error = _classify_yahoo_errors(symbols, errors)
+    if failed and (df.empty or len(symbols) == 1):
+        _health.record_failure("yahoo")
+        _note_stage(f"error: {first_error[:200]}")
+    elif df.empty:
+        conclusive = _window_is_conclusive(kwargs.get("start"), kwargs.get("end"))
+        for t in symbols:
+            _health.record_empty("yahoo", t, conclusive=conclusive or t in unknown)
+        _note_stage("unknown symbol" if unknown else "no bars in window")
+    else:
+        _health.record_success("yahoo")
+        for t in unknown:
+            _health.record_empty("yahoo", t, conclusive=True)
+    return df
+
+def _yahoo_chart_one(
+    symbol: str, start: Any, end: Any, auto_adjust: bool
+) -> tuple[pd.DataFrame, str]:
+    """GET {YAHOO_BASE_URL}/v8/finance/chart/<symbol> and parse it like yfinance would.
+
+    Returns (frame, status) with status "ok", "unknown symbol", "no bars in window" or "error: ...".
+    """
+    url = f"{str(YAHOO_BASE_URL).rstrip('/')}/v8/finance/chart/{quote(symbol, safe='^')}"
+    params = {
+        "period1": int(pd.Timestamp(start).timestamp()),
+        "period2": int(pd.Timestamp(end).timestamp()),
+        "interval": "1d",
+        "events": "div,splits",
+    }
+    empty = pd.DataFrame()
+    try:
+        r = _http.stooq().get(url, params=params, timeout=_http.timeout)
+        if r.status_code not in (200, 404):
+            return empty, f"error: http {r.status_code}"
+        chart = (r.json() or {}).get("chart") or {}
+    except Exception as exc:
+        return empty, f"error: {exc!r}"
+    if chart.get("error") or not chart.get("result"):
+        return empty, "unknown symbol"
+
+    result = chart["result"][0]
+    stamps = result.get("timestamp") or []
+    if not stamps:
+        return empty, "no bars in window"
+    quote_block = result["indicators"]["quote"][0]
+    offset = pd.Timedelta(seconds=int(result.get("meta", {}).get("gmtoffset", 0)))
+    idx = pd.DatetimeIndex((pd.to_datetime(stamps, unit="s") + offset).normalize(), name="Date")
+    df = pd.DataFrame(
+        {
+            "Open": quote_block.get("open"),
+            "High": quote_block.get("high"),
+            "Low": quote_block.get("low"),
+            "Close": quote_block.get("close"),
+            "Volume": quote_block.get("volume"),
+        },
+        index=idx,
+        dtype=float,
+    )
+    adj = (result["indicators"].get("adjclose") or [{}])[0].get("adjclose")
+    df["Adj Close"] = np.asarray(adj, dtype=float) if adj else df["Close"]
+    if auto_adjust:
+        ratio = df["Adj Close"] / df["Close"]
+        for c in ("Open", "High", "Low", "Close"):
+            df[c] = df[c] * ratio
+        df = df.drop(columns="Adj Close")
+    return df.dropna(how="all"), "ok"
+
+def _yahoo_chart_download(symbols: list[str], **kwargs: Any) -> pd.DataFrame:
+    """yf.download stand-in against YAHOO_BASE_URL: same frame shapes, same health bookkeeping."""
+    start, end = kwargs.get("start"), kwargs.get("end")
+    auto_adjust = _is_adjusted(kwargs)
+    if kwargs.get("threads") and len(symbols) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(symbols), _http.pool_size)) as pool:
+            outcomes = list(pool.map(lambda t: _yahoo_chart_one(t, start, end, auto_adjust), symbols))
+    else:
+        outcomes = [_yahoo_chart_one(t, start, end, auto_adjust) for t in symbols]
+
+    frames = {t: df for t, (df, status) in zip(symbols, outcomes) if status == "ok"}
+    errors = [status for _, status in outcomes if status.startswith("error")]
+    if errors and (not frames or len(symbols) == 1):
+        _health.record_failure("yahoo")
+        _note_stage(errors[0])
+        return pd.DataFrame()
+    if not frames:
+        conclusive = _window_is_conclusive(start, end)
+        for t, (_, status) in zip(symbols, outcomes):
+            _health.record_empty("yahoo", t, conclusive=conclusive or status == "unknown symbol")
+        _note_stage(outcomes[0][1] if len(symbols) == 1 else "no bars in window")
+        return pd.DataFrame()
+    _health.record_success("yahoo")
+    for t, (_, status) in zip(symbols, outcomes):
+        if status == "unknown symbol":
+            _health.record_empty("yahoo", t, conclusive=True)
+    if len(symbols) == 1:
+        return frames[symbols[0]]
+    # (Price, Ticker) columns, the layout yf.download uses for several symbols
+    return pd.concat(frames, axis=1).swaplevel(0, 1, axis=1).sort_index(axis=1)
 
 def _stooq_csv_download(ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
     """Fetch OHLCV from Stooq CSV endpoint (daily). Good for US tickers and many ETFs."""
-    import requests, io
-    if ticker in STOOQ_BLOCKLIST:
+    if ticker in STOOQ_BLOCKLIST or not _health.allow("stooq-csv", ticker):
+        _note_stage("skipped: blocklisted, circuit open or symbol known missing")
         return pd.DataFrame()
     t = STOOQ_MAP.get(ticker, ticker)
 
@@ -249,13 +750,19 @@ def _stooq_csv_download(ticker: str, start: pd.Timestamp, end: pd.Timestamp) ->
     else:
         sym = t.lower()
 
-    url = f"https://stooq.com/q/d/l/?s={sym}&i=d"
+    url = f"{STOOQ_BASE_URL.rstrip('/')}/q/d/l/?s={sym}&i=d"
     try:
-        r = requests.get(url, timeout=10)
+        r = _http.stooq().get(url, timeout=_http.timeout)
+        _note_stage(nbytes=len(r.content))
         if r.status_code != 200 or not r.text.strip():
+            _health.record_failure("stooq-csv")
+            _note_stage(f"http {r.status_code}" if r.status_code != 200 else "empty body")
             return pd.DataFrame()
         df = pd.read_csv(io.StringIO(r.text))
         if df.empty:
+            # Full-history endpoint: nothing at all means Stooq does not know the symbol.
+            _health.record_empty("stooq-csv", ticker, conclusive=True)
+            _note_stage("unknown symbol")
             return pd.DataFrame()
 
         df["Date"] = pd.to_datetime(df["Date"])
@@ -268,8 +775,14 @@ def _stooq_csv_download(ticker: str, start: pd.Timestamp, end: pd.Timestamp) ->
         # Normalize to Yahoo-like schema
         if "Adj Close" not in df.columns:
             df["Adj Close"] = df["Close"]
+        _health.record_success("stooq-csv")
+        if df.empty:
+            _note_stage("no bars in window")
         return df[["Open", "High", "Low", "Close", "Adj Close", "Volume"]]
-    except Exception:
+    except Exception as exc:
+        # Includes Stooq's plain-text "daily hits limit" pages, which fail CSV parsing
+        _health.record_failure("stooq-csv")
+        _note_stage(f"error: {exc!r}")
         return pd.DataFrame()
 
 def _stooq_download(
@@ -278,7 +791,15 @@ def _stooq_download(
     end: datetime | pd.Timestamp,
 ) -> pd.DataFrame:
     """Fetch OHLCV from Stooq via pandas-datareader; returns empty DF on failure."""
-    if not _HAS_PDR or ticker in STOOQ_BLOCKLIST:
+    if not _HAS_PDR:
+        _note_stage("skipped: pandas-datareader not installed")
+        return pd.DataFrame()
+    if STOOQ_BASE_URL != DEFAULT_STOOQ_BASE_URL:
+        # pandas-datareader has the Stooq host baked in; only the CSV stage honours the override
+        _note_stage("skipped: STOOQ_BASE_URL overridden")
+        return pd.DataFrame()
+    if ticker in STOOQ_BLOCKLIST or not _health.allow("stooq-pdr", ticker):
+        _note_stage("skipped: blocklisted, circuit open or symbol known missing")
         return pd.DataFrame()
 
     t = STOOQ_MAP.get(ticker, ticker)
@@ -290,18 +811,28 @@ def _stooq_download(
         if not _HAS_PDR:
             return pd.DataFrame()
         import pandas_datareader.data as pdr_local
-        df = cast(pd.DataFrame, pdr_local.DataReader(t, "stooq", start=start, end=end))
+        df = cast(
+            pd.DataFrame,
+            pdr_local.DataReader(t, "stooq", start=start, end=end, session=_http.stooq()),
+        )
         df.sort_index(inplace=True)
-        return df
-    except Exception:
+    except Exception as exc:
+        _health.record_failure("stooq-pdr")
+        _note_stage(f"error: {exc!r}")
         return pd.DataFrame()
+    if df.empty:
+        _health.record_empty("stooq-pdr", ticker, conclusive=_window_is_conclusive(start, end))
+        _note_stage("no bars in window")
+    else:
+        _health.record_success("stooq-pdr")
+    return df
 
 def _weekend_safe_range(period: str | None, start: Any, end: Any) -> tuple[pd.Timestamp, pd.Timestamp]:
     """
     Compute a concrete [start, end) window.
     - If explicit start/end provided: use them (add +1 day to end to make it exclusive).
-    - If period is '1d': use the last trading day's [Fri, Sat) window on weekends.
-    - If period like '2d'/'5d': build a window ending at the last trading day.
+    - If period like '1d'/'2d'/'5d': start N sessions before the last trading session and
+      end the day after it, so weekends and exchange holidays never widen or empty the window.
     """
     if start or end:
         end_ts = pd.Timestamp(end) if end else last_trading_date() + pd.Timedelta(days=1)
@@ -314,100 +845,1044 @@ def _weekend_safe_range(period: str | None, start: Any, end: Any) -> tuple[pd.Ti
     else:
         days = 1
 
-    # Anchor to last trading day (Fri on Sun/Sat)
+    # Anchor to last trading session (prior session on weekends/holidays)
     end_trading = last_trading_date()
-    start_ts = (end_trading - pd.Timedelta(days=days)).normalize()
+    try:
+        start_ts = get_calendar().previous_session(end_trading, offset=days)
+    except ValueError:
+        start_ts = (end_trading - pd.Timedelta(days=days)).normalize()
     end_ts = (end_trading + pd.Timedelta(days=1)).normalize()
     return start_ts, end_ts
 
+def _count_sessions(start: pd.Timestamp, end: pd.Timestamp) -> int | None:
+    """Sessions in [start, end), or None if the window is outside the calendar's range."""
+    try:
+        cal = get_calendar()
+        if pd.Timestamp(start) < pd.Timestamp(cal.first) or pd.Timestamp(end) > pd.Timestamp(cal.last):
+            return None
+        return int(cal.count_sessions(start, end))
+    except Exception:
+        return None
+
+# Seconds to wait for Yahoo before racing Stooq against it; None keeps the strictly sequential chain.
+# Override with PRICE_HEDGE_AFTER=<seconds> or per call via download_price_data(..., hedge_after=...).
+HEDGE_AFTER_SECONDS: float | None = None
+_env_hedge = os.environ.get("PRICE_HEDGE_AFTER")
+if _env_hedge:
+    try:
+        HEDGE_AFTER_SECONDS = float(_env_hedge)
+    except ValueError:
+        logger.warning("PRICE_HEDGE_AFTER=%r is not a number. Hedging disabled.", _env_hedge)
+
+_hedge_pool: ThreadPoolExecutor | None = None
+_hedge_pool_lock = threading.Lock()
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="price-hedge")
+        return _hedge_pool
+
+def _yahoo_stage(
+    ticker: str,
+    s: pd.Timestamp,
+    e: pd.Timestamp,
+    attempts: list[FetchAttempt],
+    cancel: threading.Event | None = None,
+    **kwargs: Any,
+) -> FetchResult | None:
+    df_y = _run_stage("yahoo", attempts, _yahoo_download, ticker, cancel=cancel, start=s, end=e, **kwargs)
+    if not df_y.empty:
+        df_y = _normalize_ohlcv(_to_datetime_index(df_y), ticker)
+        if not df_y.empty:
+            return FetchResult(df_y, "yahoo")
+    return None
+
+def _stooq_stages(
+    ticker: str,
+    s: pd.Timestamp,
+    e: pd.Timestamp,
+    attempts: list[FetchAttempt],
+    cancel: threading.Event | None = None,
+) -> FetchResult | None:
+    """Stooq via pandas-datareader, then the direct CSV endpoint. Stops early once `cancel` is set."""
+    df_s = _run_stage("stooq-pdr", attempts, _stooq_download, ticker, start=s, end=e)
+    if not df_s.empty:
+        return FetchResult(_normalize_ohlcv(_to_datetime_index(df_s), ticker), "stooq-pdr")
+    if cancel is not None and cancel.is_set():
+        return None
+
+    df_csv = _run_stage("stooq-csv", attempts, _stooq_csv_download, ticker, s, e)
+    if not df_csv.empty:
+        return FetchResult(_normalize_ohlcv(_to_datetime_index(df_csv), ticker), "stooq-csv")
+    return None
+
+def _hedged_stages(
+    ticker: str,
+    s: pd.Timestamp,
+    e: pd.Timestamp,
+    hedge_after: float,
+    attempts: list[FetchAttempt],
+    **kwargs: Any,
+) -> FetchResult | None:
+    """Race Yahoo against Stooq once Yahoo exceeds its latency budget; first valid frame wins.
+
+    Threads cannot be interrupted mid-request, so the loser is abandoned rather than killed:
+    a queued task is cancelled, a Yahoo call still waiting for the yfinance lock never
+    downloads, a running Stooq chain skips its remaining stages, and any late result is
+    discarded. A Yahoo download already under way finishes while holding the lock, so it
+    cannot overlap another symbol's call.
+    """
+    pool = _get_hedge_pool()
+    cancel = threading.Event()
+    pending = {pool.submit(_yahoo_stage, ticker, s, e, attempts, cancel, **kwargs)}
+    stooq_started = False
+
+    done, pending = wait(pending, timeout=hedge_after)
+    while True:
+        for fut in done:
+            try:
+                res = fut.result()
+            except Exception:
+                res = None
+            if res is not None:
+                cancel.set()
+                for other in pending:
+                    other.cancel()
+                return res
+        if not stooq_started:
+            # Yahoo is over budget or came back empty: start Stooq now.
+            pending.add(pool.submit(_stooq_stages, ticker, s, e, attempts, cancel))
+            stooq_started = True
+        if not pending:
+            return None
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+def _fetch_network(
+    ticker: str,
+    s: pd.Timestamp,
+    e: pd.Timestamp,
+    skip_yahoo: bool = False,
+    hedge_after: float | None = None,
+    **kwargs: Any,
+) -> FetchResult:
+    """Run the Yahoo -> Stooq -> proxy fallback chain for a concrete [s, e) window."""
+    attempts: list[FetchAttempt] = []
+
+    def done(res: FetchResult) -> FetchResult:
+        # Snapshot: an abandoned hedge loser may still append to `attempts` later.
+        res.attempts = list(attempts)
+        return res
+
+    if hedge_after is not None and not skip_yahoo:
+        # ---------- 1+2+3) Yahoo raced against Stooq after the latency budget ----------
+        res = _hedged_stages(ticker, s, e, hedge_after, attempts, **kwargs)
+        if res is not None:
+            return done(res)
+    else:
+        # ---------- 1) Yahoo (date-bounded) ----------
+        if not skip_yahoo:
+            res = _yahoo_stage(ticker, s, e, attempts, **kwargs)
+            if res is not None:
+                return done(res)
+
+        # ---------- 2) Stooq via pandas-datareader, 3) Stooq direct CSV ----------
+        res = _stooq_stages(ticker, s, e, attempts)
+        if res is not None:
+            return done(res)
+
+    # ---------- 4) Proxy indices if applicable ----------
+    proxy_map = {"^GSPC": "SPY", "^RUT": "IWM"}
+    proxy = proxy_map.get(ticker)
+    if proxy:
+        df_proxy = _run_stage("proxy", attempts, _yahoo_download, proxy, start=s, end=e, **kwargs)
+        df_proxy = _normalize_ohlcv(_to_datetime_index(df_proxy), proxy) if not df_proxy.empty else df_proxy
+        if not df_proxy.empty:
+            return done(FetchResult(df_proxy, f"yahoo:{proxy}-proxy"))
+
+    # ---------- Nothing worked ----------
+    empty = pd.DataFrame(columns=["Open", "High", "Low", "Close", "Adj Close", "Volume"])
+    return done(FetchResult(empty, "empty"))
+
+def _fetchable_gaps(
+    store: BarStore, ticker: str, adjusted: bool, s: pd.Timestamp, e: pd.Timestamp
+) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """Missing sub-ranges that contain at least one session; sessionless gaps are marked covered."""
+    gaps: list[tuple[pd.Timestamp, pd.Timestamp]] = []
+    for gs, ge in store.missing_ranges(ticker, adjusted, s, e):
+        if _count_sessions(gs, ge) == 0:
+            store.mark_covered(ticker, adjusted, gs, ge)
+        else:
+            gaps.append((gs, ge))
+    return gaps
+
+def _rescaled(fetch: FetchResult, anchor: tuple[pd.Timestamp, float | None, float | None]) -> bool:
+    """True when the fetched bar on the anchor date disagrees with the stored one."""
+    if fetch.source == "empty" or fetch.source.endswith("-proxy") or fetch.df.empty:
+        return False
+    day, close, adj_close = anchor
+    index = pd.DatetimeIndex(fetch.df.index)
+    index = index.tz_localize(None) if index.tz is not None else index
+    rows = fetch.df[index.normalize() == day]
+    if rows.empty:
+        return False
+    for column, stored in (("Close", close), ("Adj Close", adj_close)):
+        if stored is None or column not in rows:
+            continue
+        fresh = float(rows[column].iloc[-1])
+        if not np.isnan(fresh) and not np.isclose(fresh, stored, rtol=1e-6, atol=1e-9):
+            return True
+    return False
+
+def _fetch_start(store: BarStore, ticker: str, adjusted: bool, s: pd.Timestamp, e: pd.Timestamp) -> pd.Timestamp | None:
+    """Earliest date _download_one will ask the network for (None when [s, e) is covered)."""
+    starts = []
+    for gs, ge in _fetchable_gaps(store, ticker, adjusted, s, e):
+        anchor = store.neighbour_bar(ticker, adjusted, s, e, gs, ge)
+        starts.append(gs if anchor is None else min(gs, anchor[0]))
+    return min(starts) if starts else None
+
+def _download_one(
+    ticker: str,
+    s: pd.Timestamp,
+    e: pd.Timestamp,
+    fetcher: Callable[[str, pd.Timestamp, pd.Timestamp], FetchResult],
+    use_cache: bool,
+    adjusted: bool,
+) -> FetchResult:
+    """Serve [s, e) from the bar store, calling `fetcher` only for the missing sub-ranges."""
+    if _count_sessions(s, e) == 0:
+        # Weekend/holiday-only window: no provider can have a bar, so don't ask.
+        empty = pd.DataFrame(columns=["Open", "High", "Low", "Close", "Adj Close", "Volume"])
+        return FetchResult(empty, "empty", [FetchAttempt("calendar", 0.0, False, "no sessions in window")])
+
+    store = get_bar_store() if use_cache else None
+    if store is None:
+        return fetcher(ticker, s, e)
+
+    attempts: list[FetchAttempt] = []
+    gaps = _fetchable_gaps(store, ticker, adjusted, s, e)
+    fetched: list[tuple[pd.Timestamp, pd.Timestamp, FetchResult]] = []
+    for gs, ge in gaps:
+        anchor = store.neighbour_bar(ticker, adjusted, s, e, gs, ge)
+        if anchor is None:
+            fetched.append((gs, ge, fetcher(ticker, gs, ge)))
+            continue
+        fetch = fetcher(ticker, min(gs, anchor[0]), max(ge, anchor[0] + pd.Timedelta(days=1)))
+        if _rescaled(fetch, anchor):
+            # Past prices moved (split or dividend): the stored bars no longer fit the new ones
+            attempts.extend(fetch.attempts)
+            attempts.append(FetchAttempt("cache", 0.0, False, f"{anchor[0].date()} bar changed; refetching"))
+            store.drop_series(ticker, adjusted)
+            gaps = _fetchable_gaps(store, ticker, adjusted, s, e)
+            fetched = [(gs, ge, fetcher(ticker, gs, ge)) for gs, ge in gaps]
+            break
+        fetched.append((gs, ge, fetch))
+
+    network_sources: list[str] = []
+    for gs, ge, fetch in fetched:
+        attempts.extend(fetch.attempts)
+        # Proxy bars belong to a different symbol; never persist them under this ticker.
+        if fetch.source == "empty" or fetch.source.endswith("-proxy"):
+            if len(gaps) == 1 and (gs, ge) == (s, e):
+                return fetch
+            continue
+        store.write(ticker, adjusted, fetch.df, fetch.source, gs, ge)
+        if fetch.source not in network_sources:
+            network_sources.append(fetch.source)
+
+    cached = _run_stage("cache", attempts, store.read, ticker, adjusted, s, e)
+    if cached.empty:
+        empty = pd.DataFrame(columns=["Open", "High", "Low", "Close", "Adj Close", "Volume"])
+        return FetchResult(empty, "empty", attempts)
+    if not network_sources:
+        return FetchResult(cached, "cache", attempts)
+    if len(gaps) == 1 and gaps[0] == (s, e):
+        return FetchResult(cached, network_sources[0], attempts)
+    return FetchResult(cached, "cache+" + "+".join(network_sources), attempts)
+
 def download_price_data(ticker: str, **kwargs: Any) -> FetchResult:
     """
     Robust OHLCV fetch with multi-stage fallbacks:
 
     Order:
+      0) Local bar store (only the missing date ranges go to the network)
       1) Yahoo Finance via yfinance
       2) Stooq via pandas-datareader
       3) Stooq direct CSV
       4) Index proxies (e.g., ^GSPC->SPY, ^RUT->IWM) via Yahoo
     Returns a DataFrame with columns [Open, High, Low, Close, Adj Close, Volume].
+
+    Pass ``use_cache=False`` to bypass the bar store for a single call, and
+    ``hedge_after=<seconds>`` to start Stooq in parallel once Yahoo exceeds that budget
+    (defaults to HEDGE_AFTER_SECONDS). In replay mode (see set_market_data_mode) every call
+    is served from recorded fixtures with no network access.
     """
     # Pull out range args, compute a weekend-safe window
     period = kwargs.pop("period", None)
     start = kwargs.pop("start", None)
     end = kwargs.pop("end", None)
+    use_cache = kwargs.pop("use_cache", True)
+    hedge_after = kwargs.pop("hedge_after", HEDGE_AFTER_SECONDS)
     kwargs.setdefault("progress", False)
     kwargs.setdefault("threads", False)
 
     s, e = _weekend_safe_range(period, start, end)
+    adjusted = _is_adjusted(kwargs)
+    planned = _planned(ticker, s, e, adjusted)
+    if planned is not None:
+        return planned
+    if MARKET_DATA_MODE == "replay":
+        return _replay_fixture(ticker, s, e, adjusted)
+
+    def fetcher(t: str, gs: pd.Timestamp, ge: pd.Timestamp) -> FetchResult:
+        return _fetch_network(t, gs, ge, hedge_after=hedge_after, **kwargs)
+
+    res = _download_one(ticker, s, e, fetcher, use_cache, adjusted)
+    if MARKET_DATA_MODE == "record":
+        _record_fixture(ticker, s, e, adjusted, res)
+    return res
+
+def _split_yahoo_batch(df: pd.DataFrame, tickers: list[str]) -> dict[str, pd.DataFrame]:
+    """Split a multi-ticker yf.download frame into one frame per symbol, dropping absent symbols."""
+    out: dict[str, pd.DataFrame] = {}
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return out
+    if isinstance(df.columns, pd.MultiIndex):
+        wanted = set(tickers)
+        level = next(
+            (i for i in range(df.columns.nlevels) if wanted & set(df.columns.get_level_values(i))),
+            None,
+        )
+        if level is None:
+            return out
+        present = set(df.columns.get_level_values(level))
+        for t in tickers:
+            if t not in present:
+                continue
+            sub = df.xs(t, axis=1, level=level).dropna(how="all")
+            if not sub.empty:
+                out[t] = _to_datetime_index(sub)
+    elif len(tickers) == 1:
+        sub = df.dropna(how="all")
+        if not sub.empty:
+            out[tickers[0]] = _to_datetime_index(sub)
+    return out
+
+def download_price_data_many(
+    tickers: Iterable[str],
+    start: Any = None,
+    end: Any = None,
+    **kwargs: Any,
+) -> dict[str, FetchResult]:
+    """
+    Fetch OHLCV for many symbols with a single batched Yahoo request.
 
-    # ---------- 1) Yahoo (date-bounded) ----------
-    df_y = _yahoo_download(ticker, start=s, end=e, **kwargs)
-    if isinstance(df_y, pd.DataFrame) and not df_y.empty:
-        return FetchResult(_normalize_ohlcv(_to_datetime_index(df_y)), "yahoo")
+    Symbols already covered by the bar store are served locally. The rest are requested
+    from Yahoo from their earliest uncovered date on, one call per distinct start date; any
+    symbol Yahoo does not return falls back to the per-symbol Stooq/proxy chain. Returns {TICKER: FetchResult} keyed by upper-cased symbol.
+    """
+    period = kwargs.pop("period", None)
+    use_cache = kwargs.pop("use_cache", True)
+    kwargs.pop("hedge_after", None)  # the batch already tried Yahoo; fallbacks go straight to Stooq
+    kwargs.setdefault("progress", False)
+    kwargs.pop("threads", None)
 
-    # ---------- 2) Stooq via pandas-datareader ----------
-    df_s = _stooq_download(ticker, start=s, end=e)
-    if isinstance(df_s, pd.DataFrame) and not df_s.empty:
-        return FetchResult(_normalize_ohlcv(_to_datetime_index(df_s)), "stooq-pdr")
+    symbols = list(dict.fromkeys(str(t).strip().upper() for t in tickers if str(t).strip()))
+    if not symbols:
+        return {}
 
-    # ---------- 3) Stooq direct CSV ----------
-    df_csv = _stooq_csv_download(ticker, s, e)
-    if isinstance(df_csv, pd.DataFrame) and not df_csv.empty:
-        return FetchResult(_normalize_ohlcv(_to_datetime_index(df_csv)), "stooq-csv")
+    s, e = _weekend_safe_range(period, start, end)
+    adjusted = _is_adjusted(kwargs)
+    planned = {t: res for t in symbols if (res := _planned(t, s, e, adjusted)) is not None}
+    if planned:
+        rest = [t for t in symbols if t not in planned]
+        if rest:
+            planned.update(download_price_data_many(rest, start=s, end=e, use_cache=use_cache, **kwargs))
+        return {t: planned[t] for t in symbols}
+    if MARKET_DATA_MODE == "replay":
+        return {t: _replay_fixture(t, s, e, adjusted) for t in symbols}
+    store = get_bar_store() if use_cache else None
+
+    # Earliest date to fetch per symbol (the first uncovered one, or the stored bar just
+    # before it that checks for rescaled prices); a warm store only needs the tail
+    need: dict[str, pd.Timestamp] = {}
+    for t in symbols:
+        gap_start = s if store is None else _fetch_start(store, t, adjusted, s, e)
+        if gap_start is not None:
+            need[t] = gap_start
+    # Leave out symbols Yahoo is known not to carry (and everything while its breaker is open)
+    groups: dict[pd.Timestamp, list[str]] = {}
+    for t, gap_start in need.items():
+        if _health.allow("yahoo", t):
+            groups.setdefault(gap_start, []).append(t)
+    batch: dict[str, pd.DataFrame] = {}
+    batch_attempts: list[FetchAttempt] = []
+    for gap_start, ask_yahoo in sorted(groups.items()):
+        raw = _run_stage(
+            "yahoo-batch", batch_attempts, _yahoo_download,
+            ask_yahoo if len(ask_yahoo) > 1 else ask_yahoo[0], start=gap_start, end=e, threads=True, **kwargs,
+        )
+        batch.update(_split_yahoo_batch(raw, ask_yahoo))
+
+    single_kwargs = dict(kwargs, threads=False)
+
+    def fetcher(t: str, gs: pd.Timestamp, ge: pd.Timestamp) -> FetchResult:
+        if gs < need.get(t, gs):
+            # Wider than the batch asked for (a rescaled series being refetched in full)
+            return _fetch_network(t, gs, ge, **single_kwargs)
+        df = batch.get(t)
+        if df is not None:
+            window = df.loc[(df.index >= gs) & (df.index < ge)]
+            if not window.empty:
+                return FetchResult(_normalize_ohlcv(window, t), "yahoo", list(batch_attempts))
+        # Yahoo already had its chance in the batch; go straight to Stooq and proxies.
+        fetch = _fetch_network(t, gs, ge, skip_yahoo=True, **single_kwargs)
+        fetch.attempts = batch_attempts + fetch.attempts
+        return fetch
+
+    results = {t: _download_one(t, s, e, fetcher, use_cache, adjusted) for t in symbols}
+    if MARKET_DATA_MODE == "record":
+        for t, res in results.items():
+            _record_fixture(t, s, e, adjusted, res)
+    return results
+
+
+async def fetch_prices(
+    tickers: Iterable[str],
+    start: Any = None,
+    end: Any = None,
+    concurrency: int = 8,
+    **kwargs: Any,
+) -> AsyncIterator[tuple[str, FetchResult]]:
+    """
+    Async counterpart to download_price_data for many symbols.
 
-    # ---------- 4) Proxy indices if applicable ----------
-    proxy_map = {"^GSPC": "SPY", "^RUT": "IWM"}
-    proxy = proxy_map.get(ticker)
-    if proxy:
-        df_proxy = _yahoo_download(proxy, start=s, end=e, **kwargs)
-        if isinstance(df_proxy, pd.DataFrame) and not df_proxy.empty:
-            return FetchResult(_normalize_ohlcv(_to_datetime_index(df_proxy)), f"yahoo:{proxy}-proxy")
+    Runs the full cache -> Yahoo -> Stooq -> proxy chain per symbol, at most `concurrency`
+    at a time, and yields (TICKER, FetchResult) pairs in completion order. The providers'
+    clients are blocking, so each fetch runs on a worker pool sized to `concurrency`; the
+    semaphore keeps the number of in-flight requests bounded. Breaking out of the loop
+    cancels queued fetches.
 
-    # ---------- Nothing worked ----------
-    empty = pd.DataFrame(columns=["Open", "High", "Low", "Close", "Adj Close", "Volume"])
-    return FetchResult(empty, "empty")
+        async for ticker, fetch in fetch_prices(["SPY", "IWM"], start=s, end=e):
+            ...
+    """
+    symbols = list(dict.fromkeys(str(t).strip().upper() for t in tickers if str(t).strip()))
+    if not symbols:
+        return
+    loop = asyncio.get_running_loop()
+    limit = max(1, int(concurrency))
+    sem = asyncio.Semaphore(limit)
+    pool = ThreadPoolExecutor(max_workers=limit, thread_name_prefix="fetch-prices")
+
+    async def one(ticker: str) -> tuple[str, FetchResult]:
+        async with sem:
+            call = functools.partial(download_price_data, ticker, start=start, end=end, **kwargs)
+            return ticker, await loop.run_in_executor(pool, call)
+
+    tasks = [asyncio.ensure_future(one(t)) for t in symbols]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for task in tasks:
+            task.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ------------------------------
+# Run-scoped fetch planner
+# ------------------------------
+
+class FetchPlan:
+    """
+    Every (ticker, window) a run is going to need, fetched once and served by slicing.
+
+    Requirements are merged per (ticker, adjusted) into one covering range; tickers whose
+    covering ranges match share a single batched download. While a plan is active (see
+    use_fetch_plan) download_price_data and download_price_data_many answer any window the
+    plan covers from memory, and fall through to the normal fetch path otherwise.
+
+        plan = FetchPlan()
+        plan.add(["ABC", "XYZ"], start=s, end=e, auto_adjust=False)
+        plan.add("^GSPC", start=hist_start, end=e)
+        with use_fetch_plan(plan):
+            process_portfolio(...)
+    """
+
+    def __init__(self) -> None:
+        self._ranges: dict[tuple[str, bool], tuple[pd.Timestamp, pd.Timestamp]] = {}
+        self._results: dict[tuple[str, bool], tuple[pd.Timestamp, pd.Timestamp, FetchResult]] = {}
+        self.executed = False
+
+    def add(self, tickers: str | Iterable[str], start: Any = None, end: Any = None, **kwargs: Any) -> None:
+        """Register a requirement; accepts the same range/adjust arguments as download_price_data."""
+        symbols = [tickers] if isinstance(tickers, str) else list(tickers)
+        s, e = _weekend_safe_range(kwargs.get("period"), start, end)
+        adjusted = _is_adjusted(kwargs)
+        for t in symbols:
+            key = (str(t).strip().upper(), adjusted)
+            if not key[0]:
+                continue
+            cur = self._ranges.get(key)
+            self._ranges[key] = (min(cur[0], s), max(cur[1], e)) if cur else (s, e)
+        self.executed = False
+
+    def covering_ranges(self) -> dict[tuple[str, bool], tuple[pd.Timestamp, pd.Timestamp]]:
+        return dict(self._ranges)
+
+    def execute(self) -> None:
+        """Fetch every covering range, one batched call per distinct (window, adjusted)."""
+        groups: dict[tuple[pd.Timestamp, pd.Timestamp, bool], list[str]] = {}
+        for (t, adjusted), (s, e) in self._ranges.items():
+            if (t, adjusted) in self._results:
+                continue
+            groups.setdefault((s, e, adjusted), []).append(t)
+        for (s, e, adjusted), symbols in groups.items():
+            fetched = download_price_data_many(symbols, start=s, end=e, auto_adjust=adjusted, progress=False)
+            for t, res in fetched.items():
+                self._results[(t, adjusted)] = (s, e, res)
+        self.executed = True
+
+    def lookup(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp, adjusted: bool) -> FetchResult | None:
+        """Slice of the planned fetch for [start, end), or None if the plan does not cover it."""
+        hit = self._results.get((str(ticker).strip().upper(), adjusted))
+        if hit is None:
+            return None
+        s, e, res = hit
+        if start < s or end > e:
+            return None
+        df = res.df
+        if not df.empty:
+            df = df.loc[(df.index >= start) & (df.index < end)]
+        attempts = list(res.attempts) + [FetchAttempt("plan", 0.0, True, "served from run plan")]
+        return FetchResult(df, res.source, attempts)
+
+
+_active_plan: FetchPlan | None = None
+
+@contextmanager
+def use_fetch_plan(plan: FetchPlan):
+    """Execute `plan` (if needed) and serve covered price requests from it inside the block."""
+    global _active_plan
+    if not plan.executed:
+        plan.execute()
+    previous, _active_plan = _active_plan, plan
+    try:
+        yield plan
+    finally:
+        _active_plan = previous
 
+def _planned(ticker: str, s: pd.Timestamp, e: pd.Timestamp, adjusted: bool) -> FetchResult | None:
+    plan = _active_plan
+    return plan.lookup(ticker, s, e, adjusted) if plan is not None else None
+
+
+# ------------------------------
+# Local bar store (SQLite)
+# ------------------------------
+
+# Override with BAR_STORE_PATH=/path/to/file.sqlite; set it to an empty string to disable caching.
+BAR_STORE_PATH: Path | None = SCRIPT_DIR / "price_cache.sqlite"
+_env_bar_store = os.environ.get("BAR_STORE_PATH")
+if _env_bar_store is not None:
+    BAR_STORE_PATH = Path(_env_bar_store) if _env_bar_store.strip() else None
+
+_bar_store: "BarStore | None" = None
+_bar_store_lock = threading.Lock()
+
+def _is_adjusted(kwargs: dict[str, Any]) -> bool:
+    """yfinance defaults to auto_adjust=True; adjusted and raw bars are cached separately."""
+    return kwargs.get("auto_adjust") is None or bool(kwargs.get("auto_adjust"))
+
+class BarStore:
+    """Daily OHLCV bars keyed by (ticker, adjusted, date) plus the date ranges already fetched.
+
+    Coverage is tracked separately from bars so that weekends and holidays inside a fetched
+    window are not mistaken for gaps. The current (possibly still trading) day is never marked
+    as covered, so its bar is refreshed on every run until the session is over.
+
+    Yahoo rescales past prices after a split (and past adjusted prices after a dividend), so
+    a gap is fetched together with one stored bar next to it; when that bar has changed, the
+    series is dropped and fetched again (see _download_one).
+    """
+
+    _COLS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS bars (
+                    ticker TEXT NOT NULL, adjusted INTEGER NOT NULL, date TEXT NOT NULL,
+                    open REAL, high REAL, low REAL, close REAL, adj_close REAL, volume REAL,
+                    source TEXT,
+                    PRIMARY KEY (ticker, adjusted, date)
+                );
+                CREATE TABLE IF NOT EXISTS coverage (
+                    ticker TEXT NOT NULL, adjusted INTEGER NOT NULL,
+                    start TEXT NOT NULL, end TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS coverage_key ON coverage (ticker, adjusted);
+                """
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits (or rolls back) and is closed when the block exits."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _coverage(self, conn: sqlite3.Connection, ticker: str, adjusted: bool) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+        rows = conn.execute(
+            "SELECT start, end FROM coverage WHERE ticker = ? AND adjusted = ? ORDER BY start",
+            (ticker, int(adjusted)),
+        ).fetchall()
+        return [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in rows]
+
+    def missing_ranges(
+        self, ticker: str, adjusted: bool, start: pd.Timestamp, end: pd.Timestamp
+    ) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+        """Return the sub-windows of [start, end) that have never been fetched."""
+        with self._connect() as conn:
+            covered = self._coverage(conn, ticker, adjusted)
+        gaps: list[tuple[pd.Timestamp, pd.Timestamp]] = []
+        cursor = start
+        for cs, ce in covered:
+            if ce <= cursor:
+                continue
+            if cs >= end:
+                break
+            if cs > cursor:
+                gaps.append((cursor, cs))
+            cursor = max(cursor, ce)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def read(self, ticker: str, adjusted: bool, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date, open, high, low, close, adj_close, volume FROM bars "
+                "WHERE ticker = ? AND adjusted = ? AND date >= ? AND date < ? ORDER BY date",
+                (ticker, int(adjusted), start.date().isoformat(), end.date().isoformat()),
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame(columns=self._COLS)
+        df = pd.DataFrame(rows, columns=["Date", *self._COLS])
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df.set_index("Date")
+
+    def write(
+        self,
+        ticker: str,
+        adjusted: bool,
+        df: pd.DataFrame,
+        source: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+    ) -> None:
+        """
+        Upsert bars and record the part of [start, end) they span as fetched, excluding the
+        still-open current day. A partial answer leaves the rest of the window a gap; the
+        sessionless edges of it are marked covered by _fetchable_gaps without a fetch.
+        """
+        df = _normalize_ohlcv(_to_datetime_index(df), ticker)
+        records = [
+            (
+                ticker, int(adjusted), pd.Timestamp(idx).date().isoformat(),
+                *(None if pd.isna(v) else float(v) for v in row),
+                source,
+            )
+            for idx, row in zip(df.index, df[self._COLS].itertuples(index=False, name=None))
+        ]
+        if df.empty:
+            return
+        dates = pd.DatetimeIndex(df.index)
+        dates = dates.tz_localize(None) if dates.tz is not None else dates
+        span_start = max(start, dates.min().normalize())
+        span_end = dates.max().normalize() + pd.Timedelta(days=1)
+        final_end = min(end, span_end, pd.Timestamp.now().normalize())
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO bars "
+                "(ticker, adjusted, date, open, high, low, close, adj_close, volume, source) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            if final_end > span_start:
+                self._add_coverage(conn, ticker, adjusted, span_start, final_end)
+
+    def mark_covered(self, ticker: str, adjusted: bool, start: pd.Timestamp, end: pd.Timestamp) -> None:
+        """Record [start, end) as fetched without bars (e.g. a holiday), excluding the current day."""
+        final_end = min(end, pd.Timestamp.now().normalize())
+        if final_end > start:
+            with self._connect() as conn:
+                self._add_coverage(conn, ticker, adjusted, start, final_end)
+
+    def _add_coverage(
+        self, conn: sqlite3.Connection, ticker: str, adjusted: bool, start: pd.Timestamp, end: pd.Timestamp
+    ) -> None:
+        intervals = self._coverage(conn, ticker, adjusted) + [(start, end)]
+        intervals.sort()
+        merged: list[tuple[pd.Timestamp, pd.Timestamp]] = []
+        for cs, ce in intervals:
+            if merged and cs <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], ce))
+            else:
+                merged.append((cs, ce))
+        conn.execute("DELETE FROM coverage WHERE ticker = ? AND adjusted = ?", (ticker, int(adjusted)))
+        conn.executemany(
+            "INSERT INTO coverage (ticker, adjusted, start, end) VALUES (?, ?, ?, ?)",
+            [(ticker, int(adjusted), cs.date().isoformat(), ce.date().isoformat()) for cs, ce in merged],
+        )
+
+    def neighbour_bar(
+        self, ticker: str, adjusted: bool, start: pd.Timestamp, end: pd.Timestamp, gap_start: pd.Timestamp, gap_end: pd.Timestamp
+    ) -> tuple[pd.Timestamp, float | None, float | None] | None:
+        """
+        The stored bar of [start, end) closest to the gap [gap_start, gap_end) — the last one
+        before it, else the first one after it — as (date, close, adj close).
+        """
+        key = (ticker, int(adjusted))
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT date, close, adj_close FROM bars WHERE ticker = ? AND adjusted = ? "
+                "AND date >= ? AND date < ? ORDER BY date DESC LIMIT 1",
+                (*key, start.date().isoformat(), gap_start.date().isoformat()),
+            ).fetchone() or conn.execute(
+                "SELECT date, close, adj_close FROM bars WHERE ticker = ? AND adjusted = ? "
+                "AND date >= ? AND date < ? ORDER BY date LIMIT 1",
+                (*key, gap_end.date().isoformat(), end.date().isoformat()),
+            ).fetchone()
+        return None if row is None else (pd.Timestamp(row[0]), row[1], row[2])
+
+    def drop_series(self, ticker: str, adjusted: bool) -> None:
+        """Forget every bar and all coverage of one (ticker, adjusted) series."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM bars WHERE ticker = ? AND adjusted = ?", (ticker, int(adjusted)))
+            conn.execute("DELETE FROM coverage WHERE ticker = ? AND adjusted = ?", (ticker, int(adjusted)))
+
+    def clear(self, ticker: str | None = None) -> None:
+        with self._connect() as conn:
+            if ticker is None:
+                conn.execute("DELETE FROM bars")
+                conn.execute("DELETE FROM coverage")
+            else:
+                conn.execute("DELETE FROM bars WHERE ticker = ?", (ticker,))
+                conn.execute("DELETE FROM coverage WHERE ticker = ?", (ticker,))
+
+def get_bar_store() -> BarStore | None:
+    """Return the process-wide bar store, creating it lazily. None when caching is disabled."""
+    global _bar_store
+    if BAR_STORE_PATH is None:
+        return None
+    with _bar_store_lock:
+        if _bar_store is None or _bar_store.path != Path(BAR_STORE_PATH):
+            try:
+                _bar_store = BarStore(Path(BAR_STORE_PATH))
+            except (sqlite3.Error, OSError) as exc:
+                logger.warning("Bar store unavailable at %s (%s). Fetching from network only.", BAR_STORE_PATH, exc)
+                return None
+        return _bar_store
+
+def set_bar_store(path: Path | str | None) -> None:
+    """Point the bar store at a different SQLite file, or pass None to disable caching."""
+    global BAR_STORE_PATH, _bar_store
+    with _bar_store_lock:
+        BAR_STORE_PATH = Path(path) if path else None
+        _bar_store = None
+
+
+
+# ------------------------------
+# Record / replay fixtures
+# ------------------------------
+
+# MARKET_DATA_MODE=record|replay with MARKET_DATA_DIR=<dir> (default ./market_fixtures).
+# record: every download_price_data(_many) result is written to the fixture directory.
+# replay: the same calls are answered from that directory only; nothing touches the network.
+MARKET_DATA_MODE: str | None = None
+MARKET_DATA_DIR: Path = SCRIPT_DIR / "market_fixtures"
+
+def set_market_data_mode(mode: str | None, fixture_dir: Path | str | None = None) -> None:
+    """Switch between live fetching (None), 'record' and 'replay'."""
+    global MARKET_DATA_MODE, MARKET_DATA_DIR
+    mode = (mode or "").strip().lower() or None
+    if mode not in (None, "record", "replay"):
+        raise ValueError(f"Unknown market data mode {mode!r}. Use 'record', 'replay' or None.")
+    MARKET_DATA_MODE = mode
+    if fixture_dir is not None:
+        MARKET_DATA_DIR = Path(fixture_dir)
+
+_env_md_mode = os.environ.get("MARKET_DATA_MODE")
+if _env_md_mode:
+    set_market_data_mode(_env_md_mode, os.environ.get("MARKET_DATA_DIR"))
+
+def _fixture_stem(ticker: str, s: pd.Timestamp, e: pd.Timestamp, adjusted: bool) -> tuple[Path, str]:
+    folder = MARKET_DATA_DIR / quote(ticker.upper(), safe="")
+    return folder, f"{s.date().isoformat()}_{e.date().isoformat()}_{'adj' if adjusted else 'raw'}"
+
+def _record_fixture(ticker: str, s: pd.Timestamp, e: pd.Timestamp, adjusted: bool, res: FetchResult) -> None:
+    folder, stem = _fixture_stem(ticker, s, e, adjusted)
+    folder.mkdir(parents=True, exist_ok=True)
+    for old in folder.glob(f"{stem}.*.csv"):
+        old.unlink()
+    path = folder / f"{stem}.{quote(res.source, safe='')}.csv"
+    tmp = path.with_suffix(".tmp")
+    _normalize_ohlcv(_to_datetime_index(res.df.copy()), ticker).to_csv(tmp, index_label="Date")
+    os.replace(tmp, path)
+
+def _replay_fixture(ticker: str, s: pd.Timestamp, e: pd.Timestamp, adjusted: bool) -> FetchResult:
+    folder, stem = _fixture_stem(ticker, s, e, adjusted)
+    matches = sorted(folder.glob(f"{stem}.*.csv"))
+    if not matches:
+        logger.warning("No recorded fixture for %s [%s, %s) in %s.", ticker, s.date(), e.date(), MARKET_DATA_DIR)
+        empty = pd.DataFrame(columns=["Open", "High", "Low", "Close", "Adj Close", "Volume"])
+        return FetchResult(empty, "replay-miss")
+    path = matches[0]
+    source = unquote(path.name[len(stem) + 1 : -len(".csv")])
+    df = pd.read_csv(path, index_col="Date", parse_dates=True)
+    return FetchResult(_normalize_ohlcv(df, ticker), f"replay:{source}")
 
 
 # ------------------------------
 # File path configuration
 # ------------------------------
 
-def set_data_dir(data_dir: Path) -> None:
+def set_data_dir(data_dir: Path, storage: str | None = None) -> None:
     global DATA_DIR, PORTFOLIO_CSV, TRADE_LOG_CSV
     DATA_DIR = Path(data_dir)
     os.makedirs(DATA_DIR, exist_ok=True)
     PORTFOLIO_CSV = DATA_DIR / "chatgpt_portfolio_update.csv"
     TRADE_LOG_CSV = DATA_DIR / "chatgpt_trade_log.csv"
+    if storage is not None:
+        set_storage_backend(storage)
+
+def set_storage_backend(name: str) -> None:
+    """Select "csv", "parquet" or "auto" storage for the portfolio history and trade log."""
+    global STORAGE_BACKEND
+    STORAGE_BACKEND = resolve_backend_name(name)
+
+def get_storage(portfolio_csv: Path | str | None = None, trade_log_csv: Path | str | None = None) -> StorageBackend:
+    """Storage backend for PORTFOLIO_CSV/TRADE_LOG_CSV (or the given CSV locations)."""
+    return open_storage(
+        STORAGE_BACKEND,
+        portfolio_csv if portfolio_csv is not None else PORTFOLIO_CSV,
+        trade_log_csv if trade_log_csv is not None else TRADE_LOG_CSV,
+    )
+
+def get_ledger(portfolio_csv: Path | str | None = None) -> Ledger:
+    """Position ledger kept next to PORTFOLIO_CSV (or the given CSV)."""
+    return _ledger_for(portfolio_csv if portfolio_csv is not None else PORTFOLIO_CSV)
+
+def record_ledger_events(
+    events: LedgerEvent | list[LedgerEvent],
+    portfolio: pd.DataFrame | list[dict[str, Any]] | None,
+    cash: float | None,
+    portfolio_csv: Path | str | None = None,
+) -> None:
+    """Write trade events through the ledger; `portfolio`/`cash` are the pre-trade state."""
+    get_ledger(portfolio_csv).record(events, portfolio, cash)
 
 
 # ------------------------------
 # Portfolio operations
 # ------------------------------
 
-def _ensure_df(portfolio: pd.DataFrame | dict[str, list[object]] | list[dict[str, object]]) -> pd.DataFrame:
+def _ensure_df(portfolio: pd.DataFrame | Portfolio | dict[str, list[object]] | list[dict[str, object]]) -> pd.DataFrame:
     if isinstance(portfolio, pd.DataFrame):
         return portfolio.copy()
+    if isinstance(portfolio, Portfolio):
+        return portfolio.to_frame().copy()
     if isinstance(portfolio, (dict, list)):
         return pd.DataFrame(portfolio)
-    raise TypeError("portfolio must be a DataFrame, dict, or list[dict]")
+    raise TypeError("portfolio must be a DataFrame, Portfolio, dict, or list[dict]")
+
+
+def _as_book(portfolio: pd.DataFrame | Portfolio | list[dict[str, Any]] | None) -> Portfolio:
+    """The caller's Portfolio itself, or a new one built from a DataFrame / records."""
+    if isinstance(portfolio, Portfolio):
+        return portfolio
+    return Portfolio.from_frame(portfolio if isinstance(portfolio, (pd.DataFrame, list)) else None)
+
+
+def _like(book: Portfolio, original: object) -> pd.DataFrame | Portfolio:
+    """Hand back holdings in the form the caller passed them in."""
+    return book if isinstance(original, Portfolio) else book.to_frame()
+
+
+# ------------------------------
+# Stop-loss / valuation engine
+# ------------------------------
+
+STOP_LOSS_REASON = "AUTOMATED SELL - STOPLOSS TRIGGERED"
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """Vectorized round(x, 2) that matches Python's correctly-rounded builtin exactly.
+
+    np.round scales by 100 first, which can pick the other side of a near-tie; those few
+    values are re-rounded with the builtin.
+    """
+    arr = np.asarray(values, dtype=float)
+    out = np.round(arr, 2)
+    with np.errstate(invalid="ignore"):
+        near_tie = np.abs(np.mod(arr * 100.0, 1.0) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        out[i] = round(float(arr[i]), 2)
+    return out
+
+def latest_bars(prices: dict[str, FetchResult], tickers: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Last bar per ticker as an (n, 4) Open/High/Low/Close array plus a has-data mask.
+
+    A missing or NaN Open falls back to Close, as for a fill at the open.
+    """
+    n = len(tickers)
+    bars = np.full((n, 4), np.nan)
+    has_data = np.zeros(n, dtype=bool)
+    for i, ticker in enumerate(tickers):
+        fetch = prices.get(ticker)
+        data = fetch.df if fetch is not None else pd.DataFrame()
+        if data.empty:
+            continue
+        has_data[i] = True
+        last = data.iloc[-1]
+        bars[i, 0] = float(last["Open"]) if "Open" in data else np.nan
+        bars[i, 1:] = (float(last["High"]), float(last["Low"]), float(last["Close"]))
+    bars[:, 0] = np.where(np.isnan(bars[:, 0]), bars[:, 3], bars[:, 0])
+    return bars, has_data
+
+@dataclass
+class Valuation:
+    """Outcome of one pricing pass over all holdings."""
+    results: pd.DataFrame          # one portfolio-CSV row per holding, in portfolio order
+    sells: pd.DataFrame            # trade-log rows for triggered stops
+    sold: np.ndarray               # bool mask over holdings
+    no_data: np.ndarray            # bool mask over holdings
+    hold_value: float
+    hold_pnl: float
+    proceeds: np.ndarray           # cash raised by each stop-loss sell, in holding order
+
+    def settle(self, cash: float) -> float:
+        """Cash after crediting the stop-loss proceeds (added in order, as the fills happen)."""
+        return float(sum(self.proceeds.tolist(), cash))
+
+def value_positions(portfolio_df: pd.DataFrame, bars: np.ndarray, has_data: np.ndarray, today_iso: str) -> Valuation:
+    """
+    Apply stop-losses and mark every holding to market in one pass.
+
+    A stop triggers when the day's Low is at or below a non-zero stop; the fill is the Open
+    if it gapped below the stop, otherwise the stop. Untriggered holdings are valued at Close.
+    Shares are truncated to whole shares, and values/PnL rounded to cents, as the CSVs expect.
+    """
+    n = len(portfolio_df)
+    tickers = portfolio_df["ticker"].astype(str).str.upper().to_numpy(dtype=object) if n else np.array([], dtype=object)
+
+    def col(name: str) -> np.ndarray:
+        if name not in portfolio_df:
+            return np.full(n, np.nan)
+        return pd.to_numeric(portfolio_df[name], errors="coerce").to_numpy(dtype=float)
+
+    raw_shares = col("shares")
+    shares = np.where(np.isnan(raw_shares), 0.0, np.trunc(raw_shares)).astype(np.int64)
+    cost = np.nan_to_num(col("buy_price"), nan=0.0)
+    raw_basis = col("cost_basis")
+    cost_basis = np.where(np.isnan(raw_basis), cost * shares, raw_basis)
+    stop = np.nan_to_num(col("stop_loss"), nan=0.0)
+
+    o, l, c = bars[:, 0], bars[:, 2], bars[:, 3]
+    with np.errstate(invalid="ignore"):
+        sold = has_data & (stop != 0) & (l <= stop)
+    held = has_data & ~sold
+    no_data = ~has_data
+
+    price = np.where(sold, _round2(np.where(o <= stop, o, stop)), _round2(c))
+    value = _round2(price * shares)
+    pnl = _round2((price - cost) * shares)
+
+    blank = np.full(n, "", dtype=object)
+    action = np.where(sold, "SELL - Stop Loss Triggered", np.where(no_data, "NO DATA", "HOLD")).astype(object)
+    results = pd.DataFrame({
+        "Date": np.full(n, today_iso, dtype=object),
+        "Ticker": tickers,
+        "Shares": shares.tolist(),
+        "Buy Price": cost.tolist(),
+        "Cost Basis": cost_basis.tolist(),
+        "Stop Loss": stop.tolist(),
+        "Current Price": np.where(no_data, blank, np.array(price.tolist(), dtype=object)),
+        "Total Value": np.where(no_data, blank, np.array(value.tolist(), dtype=object)),
+        "PnL": np.where(no_data, blank, np.array(pnl.tolist(), dtype=object)),
+        "Action": action,
+        "Cash Balance": blank,
+        "Total Equity": blank.copy(),
+    })
+
+    sells = pd.DataFrame({
+        "Date": np.full(int(sold.sum()), today_iso, dtype=object),
+        "Ticker": tickers[sold],
+        "Shares Sold": shares[sold].tolist(),
+        "Sell Price": price[sold].tolist(),
+        "Cost Basis": cost[sold].tolist(),
+        "PnL": pnl[sold].tolist(),
+        "Reason": STOP_LOSS_REASON,
+    })
+
+    # Accumulate left to right so totals match row-by-row float addition exactly
+    return Valuation(
+        results=results,
+        sells=sells,
+        sold=sold,
+        no_data=no_data,
+        hold_value=float(sum(value[held].tolist(), 0.0)),
+        hold_pnl=float(sum(pnl[held].tolist(), 0.0)),
+        proceeds=value[sold],
+    )
+
+def portfolio_day_rows(valuation: Valuation, cash: float, today_iso: str) -> pd.DataFrame:
+    """One day's portfolio-history rows: the holdings from `valuation` plus the TOTAL row."""
+    total_value = valuation.hold_value
+    total_pnl = valuation.hold_pnl
+
+    total_row = {
+        "Date": today_iso, "Ticker": "TOTAL", "Shares": "", "Buy Price": "",
+        "Cost Basis": "", "Stop Loss": "", "Current Price": "",
+        "Total Value": round(total_value, 2), "PnL": round(total_pnl, 2),
+        "Action": "", "Cash Balance": round(cash, 2),
+        "Total Equity": round(total_value + cash, 2),
+    }
+    total_df = pd.DataFrame([total_row])
+    return pd.concat([valuation.results, total_df], ignore_index=True) if not valuation.results.empty else total_df
 
 def process_portfolio(
-    portfolio: pd.DataFrame | dict[str, list[object]] | list[dict[str, object]],
+    portfolio: pd.DataFrame | Portfolio | dict[str, list[object]] | list[dict[str, object]],
     cash: float,
     interactive: bool = True,
+    orders: list[Order] | None = None,
 ) -> tuple[pd.DataFrame, float]:
     today_iso = last_trading_date().date().isoformat()
     portfolio_df = _ensure_df(portfolio)
 
-    results: list[dict[str, object]] = []
-    total_value = 0.0
-    total_pnl = 0.0
+    # ------- Batch orders (replace the interactive prompts) -------
+    if orders is not None:
+        book, cash = execute_orders(orders, portfolio_df, cash)
+        portfolio_df = book.to_frame()
+        interactive = False
 
     # ------- Interactive trade entry (supports MOO) -------
     if interactive:
+        book = Portfolio.from_frame(portfolio_df)
         while True:
-            print(portfolio_df)
+            print(book.to_frame())
             action = input(
                 f""" You have {cash} in cash.
 Would you like to log a manual trade? Enter 'b' for buy, 's' for sell, or press Enter to continue: """
@@ -458,40 +1933,13 @@ Would you like to log a manual trade? Enter 'b' for buy, 's' for sell, or press
                         "Reason": "MANUAL BUY MOO - Filled",
                     }
                     # --- Manual BUY MOO logging ---
-                    if os.path.exists(TRADE_LOG_CSV):
-                        df_log = pd.read_csv(TRADE_LOG_CSV)
-                        if df_log.empty:
-                            df_log = pd.DataFrame([log])
-                        else:
-                            df_log = pd.concat([df_log, pd.DataFrame([log])], ignore_index=True)
-                    else:
-                        df_log = pd.DataFrame([log])
-                    df_log.to_csv(TRADE_LOG_CSV, index=False)
-
-                    rows = portfolio_df.loc[portfolio_df["ticker"].astype(str).str.upper() == ticker.upper()]
-                    if rows.empty:
-                        new_trade = {
-                            "ticker": ticker,
-                            "shares": float(shares),
-                            "stop_loss": float(stop_loss),
-                            "buy_price": float(exec_price),
-                            "cost_basis": float(notional),
-                        }
-                        if portfolio_df.empty:
-                            portfolio_df = pd.DataFrame([new_trade])
-                        else:
-                            portfolio_df = pd.concat([portfolio_df, pd.DataFrame([new_trade])], ignore_index=True)
-                    else:
-                        idx = rows.index[0]
-                        cur_shares = float(portfolio_df.at[idx, "shares"])
-                        cur_cost = float(portfolio_df.at[idx, "cost_basis"])
-                        new_shares = cur_shares + float(shares)
-                        new_cost = cur_cost + float(notional)
-                        avg_price = new_cost / new_shares if new_shares else 0.0
-                        portfolio_df.at[idx, "shares"] = new_shares
-                        portfolio_df.at[idx, "cost_basis"] = new_cost
-                        portfolio_df.at[idx, "buy_price"] = avg_price
-                        portfolio_df.at[idx, "stop_loss"] = float(stop_loss)
+                    append_trade_log(log)
+                    record_ledger_events(
+                        LedgerEvent("BUY", today_iso, ticker, float(shares), exec_price,
+                                    stop_loss=float(stop_loss), amount=notional, reason=log["Reason"]),
+                        book, cash,
+                    )
+                    book.buy(ticker, float(shares), float(exec_price), float(stop_loss), cost=float(notional))
 
                     cash -= notional
                     print(f"Manual BUY MOO for {ticker} filled at ${exec_price:.2f} ({fetch.source}).")
@@ -507,8 +1955,8 @@ Would you like to log a manual trade? Enter 'b' for buy, 's' for sell, or press
                         print("Invalid input. Limit buy cancelled.")
                         continue
 
-                    cash, portfolio_df = log_manual_buy(
-                        buy_price, shares, ticker, stop_loss, cash, portfolio_df
+                    cash, book = log_manual_buy(
+                        buy_price, shares, ticker, stop_loss, cash, book
                     )
                     continue
                 else:
@@ -526,88 +1974,44 @@ Would you like to log a manual trade? Enter 'b' for buy, 's' for sell, or press
                     print("Invalid input. Manual sell cancelled.")
                     continue
 
-                cash, portfolio_df = log_manual_sell(
-                    sell_price, shares, ticker, cash, portfolio_df
+                cash, book = log_manual_sell(
+                    sell_price, shares, ticker, cash, book
                 )
                 continue
 
             break  # proceed to pricing
+        portfolio_df = book.to_frame()
 
     # ------- Daily pricing + stop-loss execution -------
     s, e = trading_day_window()
-    for _, stock in portfolio_df.iterrows():
-        ticker = str(stock["ticker"]).upper()
-        shares = int(stock["shares"]) if not pd.isna(stock["shares"]) else 0
-        cost = float(stock["buy_price"]) if not pd.isna(stock["buy_price"]) else 0.0
-        cost_basis = float(stock["cost_basis"]) if not pd.isna(stock["cost_basis"]) else cost * shares
-        stop = float(stock["stop_loss"]) if not pd.isna(stock["stop_loss"]) else 0.0
-
-        fetch = download_price_data(ticker, start=s, end=e, auto_adjust=False, progress=False)
-        data = fetch.df
-
-        if data.empty:
-            print(f"No data for {ticker} (source={fetch.source}).")
-            row = {
-                "Date": today_iso, "Ticker": ticker, "Shares": shares,
-                "Buy Price": cost, "Cost Basis": cost_basis, "Stop Loss": stop,
-                "Current Price": "", "Total Value": "", "PnL": "",
-                "Action": "NO DATA", "Cash Balance": "", "Total Equity": "",
-            }
-            results.append(row)
-            continue
-
-        o = float(data["Open"].iloc[-1]) if "Open" in data else np.nan
-        h = float(data["High"].iloc[-1])
-        l = float(data["Low"].iloc[-1])
-        c = float(data["Close"].iloc[-1])
-        if np.isnan(o):
-            o = c
-
-        if stop and l <= stop:
-            exec_price = round(o if o <= stop else stop, 2)
-            value = round(exec_price * shares, 2)
-            pnl = round((exec_price - cost) * shares, 2)
-            action = "SELL - Stop Loss Triggered"
-            cash += value
-            portfolio_df = log_sell(ticker, shares, exec_price, cost, pnl, portfolio_df)
-            row = {
-                "Date": today_iso, "Ticker": ticker, "Shares": shares,
-                "Buy Price": cost, "Cost Basis": cost_basis, "Stop Loss": stop,
-                "Current Price": exec_price, "Total Value": value, "PnL": pnl,
-                "Action": action, "Cash Balance": "", "Total Equity": "",
-            }
+    tickers = portfolio_df["ticker"].astype(str).str.upper().tolist() if "ticker" in portfolio_df else []
+    prices = download_price_data_many(tickers, start=s, end=e, auto_adjust=False, progress=False)
+    bars, has_data = latest_bars(prices, tickers)
+    valuation = value_positions(portfolio_df, bars, has_data, today_iso)
+
+    for i in np.flatnonzero(valuation.no_data | valuation.sold):
+        if valuation.no_data[i]:
+            print(f"No data for {tickers[i]} (source={prices[tickers[i]].source}).")
         else:
-            price = round(c, 2)
-            value = round(price * shares, 2)
-            pnl = round((price - cost) * shares, 2)
-            action = "HOLD"
-            total_value += value
-            total_pnl += pnl
-            row = {
-                "Date": today_iso, "Ticker": ticker, "Shares": shares,
-                "Buy Price": cost, "Cost Basis": cost_basis, "Stop Loss": stop,
-                "Current Price": price, "Total Value": value, "PnL": pnl,
-                "Action": action, "Cash Balance": "", "Total Equity": "",
-            }
-
-        results.append(row)
-
-    total_row = {
-        "Date": today_iso, "Ticker": "TOTAL", "Shares": "", "Buy Price": "",
-        "Cost Basis": "", "Stop Loss": "", "Current Price": "",
-        "Total Value": round(total_value, 2), "PnL": round(total_pnl, 2),
-        "Action": "", "Cash Balance": round(cash, 2),
-        "Total Equity": round(total_value + cash, 2),
-    }
-    results.append(total_row)
+            print(f"{tickers[i]} stop loss was met. Selling all shares.")
+    if valuation.sold.any():
+        record_ledger_events(
+            [
+                LedgerEvent("STOP", today_iso, t, float(n), float(p), amount=float(amt), reason=STOP_LOSS_REASON)
+                for t, n, p, amt in zip(valuation.sells["Ticker"], valuation.sells["Shares Sold"],
+                                        valuation.sells["Sell Price"], valuation.proceeds.tolist())
+            ],
+            portfolio_df, cash,
+        )
+        cash = valuation.settle(cash)
+        portfolio_df = portfolio_df[~portfolio_df["ticker"].isin(valuation.sells["Ticker"])]
+        append_trade_log(valuation.sells)
 
-    df_out = pd.DataFrame(results)
-    if PORTFOLIO_CSV.exists():
-        existing = pd.read_csv(PORTFOLIO_CSV)
-        existing = existing[existing["Date"] != str(today_iso)]
-        print("Saving results to CSV...")
-        df_out = pd.concat([existing, df_out], ignore_index=True)
-    df_out.to_csv(PORTFOLIO_CSV, index=False)
+    df_out = portfolio_day_rows(valuation, cash, today_iso)
+    storage = get_storage()
+    if storage.history_exists():
+        print("Saving results to CSV..." if storage.name == "csv" else "Saving results...")
+    commit_portfolio_day(today_iso, df_out, storage)
 
     return portfolio_df, cash
 
@@ -617,6 +2021,61 @@ Would you like to log a manual trade? Enter 'b' for buy, 's' for sell, or press
 # Trade logging
 # ------------------------------
 
+class TradeLogWriter:
+    """
+    Appends trade-log rows through the storage backend instead of re-reading and rewriting
+    the whole log (see CsvStorage.append_trades for the in-place CSV append). Inside
+    ``batch()`` rows are buffered and flushed once when the outermost batch exits.
+    """
+
+    def __init__(self) -> None:
+        self._pending: list[dict[str, Any]] = []
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def append(self, rows: dict[str, Any] | list[dict[str, Any]] | pd.DataFrame) -> None:
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.to_dict(orient="records")
+        elif isinstance(rows, dict):
+            rows = [rows]
+        with self._lock:
+            self._pending.extend(rows)
+            if self._depth == 0:
+                self.flush()
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            get_storage().append_trades(rows)
+
+
+_trade_log = TradeLogWriter()
+
+def append_trade_log(rows: dict[str, Any] | list[dict[str, Any]] | pd.DataFrame) -> None:
+    """Record trade-log rows (written now, or when the enclosing trade_log_batch() ends)."""
+    _trade_log.append(rows)
+
+def trade_log_batch():
+    """Buffer trade-log rows for the duration of a ``with`` block and write them once."""
+    return _trade_log.batch()
+
+def flush_trade_log() -> None:
+    _trade_log.flush()
+
 def log_sell(
     ticker: str,
     shares: float,
@@ -633,20 +2092,11 @@ def log_sell(
         "Sell Price": price,
         "Cost Basis": cost,
         "PnL": pnl,
-        "Reason": "AUTOMATED SELL - STOPLOSS TRIGGERED",
+        "Reason": STOP_LOSS_REASON,
     }
     print(f"{ticker} stop loss was met. Selling all shares.")
     portfolio = portfolio[portfolio["ticker"] != ticker]
-
-    if TRADE_LOG_CSV.exists():
-        df = pd.read_csv(TRADE_LOG_CSV)
-        if df.empty:
-            df = pd.DataFrame([log])
-        else:
-            df = pd.concat([df, pd.DataFrame([log])], ignore_index=True)
-    else:
-        df = pd.DataFrame([log])
-    df.to_csv(TRADE_LOG_CSV, index=False)
+    append_trade_log(log)
     return portfolio
 
 def log_manual_buy(
@@ -655,9 +2105,9 @@ def log_manual_buy(
     ticker: str,
     stoploss: float,
     cash: float,
-    chatgpt_portfolio: pd.DataFrame,
+    chatgpt_portfolio: pd.DataFrame | Portfolio,
     interactive: bool = True,
-) -> tuple[float, pd.DataFrame]:
+) -> tuple[float, pd.DataFrame | Portfolio]:
     today = check_weekend()
 
     if interactive:
@@ -669,7 +2119,9 @@ def log_manual_buy(
             print("Returning...")
             return cash, chatgpt_portfolio
 
-    if not isinstance(chatgpt_portfolio, pd.DataFrame) or chatgpt_portfolio.empty:
+    if not isinstance(chatgpt_portfolio, (pd.DataFrame, Portfolio)) or (
+        isinstance(chatgpt_portfolio, pd.DataFrame) and chatgpt_portfolio.empty
+    ):
         chatgpt_portfolio = pd.DataFrame(
             columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"]
         )
@@ -709,61 +2161,28 @@ def log_manual_buy(
         "PnL": 0.0,
         "Reason": "MANUAL BUY LIMIT - Filled",
     }
-    if os.path.exists(TRADE_LOG_CSV):
-        df = pd.read_csv(TRADE_LOG_CSV)
-        if df.empty:
-            df = pd.DataFrame([log])
-        else:
-            df = pd.concat([df, pd.DataFrame([log])], ignore_index=True)
-    else:
-        df = pd.DataFrame([log])
-    df.to_csv(TRADE_LOG_CSV, index=False)
-
-    rows = chatgpt_portfolio.loc[chatgpt_portfolio["ticker"].str.upper() == ticker.upper()]
-    if rows.empty:
-        if chatgpt_portfolio.empty:
-            chatgpt_portfolio = pd.DataFrame([{
-                "ticker": ticker,
-                "shares": float(shares),
-                "stop_loss": float(stoploss),
-                "buy_price": float(exec_price),
-                "cost_basis": float(cost_amt),
-            }])
-        else:
-            chatgpt_portfolio = pd.concat(
-                [chatgpt_portfolio, pd.DataFrame([{
-                    "ticker": ticker,
-                    "shares": float(shares),
-                    "stop_loss": float(stoploss),
-                    "buy_price": float(exec_price),
-                    "cost_basis": float(cost_amt),
-                }])],
-                ignore_index=True
-            )
-    else:
-        idx = rows.index[0]
-        cur_shares = float(chatgpt_portfolio.at[idx, "shares"])
-        cur_cost = float(chatgpt_portfolio.at[idx, "cost_basis"])
-        new_shares = cur_shares + float(shares)
-        new_cost = cur_cost + float(cost_amt)
-        chatgpt_portfolio.at[idx, "shares"] = new_shares
-        chatgpt_portfolio.at[idx, "cost_basis"] = new_cost
-        chatgpt_portfolio.at[idx, "buy_price"] = new_cost / new_shares if new_shares else 0.0
-        chatgpt_portfolio.at[idx, "stop_loss"] = float(stoploss)
+    append_trade_log(log)
+    book = _as_book(chatgpt_portfolio)
+    record_ledger_events(
+        LedgerEvent("BUY", today, ticker, float(shares), float(exec_price),
+                    stop_loss=float(stoploss), amount=cost_amt, reason=log["Reason"]),
+        book, cash,
+    )
+    book.buy(ticker, float(shares), float(exec_price), float(stoploss), cost=float(cost_amt))
 
     cash -= cost_amt
     print(f"Manual BUY LIMIT for {ticker} filled at ${exec_price:.2f} ({fetch.source}).")
-    return cash, chatgpt_portfolio
+    return cash, _like(book, chatgpt_portfolio)
 
 def log_manual_sell(
     sell_price: float,
     shares_sold: float,
     ticker: str,
     cash: float,
-    chatgpt_portfolio: pd.DataFrame,
+    chatgpt_portfolio: pd.DataFrame | Portfolio,
     reason: str | None = None,
     interactive: bool = True,
-) -> tuple[float, pd.DataFrame]:
+) -> tuple[float, pd.DataFrame | Portfolio]:
     today = check_weekend()
     if interactive:
         reason = input(
@@ -776,12 +2195,12 @@ If this is a mistake, enter 1. """
     elif reason is None:
         reason = ""
 
-    if ticker not in chatgpt_portfolio["ticker"].values:
+    book = _as_book(chatgpt_portfolio)
+    if ticker not in book:
         print(f"Manual sell for {ticker} failed: ticker not in portfolio.")
         return cash, chatgpt_portfolio
 
-    ticker_row = chatgpt_portfolio[chatgpt_portfolio["ticker"] == ticker]
-    total_shares = int(ticker_row["shares"].item())
+    total_shares = int(book.value(ticker, "shares"))
     if shares_sold > total_shares:
         print(f"Manual sell for {ticker} failed: trying to sell {shares_sold} shares but only own {total_shares}.")
         return cash, chatgpt_portfolio
@@ -807,7 +2226,7 @@ If this is a mistake, enter 1. """
         print(f"Sell limit ${sell_price:.2f} for {ticker} not reached today (range {l:.2f}-{h:.2f}). Order not filled.")
         return cash, chatgpt_portfolio
 
-    buy_price = float(ticker_row["buy_price"].item())
+    buy_price = book.value(ticker, "buy_price")
     cost_basis = buy_price * shares_sold
     pnl = exec_price * shares_sold - cost_basis
 
@@ -818,57 +2237,444 @@ If this is a mistake, enter 1. """
         "Reason": f"MANUAL SELL LIMIT - {reason}", "Shares Sold": shares_sold,
         "Sell Price": exec_price,
     }
-    if os.path.exists(TRADE_LOG_CSV):
-        df = pd.read_csv(TRADE_LOG_CSV)
-        if df.empty:
-            df = pd.DataFrame([log])
-        else:
-            df = pd.concat([df, pd.DataFrame([log])], ignore_index=True)
-    else:
-        df = pd.DataFrame([log])
-    df.to_csv(TRADE_LOG_CSV, index=False)
-
+    append_trade_log(log)
+    record_ledger_events(
+        LedgerEvent("SELL", today, ticker, float(shares_sold), float(exec_price),
+                    amount=shares_sold * exec_price, reason=log["Reason"]),
+        book, cash,
+    )
 
     if total_shares == shares_sold:
-        chatgpt_portfolio = chatgpt_portfolio[chatgpt_portfolio["ticker"] != ticker]
+        book.remove(ticker)
     else:
-        row_index = ticker_row.index[0]
-        chatgpt_portfolio.at[row_index, "shares"] = total_shares - shares_sold
-        chatgpt_portfolio.at[row_index, "cost_basis"] = (
-            chatgpt_portfolio.at[row_index, "shares"] * chatgpt_portfolio.at[row_index, "buy_price"]
-        )
+        remaining = total_shares - shares_sold
+        book.update(ticker, shares=remaining, cost_basis=remaining * buy_price)
 
     cash += shares_sold * exec_price
     print(f"Manual SELL LIMIT for {ticker} filled at ${exec_price:.2f} ({fetch.source}).")
-    return cash, chatgpt_portfolio
+    return cash, _like(book, chatgpt_portfolio)
 
 
 
 # ------------------------------
-# Reporting / Metrics
+# Batch orders
 # ------------------------------
 
-def daily_results(chatgpt_portfolio: pd.DataFrame, cash: float) -> None:
-    """Print daily price updates and performance metrics (incl. CAPM)."""
-    portfolio_dict: list[dict[Any, Any]] = chatgpt_portfolio.to_dict(orient="records")
+ORDER_KINDS = {("buy", "moo"), ("buy", "limit"), ("sell", "limit")}
+
+
+@dataclass(frozen=True)
+class Order:
+    """One decision from an orders file: a MOO buy, a limit buy or a limit sell."""
+    action: str                     # "buy" | "sell"
+    type: str                       # "moo" | "limit"
+    ticker: str
+    shares: float
+    limit_price: float | None = None
+    stop_loss: float = 0.0
+    reason: str = ""
+
+    @classmethod
+    def from_dict(cls, raw: dict[str, Any], position: int = 0) -> "Order":
+        where = f"Order #{position + 1}"
+        if not isinstance(raw, dict):
+            raise ValueError(f"{where} must be an object, got {type(raw).__name__}")
+        action = str(raw.get("action", "")).strip().lower()
+        kind = str(raw.get("type", "limit" if action == "sell" else "")).strip().lower()
+        if (action, kind) not in ORDER_KINDS:
+            raise ValueError(f"{where}: unsupported order {action!r}/{kind!r}; use buy/moo, buy/limit or sell/limit")
+        ticker = str(raw.get("ticker", "")).strip().upper()
+        if not ticker:
+            raise ValueError(f"{where}: ticker is required")
+        try:
+            shares = float(raw["shares"])
+            limit = float(raw["limit_price"]) if kind == "limit" else None
+            stop = float(raw.get("stop_loss") or 0.0)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"{where}: shares{' and limit_price' if kind == 'limit' else ''} must be numbers")
+        if shares <= 0 or (limit is not None and limit <= 0) or stop < 0:
+            raise ValueError(f"{where}: shares and limit_price must be positive and stop_loss non-negative")
+        return cls(action, kind, ticker, shares, limit, stop, str(raw.get("reason") or ""))
+
+
+def load_orders(path: Path | str) -> list[Order]:
+    """Orders from a JSON file holding a list of orders (or {"orders": [...]})."""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        data = data.get("orders")
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of orders or an object with an 'orders' list")
+    return [Order.from_dict(raw, i) for i, raw in enumerate(data)]
+
+
+def order_fill_prices(orders: list[Order], bars: np.ndarray, has_data: np.ndarray) -> np.ndarray:
+    """
+    Fill price of every order against its ticker's bar (NaN when it does not fill), with
+    the same rules as the interactive path: MOO buys fill at the Open rounded to cents;
+    limit buys at the Open if it is at or below the limit, else at the limit if the Low
+    reaches it; limit sells at the Open if it is at or above the limit, else at the limit
+    if the High reaches it.
+    """
+    o, h, l = bars[:, 0], bars[:, 1], bars[:, 2]
+    limit = np.array([np.nan if x.limit_price is None else x.limit_price for x in orders], dtype=float)
+    is_moo = np.array([x.type == "moo" for x in orders], dtype=bool)
+    is_buy = np.array([x.action == "buy" for x in orders], dtype=bool)
+    with np.errstate(invalid="ignore"):
+        buy_limit = np.where(o <= limit, o, np.where(l <= limit, limit, np.nan))
+        sell_limit = np.where(o >= limit, o, np.where(h >= limit, limit, np.nan))
+    price = np.select([is_moo, is_buy], [_round2(o), buy_limit], sell_limit)
+    return np.where(has_data, price, np.nan)
+
+
+def execute_orders(
+    orders: list[Order],
+    portfolio: pd.DataFrame | Portfolio,
+    cash: float,
+) -> tuple[Portfolio, float]:
+    """
+    Execute a list of orders in one pass.
+
+    Bars for every ticker are fetched in one batch and all fills are priced at once. Sells
+    run first, then buys, each in file order, so the cash and share checks are deterministic.
+    Trade-log rows and ledger events for the whole batch are written together at the end.
+    """
     today = check_weekend()
+    book = _as_book(portfolio)
+    pre_trade, opening_cash = book.copy(), cash
+    if not orders:
+        return book, cash
 
-    rows: list[list[str]] = []
-    header = ["Ticker", "Close", "% Chg", "Volume"]
+    tickers = [o.ticker for o in orders]
+    s, e = trading_day_window()
+    prices = download_price_data_many(list(dict.fromkeys(tickers)), start=s, end=e, auto_adjust=False, progress=False)
+    bars, has_data = latest_bars(prices, tickers)
+    sources = {t: fetch.source for t, fetch in prices.items()}
+    cash, log_rows, events = fill_orders(orders, book, cash, bars, has_data, today, sources)
+
+    append_trade_log(log_rows)
+    record_ledger_events(events, pre_trade, opening_cash)
+    return book, cash
+
+
+def fill_orders(
+    orders: list[Order],
+    book: Portfolio,
+    cash: float,
+    bars: np.ndarray,
+    has_data: np.ndarray,
+    today: str,
+    sources: dict[str, str] | None = None,
+    report: Callable[[str], None] | None = print,
+) -> tuple[float, list[dict[str, Any]], list[LedgerEvent]]:
+    """
+    Fill `orders` against one day's bars (one OHLC row per order), updating `book` in place.
+
+    Returns the new cash balance with the trade-log rows and ledger events of the fills;
+    writing them is left to the caller. `report` receives one message per order, naming
+    the price source from `sources` (ticker -> source, "unknown" when missing).
+    """
+    report = report or (lambda _msg: None)
+    sources = sources or {}
+    fills = order_fill_prices(orders, bars, has_data)
+    log_rows: list[dict[str, Any]] = []
+    events: list[LedgerEvent] = []
+    sequence = [i for i, o in enumerate(orders) if o.action == "sell"] + [i for i, o in enumerate(orders) if o.action == "buy"]
+    for i in sequence:
+        order, price = orders[i], float(fills[i])
+        label = f"{order.action.upper()} {order.type.upper()} {order.ticker}"
+        if not has_data[i]:
+            report(f"{label} failed: no market data available (source={sources.get(order.ticker, 'unknown')}).")
+            continue
+        if np.isnan(price):
+            if order.limit_price is None:
+                report(f"{label} failed: no opening price available.")
+            else:
+                report(f"{label} limit ${order.limit_price:.2f} not reached today "
+                       f"(range {bars[i, 2]:.2f}-{bars[i, 1]:.2f}). Order not filled.")
+            continue
+
+        if order.action == "buy":
+            cost = price * order.shares
+            if cost > cash:
+                report(f"{label} failed: cost {cost:.2f} exceeds cash {cash:.2f}.")
+                continue
+            reason = "MANUAL BUY MOO - Filled" if order.type == "moo" else "MANUAL BUY LIMIT - Filled"
+            log_rows.append({
+                "Date": today, "Ticker": order.ticker, "Shares Bought": order.shares, "Buy Price": price,
+                "Cost Basis": cost, "PnL": 0.0, "Reason": reason,
+            })
+            events.append(LedgerEvent("BUY", today, order.ticker, order.shares, price,
+                                      stop_loss=order.stop_loss, amount=cost, reason=reason))
+            book.buy(order.ticker, order.shares, price, order.stop_loss, cost=cost)
+            cash -= cost
+        else:
+            if order.ticker not in book:
+                report(f"{label} failed: ticker not in portfolio.")
+                continue
+            total_shares = int(book.value(order.ticker, "shares"))
+            if order.shares > total_shares:
+                report(f"{label} failed: trying to sell {order.shares} shares but only own {total_shares}.")
+                continue
+            buy_price = book.value(order.ticker, "buy_price")
+            cost_basis = buy_price * order.shares
+            reason = f"MANUAL SELL LIMIT - {order.reason}"
+            log_rows.append({
+                "Date": today, "Ticker": order.ticker, "Shares Bought": "", "Buy Price": "",
+                "Cost Basis": cost_basis, "PnL": price * order.shares - cost_basis,
+                "Reason": reason, "Shares Sold": order.shares, "Sell Price": price,
+            })
+            events.append(LedgerEvent("SELL", today, order.ticker, order.shares, price,
+                                      amount=order.shares * price, reason=reason))
+            if total_shares == order.shares:
+                book.remove(order.ticker)
+            else:
+                remaining = total_shares - order.shares
+                book.update(order.ticker, shares=remaining, cost_basis=remaining * buy_price)
+            cash += order.shares * price
+        report(f"{label} filled at ${price:.2f} ({sources.get(order.ticker, 'unknown')}).")
+
+    return cash, log_rows, events
+
+
+# ------------------------------
+# Reporting / Metrics
+# ------------------------------
 
+def _daily_price_window() -> tuple[pd.Timestamp, pd.Timestamp]:
+    """[start, end) for the daily price table: enough history for 2 sessions even around holidays."""
     end_d = last_trading_date()                           # Fri on weekends
-    start_d = (end_d - pd.Timedelta(days=4)).normalize()  # go back enough to capture 2 sessions even around holidays
-    
+    start_d = (end_d - pd.Timedelta(days=4)).normalize()
+    return start_d, end_d + pd.Timedelta(days=1)
+
+def plan_run_fetches(
+    portfolio: pd.DataFrame,
+    storage: StorageBackend | None = None,
+    orders: list[Order] | None = None,
+) -> FetchPlan:
+    """
+    Collect the price needs of one process_portfolio + daily_results run.
+
+    Holdings are needed raw for the trading-day window and adjusted for the daily table;
+    benchmarks for the daily table; ^GSPC and the benchmarks adjusted for the days the
+    risk-metric state has not settled yet (the whole equity history when it has to be
+    rebuilt), which the plan merges with the daily-table window into one fetch per symbol.
+    Tickers in `orders` are planned like holdings. Anything not planned here (e.g. a ticker
+    bought interactively) is still fetched on demand.
+    """
+    plan = FetchPlan()
+    holdings = [str(t) for t in _ensure_df(portfolio).get("ticker", pd.Series(dtype=str)).dropna()]
+    holdings += [o.ticker for o in orders or []]
+    s, e = trading_day_window()
+    plan.add(holdings, start=s, end=e, auto_adjust=False)
+
+    start_d, end_d = _daily_price_window()
+    benchmarks = list(load_benchmarks())
+    plan.add(holdings + benchmarks, start=start_d, end=end_d)
+
+    # process_portfolio stages today's TOTAL row before daily_results settles the risk state
+    storage = storage if storage is not None else get_storage()
+    last = last_trading_date()
+    saved = RiskState.load(storage.read_risk_state())
+    if saved is not None and saved.benchmarks == benchmarks:
+        needed = saved.market_needed_from()
+        first = min(pd.Timestamp(needed), last) if needed else last
+    else:
+        dates = pd.Series(dtype="datetime64[ns]")
+        if storage.history_exists():
+            try:
+                hist = storage.read_history(columns=["Date"], tickers=["TOTAL"])
+                dates = pd.to_datetime(hist["Date"], errors="coerce").dropna()
+            except (ValueError, KeyError):
+                pass
+        first = min(dates.min(), last) if not dates.empty else last
+    plan.add(["^GSPC", *benchmarks], *_market_window(first, last))
+    return plan
+
+def _market_window(first: Any, last: Any) -> tuple[pd.Timestamp, pd.Timestamp]:
+    """[start, end) of ^GSPC bars for dates first..last, plus the session before `first`."""
+    return pd.Timestamp(first).normalize() - pd.Timedelta(days=10), pd.Timestamp(last).normalize() + pd.Timedelta(days=1)
+
+def _market_closes(first: Any, last: Any, benchmarks: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    Closes by date of ^GSPC and `benchmarks` (adjusted, as the CAPM has always used), one
+    column per symbol, from one batched request.
+    """
+    start, end = _market_window(first, last)
+    prices = download_price_data_many(["^GSPC", *benchmarks], start=start, end=end, progress=False)
+    columns: dict[str, pd.Series] = {}
+    for ticker, fetch in prices.items():
+        if fetch.df.empty or "Close" not in fetch.df:
+            columns[ticker] = pd.Series(dtype=float)
+            continue
+        close = fetch.df["Close"].astype(float)
+        index = pd.DatetimeIndex(close.index)
+        columns[ticker] = close.set_axis(index.tz_localize(None).normalize() if index.tz is not None else index.normalize())
+    return pd.DataFrame(columns, columns=list(prices))
+
+def _total_equity_series(storage: StorageBackend) -> pd.Series:
+    """Total Equity of the TOTAL rows by date (only the columns needed are read)."""
+    totals = storage.read_history(columns=["Date", "Ticker", "Total Equity"], tickers=["TOTAL"])
+    if totals.empty:
+        return pd.Series(dtype=float)
+    dates = pd.to_datetime(totals["Date"], errors="coerce")
+    equity = pd.to_numeric(totals["Total Equity"], errors="coerce")
+    series = pd.Series(equity.to_numpy(dtype=float), index=pd.DatetimeIndex(dates))
+    return series[series.index.notna()].sort_index(kind="stable")
+
+def risk_state(storage: StorageBackend | None = None) -> RiskState:
+    """
+    Risk-metric state for the TOTAL-equity history, with every recorded day settled.
+
+    The state saved next to the history is used while it matches the history on disk and
+    the configured benchmarks; days staged since the last report are settled with one
+    ^GSPC + benchmarks fetch covering just those days. Otherwise the state is rebuilt from
+    one full scan of the history and saved.
+    """
+    storage = storage or get_storage()
+    benchmarks = list(load_benchmarks())
+    state = RiskState.load(storage.read_risk_state())
+    if state is not None and state.benchmarks != benchmarks:
+        state = None
+    rebuilt = state is None
+    if state is None:
+        state = RiskState(benchmarks=benchmarks)
+        for date, equity in _total_equity_series(storage).items():
+            state.stage(date.date().isoformat(), equity)
+    if rebuilt or state.pending:
+        if state.pending:
+            closes = _market_closes(state.market_needed_from(), state.latest_date(), benchmarks)
+            state.settle(closes["^GSPC"], closes[benchmarks])
+        else:
+            state.settle()
+        storage.write_risk_state(state.to_dict())
+    return state
+
+def verify_risk_state(storage: StorageBackend | None = None) -> dict[str, tuple[Any, Any]]:
+    """Compare the incremental metrics with a full recomputation; returns the mismatches."""
+    storage = storage or get_storage()
+    state = risk_state(storage)
+    equity = _total_equity_series(storage).dropna()
+    equity = equity[~equity.index.duplicated(keep="last")]
+    if equity.empty:
+        return compare_metrics(state.metrics(), full_risk_metrics(equity, None, state.rf_annual))
+    closes = _market_closes(equity.index.min(), equity.index.max(), state.benchmarks)
+    diffs = compare_metrics(state.metrics(), full_risk_metrics(equity, closes["^GSPC"], state.rf_annual), rel_tol=1e-8)
+    expected = full_benchmark_metrics(equity, closes[state.benchmarks], state.rf_annual)
+    for name, fit in state.benchmark_metrics().iterrows():
+        for key, pair in compare_metrics(fit.to_dict(), expected.loc[name].to_dict(), rel_tol=1e-8).items():
+            diffs[f"{name} {key}"] = pair
+    return diffs
+
+@dataclass
+class PriceRow:
+    """One line of the price table (None where fewer than two sessions came back)."""
+    ticker: str
+    close: float | None = None
+    pct_change: float | None = None     # percent
+    volume: float | None = None
+
+
+@dataclass
+class CapmFit:
+    """Least-squares fit of the portfolio's daily excess returns on one benchmark's."""
+    benchmark: str
+    beta: float
+    alpha_annual: float
+    r2: float
+    tracking_error: float               # annualized
+    n_obs: int
+
+
+@dataclass
+class DailyReport:
+    """Everything daily_results shows, computed without printing or prompting."""
+    date: str
+    prices: list[PriceRow]
+    holdings: pd.DataFrame
+    cash: float
+    history_days: int = 0               # equity points recorded
+    n_days: int = 0                     # daily returns behind the ratios
+    final_equity: float = np.nan
+    max_drawdown: float = np.nan
+    mdd_date: str | None = None
+    sharpe_period: float = np.nan
+    sharpe_annual: float = np.nan
+    sortino_period: float = np.nan
+    sortino_annual: float = np.nan
+    rolling: dict[str, dict[str, float]] = field(default_factory=dict)    # metric -> window -> latest
+    capm: list[CapmFit] = field(default_factory=list)                       # ^GSPC first, then the benchmarks
+    market_start_close: float | None = None
+    market_last_close: float | None = None
+    starting_equity: float = np.nan
+
+    @property
+    def spx_value(self) -> float:
+        """`starting_equity` invested in the S&P 500 over the same window."""
+        if self.market_start_close is None or self.market_last_close is None or np.isnan(self.starting_equity):
+            return np.nan
+        return (self.starting_equity / self.market_start_close) * self.market_last_close
+
+    def to_dict(self) -> dict[str, Any]:
+        """Plain JSON types; NaN becomes None."""
+        data = {name: getattr(self, name) for name in self.__dataclass_fields__}
+        data["spx_value"] = self.spx_value
+        return _json_ready(data)
+
+    def to_json(self, **kwargs: Any) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+def _json_ready(value: Any) -> Any:
+    if isinstance(value, pd.DataFrame):
+        return _json_ready(value.to_dict(orient="records"))
+    if hasattr(value, "__dataclass_fields__"):
+        return _json_ready({name: getattr(value, name) for name in value.__dataclass_fields__})
+    if isinstance(value, dict):
+        return {str(k): _json_ready(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_ready(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def daily_report(
+    chatgpt_portfolio: pd.DataFrame,
+    cash: float,
+    starting_equity: float | None = None,
+    storage: StorageBackend | None = None,
+) -> DailyReport:
+    """
+    Price table, risk & return, CAPM and snapshot numbers for `chatgpt_portfolio`, as a
+    DailyReport. Nothing is printed or asked; pass `starting_equity` for the S&P 500
+    comparison and `storage` to report on a portfolio other than the configured one.
+    """
+    portfolio_dict: list[dict[Any, Any]] = chatgpt_portfolio.to_dict(orient="records")
+    start_d, end_d = _daily_price_window()
+
     benchmarks = load_benchmarks()  # reads tickers.json or returns defaults
     benchmark_entries = [{"ticker": t} for t in benchmarks]
 
+    try:
+        prices = download_price_data_many(
+            [str(stock["ticker"]) for stock in portfolio_dict + benchmark_entries],
+            start=start_d,
+            end=end_d,
+            progress=False,
+        )
+    except Exception as e:
+        raise Exception(f"Batched price download failed. {e} Try checking internet connection.")
+
+    rows: list[PriceRow] = []
     for stock in portfolio_dict + benchmark_entries:
         ticker = str(stock["ticker"]).upper()
         try:
-            fetch = download_price_data(ticker, start=start_d, end=(end_d + pd.Timedelta(days=1)), progress=False)
+            fetch = prices[ticker]
             data = fetch.df
             if data.empty or len(data) < 2:
-                rows.append([ticker, "—", "—", "—"])
+                rows.append(PriceRow(ticker))
                 continue
 
             price = float(data["Close"].iloc[-1])
@@ -876,203 +2682,135 @@ def daily_results(chatgpt_portfolio: pd.DataFrame, cash: float) -> None:
             volume = float(data["Volume"].iloc[-1])
 
             percent_change = ((price - last_price) / last_price) * 100
-            rows.append([ticker, f"{price:,.2f}", f"{percent_change:+.2f}%", f"{int(volume):,}"])
+            rows.append(PriceRow(ticker, price, percent_change, volume))
         except Exception as e:
             raise Exception(f"Download for {ticker} failed. {e} Try checking internet connection.")
 
-    # Read portfolio history
-    chatgpt_df = pd.read_csv(PORTFOLIO_CSV)
-
-    # Use only TOTAL rows, sorted by date
-    totals = chatgpt_df[chatgpt_df["Ticker"] == "TOTAL"].copy()
-    if totals.empty:
-        print("\n" + "=" * 64)
-        print(f"Daily Results — {today}")
-        print("=" * 64)
-        print("\n[ Price & Volume ]")
-        colw = [10, 12, 9, 15]
-        print(f"{header[0]:<{colw[0]}} {header[1]:>{colw[1]}} {header[2]:>{colw[2]}} {header[3]:>{colw[3]}}")
-        print("-" * sum(colw) + "-" * 3)
-        for r in rows:
-            print(f"{str(r[0]):<{colw[0]}} {str(r[1]):>{colw[1]}} {str(r[2]):>{colw[2]}} {str(r[3]):>{colw[3]}}")
-        print("\n[ Portfolio Snapshot ]")
-        print(chatgpt_portfolio)
-        print(f"Cash balance: ${cash:,.2f}")
-        return
-
-    totals["Date"] = pd.to_datetime(totals["Date"])  # tolerate ISO strings
-    totals = totals.sort_values("Date")
-
-    final_equity = float(totals.iloc[-1]["Total Equity"])
-    equity_series = totals.set_index("Date")["Total Equity"].astype(float).sort_index()
-
-    # --- Max Drawdown ---
-    running_max = equity_series.cummax()
-    drawdowns = (equity_series / running_max) - 1.0
-    max_drawdown = float(drawdowns.min())  # most negative value
-    mdd_date = drawdowns.idxmin()
-
-    # Daily simple returns (portfolio)
-    r = equity_series.pct_change().dropna()
-    n_days = len(r)
-    if n_days < 2:
-        print("\n" + "=" * 64)
-        print(f"Daily Results — {today}")
-        print("=" * 64)
-        print("\n[ Price & Volume ]")
-        colw = [10, 12, 9, 15]
-        print(f"{header[0]:<{colw[0]}} {header[1]:>{colw[1]}} {header[2]:>{colw[2]}} {header[3]:>{colw[3]}}")
-        print("-" * sum(colw) + "-" * 3)
-        for rrow in rows:
-            print(f"{str(rrow[0]):<{colw[0]}} {str(rrow[1]):>{colw[1]}} {str(rrow[2]):>{colw[2]}} {str(rrow[3]):>{colw[3]}}")
-        print("\n[ Portfolio Snapshot ]")
-        print(chatgpt_portfolio)
-        print(f"Cash balance: ${cash:,.2f}")
-        print(f"Latest ChatGPT Equity: ${final_equity:,.2f}")
-        if hasattr(mdd_date, "date") and not isinstance(mdd_date, (str, int)):
-            mdd_date_str = mdd_date.date()
-        elif hasattr(mdd_date, "strftime") and not isinstance(mdd_date, (str, int)):
-            mdd_date_str = mdd_date.strftime("%Y-%m-%d")
-        else:
-            mdd_date_str = str(mdd_date)
-        print(f"Maximum Drawdown: {max_drawdown:.2%} (on {mdd_date_str})")
-        return
-
-    # Risk-free config
-    rf_annual = 0.045
-    rf_daily = (1 + rf_annual) ** (1 / 252) - 1
-    rf_period = (1 + rf_daily) ** n_days - 1
-
-    # Stats
-    mean_daily = float(r.mean())
-    std_daily = float(r.std(ddof=1))
-
-    # Downside deviation (MAR = rf_daily)
-    downside = (r - rf_daily).clip(upper=0)
-    downside_std = float((downside.pow(2).mean()) ** 0.5) if not downside.empty else np.nan
-
-    # Total return over the window
-    r_numeric = pd.to_numeric(r, errors="coerce")
-    r_numeric = r_numeric[~r_numeric.isna()].astype(float)
-    # Filter out any non-finite values to ensure only valid floats are used
-    r_numeric = r_numeric[np.isfinite(r_numeric)]
-    # Only use numeric values for the calculation
-    if len(r_numeric) > 0:
-        arr = np.asarray(r_numeric.values, dtype=float)
-        period_return = float(np.prod(1 + arr) - 1) if arr.size > 0 else float('nan')
-    else:
-        period_return = float('nan')
-
-    # Sharpe / Sortino
-    sharpe_period = (period_return - rf_period) / (std_daily * np.sqrt(n_days)) if std_daily > 0 else np.nan
-    sharpe_annual = ((mean_daily - rf_daily) / std_daily) * np.sqrt(252) if std_daily > 0 else np.nan
-    sortino_period = (period_return - rf_period) / (downside_std * np.sqrt(n_days)) if downside_std and downside_std > 0 else np.nan
-    sortino_annual = ((mean_daily - rf_daily) / downside_std) * np.sqrt(252) if downside_std and downside_std > 0 else np.nan
-
-    # -------- CAPM: Beta & Alpha (vs ^GSPC) --------
-    start_date = equity_series.index.min() - pd.Timedelta(days=1)
-    end_date = equity_series.index.max() + pd.Timedelta(days=1)
-
-    spx_fetch = download_price_data("^GSPC", start=start_date, end=end_date, progress=False)
-    spx = spx_fetch.df
-
-    beta = np.nan
-    alpha_annual = np.nan
-    r2 = np.nan
-    n_obs = 0
-
-    if not spx.empty and len(spx) >= 2:
-        spx = spx.reset_index().set_index("Date").sort_index()
-        mkt_ret = spx["Close"].astype(float).pct_change().dropna()
-
-        # Align portfolio & market returns
-        common_idx = r.index.intersection(list(mkt_ret.index))
-        if len(common_idx) >= 2:
-            rp = (r.reindex(common_idx).astype(float) - rf_daily)   # portfolio excess
-            rm = (mkt_ret.reindex(common_idx).astype(float) - rf_daily)  # market excess
-
-            x = np.asarray(rm.values, dtype=float).ravel()
-            y = np.asarray(rp.values, dtype=float).ravel()
-
-            n_obs = x.size
-            rm_std = float(np.std(x, ddof=1)) if n_obs > 1 else 0.0
-            if rm_std > 0:
-                beta, alpha_daily = np.polyfit(x, y, 1)
-                alpha_annual = (1 + float(alpha_daily)) ** 252 - 1
-
-                corr = np.corrcoef(x, y)[0, 1]
-                r2 = float(corr ** 2)
-
-    # $X normalized S&P 500 over same window (asks user for initial equity)
-    spx_norm_fetch = download_price_data(
-        "^GSPC",
-        start=equity_series.index.min(),
-        end=equity_series.index.max() + pd.Timedelta(days=1),
-        progress=False,
-    )
-    spx_norm = spx_norm_fetch.df
-    spx_value = np.nan
-    starting_equity = np.nan  # Ensure starting_equity is always defined
-    if not spx_norm.empty:
-        initial_price = float(spx_norm["Close"].iloc[0])
-        price_now = float(spx_norm["Close"].iloc[-1])
-        try:
-            starting_equity = float(input("what was your starting equity? "))
-        except Exception:
-            print("Invalid input for starting equity. Defaulting to NaN.")
-        spx_value = (starting_equity / initial_price) * price_now if not np.isnan(starting_equity) else np.nan
+    report = DailyReport(check_weekend(), rows, chatgpt_portfolio, float(cash))
+    # Metrics come from the incremental state kept next to the history (O(1) per new day)
+    state = risk_state(storage)
+    report.history_days = state.days
+    if state.days == 0:
+        return report
+
+    metrics = state.metrics()
+    report.n_days = int(metrics["n_days"])
+    report.final_equity = float(metrics["final_equity"])
+    report.max_drawdown = float(metrics["max_drawdown"])
+    report.mdd_date = metrics["mdd_date"]
+    if report.n_days < 2:
+        return report
+
+    report.sharpe_period = metrics["sharpe_period"]
+    report.sharpe_annual = metrics["sharpe_annual"]
+    report.sortino_period = metrics["sortino_period"]
+    report.sortino_annual = metrics["sortino_annual"]
+
+    # Rolling windows over the recent days the risk state keeps (no history scan)
+    recent_equity, recent_market = state.recent_series()
+    rolling = rolling_summary(recent_equity, recent_market)
+    if rolling.notna().to_numpy().any():
+        report.rolling = {str(metric): {str(w): float(v) for w, v in values.items()} for metric, values in rolling.iterrows()}
+
+    # -------- CAPM: Beta & Alpha (vs ^GSPC and every benchmark) --------
+    report.capm = [
+        CapmFit(str(name), float(fit["beta"]), float(fit["alpha_annual"]), float(fit["r2"]),
+                float(fit["tracking_error"]), int(fit["n_obs"]))
+        for name, fit in state.benchmark_metrics(include_market=True).iterrows()
+    ]
+
+    report.market_start_close = metrics["market_start_close"]
+    report.market_last_close = metrics["market_last_close"]
+    if starting_equity is not None:
+        report.starting_equity = float(starting_equity)
+    return report
+
+
+def render_daily_report(report: DailyReport) -> None:
+    """Print a DailyReport in the daily_results layout."""
+    header = ["Ticker", "Close", "% Chg", "Volume"]
+    colw = [10, 12, 9, 15]
 
-    # -------- Pretty Printing --------
     print("\n" + "=" * 64)
-    print(f"Daily Results — {today}")
+    print(f"Daily Results — {report.date}")
     print("=" * 64)
 
     # Price & Volume table
     print("\n[ Price & Volume ]")
-    colw = [10, 12, 9, 15]
     print(f"{header[0]:<{colw[0]}} {header[1]:>{colw[1]}} {header[2]:>{colw[2]}} {header[3]:>{colw[3]}}")
     print("-" * sum(colw) + "-" * 3)
-    for rrow in rows:
-        print(f"{str(rrow[0]):<{colw[0]}} {str(rrow[1]):>{colw[1]}} {str(rrow[2]):>{colw[2]}} {str(rrow[3]):>{colw[3]}}")
+    for row in report.prices:
+        if row.close is None:
+            cells = [row.ticker, "—", "—", "—"]
+        else:
+            volume = f"{int(row.volume):,}" if row.volume is not None and np.isfinite(row.volume) else "—"
+            cells = [row.ticker, f"{row.close:,.2f}", f"{row.pct_change:+.2f}%", volume]
+        print(f"{cells[0]:<{colw[0]}} {cells[1]:>{colw[1]}} {cells[2]:>{colw[2]}} {cells[3]:>{colw[3]}}")
+
+    if report.n_days < 2:
+        print("\n[ Portfolio Snapshot ]")
+        print(report.holdings)
+        print(f"Cash balance: ${report.cash:,.2f}")
+        if report.history_days:
+            print(f"Latest ChatGPT Equity: ${report.final_equity:,.2f}")
+            print(f"Maximum Drawdown: {report.max_drawdown:.2%} (on {report.mdd_date})")
+        return
 
     # Performance metrics
     def fmt_or_na(x: float | int | None, fmt: str) -> str:
         return (fmt.format(x) if not (x is None or (isinstance(x, float) and np.isnan(x))) else "N/A")
 
     print("\n[ Risk & Return ]")
-    if hasattr(mdd_date, "date") and not isinstance(mdd_date, (str, int)):
-        mdd_date_str = mdd_date.date()
-    elif hasattr(mdd_date, "strftime") and not isinstance(mdd_date, (str, int)):
-        mdd_date_str = mdd_date.strftime("%Y-%m-%d")
-    else:
-        mdd_date_str = str(mdd_date)
-    print(f"{'Max Drawdown:':32} {fmt_or_na(max_drawdown, '{:.2%}'):>15}   on {mdd_date_str}")
-    print(f"{'Sharpe Ratio (period):':32} {fmt_or_na(sharpe_period, '{:.4f}'):>15}")
-    print(f"{'Sharpe Ratio (annualized):':32} {fmt_or_na(sharpe_annual, '{:.4f}'):>15}")
-    print(f"{'Sortino Ratio (period):':32} {fmt_or_na(sortino_period, '{:.4f}'):>15}")
-    print(f"{'Sortino Ratio (annualized):':32} {fmt_or_na(sortino_annual, '{:.4f}'):>15}")
+    print(f"{'Max Drawdown:':32} {fmt_or_na(report.max_drawdown, '{:.2%}'):>15}   on {report.mdd_date}")
+    print(f"{'Sharpe Ratio (period):':32} {fmt_or_na(report.sharpe_period, '{:.4f}'):>15}")
+    print(f"{'Sharpe Ratio (annualized):':32} {fmt_or_na(report.sharpe_annual, '{:.4f}'):>15}")
+    print(f"{'Sortino Ratio (period):':32} {fmt_or_na(report.sortino_period, '{:.4f}'):>15}")
+    print(f"{'Sortino Ratio (annualized):':32} {fmt_or_na(report.sortino_annual, '{:.4f}'):>15}")
+
+    if report.rolling:
+        labels = {
+            "volatility": ("Volatility (annualized):", "{:.2%}"),
+            "sharpe": ("Sharpe Ratio (annualized):", "{:.4f}"),
+            "sortino": ("Sortino Ratio (annualized):", "{:.4f}"),
+            "beta": ("Beta (daily) vs ^GSPC:", "{:.4f}"),
+            "alpha": ("Alpha (annualized) vs ^GSPC:", "{:.2%}"),
+            "drawdown": ("Drawdown from window high:", "{:.2%}"),
+        }
+        windows = next(iter(report.rolling.values())).keys()
+        print("\n[ Rolling Windows (sessions) ]")
+        print(f"{'':32} " + " ".join(f"{str(w):>10}" for w in windows))
+        for metric, values in report.rolling.items():
+            label, fmt = labels[metric]
+            print(f"{label:32} " + " ".join(f"{fmt_or_na(v, fmt):>10}" for v in values.values()))
 
     print("\n[ CAPM vs Benchmarks ]")
-    if not np.isnan(beta):
-        print(f"{'Beta (daily) vs ^GSPC:':32} {beta:>15.4f}")
-        print(f"{'Alpha (annualized) vs ^GSPC:':32} {alpha_annual:>15.2%}")
-        print(f"{'R² (fit quality):':32} {r2:>15.3f}   {'Obs:':>6} {n_obs}")
-        if n_obs < 60 or (not np.isnan(r2) and r2 < 0.20):
+    market = report.capm[0] if report.capm else None
+    if market is not None and not np.isnan(market.beta):
+        print(f"{'Beta (daily) vs ^GSPC:':32} {market.beta:>15.4f}")
+        print(f"{'Alpha (annualized) vs ^GSPC:':32} {market.alpha_annual:>15.2%}")
+        print(f"{'R² (fit quality):':32} {market.r2:>15.3f}   {'Obs:':>6} {market.n_obs}")
+        if market.n_obs < 60 or (not np.isnan(market.r2) and market.r2 < 0.20):
             print("  Note: Short sample and/or low R² — alpha/beta may be unstable.")
     else:
         print("Beta/Alpha: insufficient overlapping data.")
+    fits = [fit for fit in report.capm[1:] if fit.n_obs > 0]
+    if fits:
+        print(f"\n{'Benchmark':<10} {'Beta':>8} {'Alpha (ann.)':>13} {'R²':>7} {'Track. Err.':>12} {'Obs':>6}")
+        for fit in fits:
+            print(
+                f"{fit.benchmark:<10} {fmt_or_na(fit.beta, '{:.4f}'):>8} {fmt_or_na(fit.alpha_annual, '{:.2%}'):>13} "
+                f"{fmt_or_na(fit.r2, '{:.3f}'):>7} {fmt_or_na(fit.tracking_error, '{:.2%}'):>12} {fit.n_obs:>6}"
+            )
 
     print("\n[ Snapshot ]")
-    print(f"{'Latest ChatGPT Equity:':32} ${final_equity:>14,.2f}")
+    print(f"{'Latest ChatGPT Equity:':32} ${report.final_equity:>14,.2f}")
+    spx_value = report.spx_value
     if not np.isnan(spx_value):
-        try:
-            print(f"{f'${starting_equity} in S&P 500 (same window):':32} ${spx_value:>14,.2f}")
-        except Exception:
-            pass
-    print(f"{'Cash Balance:':32} ${cash:>14,.2f}")
+        print(f"{f'${report.starting_equity} in S&P 500 (same window):':32} ${spx_value:>14,.2f}")
+    print(f"{'Cash Balance:':32} ${report.cash:>14,.2f}")
 
     print("\n[ Holdings ]")
-    print(chatgpt_portfolio)
+    print(report.holdings)
 
     print("\n[ Your Instructions ]")
     print(
@@ -1085,26 +2823,29 @@ def daily_results(chatgpt_portfolio: pd.DataFrame, cash: float) -> None:
     )
 
 
+def daily_results(chatgpt_portfolio: pd.DataFrame, cash: float, starting_equity: float | None = None) -> None:
+    """
+    Print daily price updates and performance metrics (incl. CAPM). Without
+    `starting_equity` the S&P 500 comparison asks for it.
+    """
+    report = daily_report(chatgpt_portfolio, cash, starting_equity)
+    if starting_equity is None and report.n_days >= 2 and report.market_start_close is not None and report.market_last_close is not None:
+        try:
+            report.starting_equity = float(input("what was your starting equity? "))
+        except Exception:
+            print("Invalid input for starting equity. Defaulting to NaN.")
+    render_daily_report(report)
+
+
 # ------------------------------
 # Orchestration
 # ------------------------------
 
-def load_latest_portfolio_state(
-    file: str,
-) -> tuple[pd.DataFrame | list[dict[str, Any]], float]:
-    """Load the most recent portfolio snapshot and cash balance."""
-    df = pd.read_csv(file)
-    if df.empty:
-        portfolio = pd.DataFrame(columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"])
-        print("Portfolio CSV is empty. Returning set amount of cash for creating portfolio.")
-        try:
-            cash = float(input("What would you like your starting cash amount to be? "))
-        except ValueError:
-            raise ValueError(
-                "Cash could not be converted to float datatype. Please enter a valid number."
-            )
-        return portfolio, cash
+_STATE_NUMERIC_COLUMNS = ["shares", "buy_price", "cost_basis", "stop_loss"]
 
+
+def _latest_state(df: pd.DataFrame) -> tuple[list[dict[str, Any]], float, str]:
+    """Holdings on the latest non-TOTAL date, the latest TOTAL cash balance, and that date."""
     non_total = df[df["Ticker"] != "TOTAL"].copy()
     non_total["Date"] = pd.to_datetime(non_total["Date"])
 
@@ -1135,24 +2876,130 @@ def load_latest_portfolio_state(
         },
         inplace=True,
     )
-    latest_tickers = latest_tickers.reset_index(drop=True).to_dict(orient="records")
+    for col in _STATE_NUMERIC_COLUMNS:
+        if col in latest_tickers:
+            latest_tickers[col] = pd.to_numeric(latest_tickers[col], errors="coerce")
+    records = [
+        {k: (v.item() if isinstance(v, np.generic) else v) for k, v in row.items()}
+        for row in latest_tickers.reset_index(drop=True).to_dict(orient="records")
+    ]
 
     df_total = df[df["Ticker"] == "TOTAL"].copy()
     df_total["Date"] = pd.to_datetime(df_total["Date"])
     latest = df_total.sort_values("Date").iloc[-1]
     cash = float(latest["Cash Balance"])
+    as_of = max(latest_date, latest["Date"]) if pd.notna(latest_date) else latest["Date"]
+    return records, cash, as_of.date().isoformat()
+
+
+def commit_portfolio_day(date: str, rows: pd.DataFrame, storage: StorageBackend | None = None) -> None:
+    """
+    Replace `date`'s rows in the history and refresh the latest-state checkpoint and the
+    risk-metrics state.
+
+    Both are carried forward from `rows` only while they were valid before the write and
+    `date` is not older than them; otherwise they are dropped and rebuilt from one full
+    scan the next time they are needed.
+    """
+    storage = storage or get_storage()
+    prior = storage.read_checkpoint()
+    prior_risk = storage.read_risk_state()
+    storage.replace_history_day(date, rows)
+    has_holdings = bool((rows["Ticker"] != "TOTAL").any())
+    if prior is not None and has_holdings and str(date) >= str(prior.get("as_of", "")):
+        holdings, cash, _ = _latest_state(rows)
+        storage.write_checkpoint({"as_of": str(date), "cash": cash, "holdings": holdings})
+    else:
+        storage.drop_checkpoint()
+
+    # Stage the day's equity for the risk metrics; settled by risk_state() at report time
+    total = rows.loc[rows["Ticker"] == "TOTAL", "Total Equity"]
+    equity = pd.to_numeric(total, errors="coerce").iloc[-1] if not total.empty else np.nan
+    state = RiskState.load(prior_risk)
+    if state is not None and state.stage(str(date), float(equity)):
+        storage.write_risk_state(state.to_dict())
+    else:
+        storage.drop_risk_state()
+
+
+class LedgerMismatchError(ValueError):
+    """The portfolio history and the position ledger disagree about holdings or cash."""
+
+
+def load_latest_portfolio_state(
+    file: str,
+    rebase_ledger: bool = False,
+) -> tuple[pd.DataFrame | list[dict[str, Any]], float]:
+    """
+    Load the most recent portfolio snapshot and cash balance.
+
+    Reads the checkpoint kept next to the history when it matches the history on disk, so
+    the cost does not grow with the number of days recorded; otherwise scans the full
+    history once and saves a fresh checkpoint.
+
+    The result is checked against the position ledger. When they disagree (the CSV was
+    edited by hand, or the ledger was written by something else) LedgerMismatchError is
+    raised, unless `rebase_ledger` is set: the ledger then records the history's holdings
+    as a new OPEN event.
+    """
+    ledger = get_ledger(file)
+    state = None if ledger.is_empty() else ledger.latest()
+
+    storage = get_storage(file)
+    checkpoint = storage.read_checkpoint()
+    if checkpoint is not None:
+        latest_tickers, cash, as_of = list(checkpoint["holdings"]), float(checkpoint["cash"]), checkpoint["as_of"]
+    else:
+        df = storage.read_history()
+        if df.empty:
+            if state is not None:
+                return state.to_frame(), state.cash
+            portfolio = pd.DataFrame(columns=["ticker", "shares", "stop_loss", "buy_price", "cost_basis"])
+            print("Portfolio CSV is empty. Returning set amount of cash for creating portfolio.")
+            try:
+                cash = float(input("What would you like your starting cash amount to be? "))
+            except ValueError:
+                raise ValueError(
+                    "Cash could not be converted to float datatype. Please enter a valid number."
+                )
+            return portfolio, cash
+        latest_tickers, cash, as_of = _latest_state(df)
+        storage.write_checkpoint({"as_of": as_of, "cash": cash, "holdings": latest_tickers})
+
+    if state is not None:
+        diffs = state_differences(state, portfolio_positions(latest_tickers), cash)
+        if diffs and not rebase_ledger:
+            raise LedgerMismatchError(
+                f"Portfolio history {file} disagrees with ledger {ledger.path}: {'; '.join(diffs)}. "
+                "Fix the CSV, or re-run with --rebase-ledger to record the history's holdings in the ledger."
+            )
+        if diffs:
+            ledger.rebase(latest_tickers, cash, str(as_of))
+            logger.warning("Re-based ledger %s on the portfolio history: %s", ledger.path, "; ".join(diffs))
     return latest_tickers, cash
 
 
-def main(file: str, data_dir: Path | None = None) -> None:
-    """Check versions, then run the trading script."""
-    chatgpt_portfolio, cash = load_latest_portfolio_state(file)
+def main(
+    file: str,
+    data_dir: Path | None = None,
+    orders: list[Order] | None = None,
+    starting_equity: float | None = None,
+    rebase_ledger: bool = False,
+) -> None:
+    """
+    Check versions, then run the trading script (non-interactively when `orders` and
+    `starting_equity` are given).
+    """
+    chatgpt_portfolio, cash = load_latest_portfolio_state(file, rebase_ledger)
     print(file)
     if data_dir is not None:
         set_data_dir(data_dir)
 
-    chatgpt_portfolio, cash = process_portfolio(chatgpt_portfolio, cash)
-    daily_results(chatgpt_portfolio, cash)
+    # Gather every price need of the run up front so each ticker is fetched once
+    plan = plan_run_fetches(chatgpt_portfolio, orders=orders)
+    with use_fetch_plan(plan), trade_log_batch():
+        chatgpt_portfolio, cash = process_portfolio(chatgpt_portfolio, cash, orders=orders)
+        daily_results(chatgpt_portfolio, cash, starting_equity)
 
 
 if __name__ == "__main__":
@@ -1165,12 +3012,25 @@ if __name__ == "__main__":
     parser.add_argument("--file", default=str(csv_path), help="Path to chatgpt_portfolio_update.csv")
     parser.add_argument("--data-dir", default=None, help="Optional data directory")
     parser.add_argument("--asof", default=None, help="Treat this YYYY-MM-DD as 'today' (e.g., 2025-08-27)")
+    parser.add_argument("--storage", default=None, choices=["csv", "parquet", "auto"], help="History/trade-log storage backend")
+    parser.add_argument("--record-fixtures", default=None, metavar="DIR", help="Record all fetched market data into DIR")
+    parser.add_argument("--replay-fixtures", default=None, metavar="DIR", help="Serve all market data from DIR (no network)")
+    parser.add_argument("--orders", default=None, metavar="JSON", help="Execute the orders in this file instead of prompting")
+    parser.add_argument("--starting-equity", type=float, default=None, help="Starting equity for the S&P 500 comparison (otherwise asked)")
+    parser.add_argument("--rebase-ledger", action="store_true", help="Accept the portfolio CSV when it disagrees with the position ledger")
     args = parser.parse_args()
 
     if args.asof:
         set_asof(args.asof)
+    if args.storage:
+        set_storage_backend(args.storage)
+    if args.record_fixtures:
+        set_market_data_mode("record", args.record_fixtures)
+    elif args.replay_fixtures:
+        set_market_data_mode("replay", args.replay_fixtures)
 
     if not Path(args.file).exists():
         print("No portfolio CSV found. Create one or run main() with your file path.")
     else:
-        main(args.file, Path(args.data_dir) if args.data_dir else None)
+        orders = load_orders(args.orders) if args.orders else None
+        main(args.file, Path(args.data_dir) if args.data_dir else None, orders, args.starting_equity, args.rebase_ledger)